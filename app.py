@@ -1,26 +1,33 @@
 #app.py
-import os, sqlite3, yaml, json
+import os, sqlite3, json, threading
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
+# Core modules are cheap to import (heavy resources load lazily); the import
+# time of each one is still recorded for the /startup report.
+from core.startup import time_imports, timed_resource, warmup, startup_report
+time_imports([
+    "core.schema", "core.lexicon", "core.tone", "core.safety", "core.risk",
+    "core.retriever", "core.composer", "core.persistent_memory", "core.pipeline",
+])
+
 from core.schema import ChatRequest, ChatResponse, Citation, RiskDetails, ToneAnalysis
-from core.risk import classify_tier_with_confidence  # UPDATED: use confidence version
-from core.tone import empathy_level
-from core.retriever import search
-from core.composer import compose
-from core.safety import should_abstain, abstention_reply, red_flag
-
-# --- LangChain memory for multi-turn context ---
-from langchain_openai import ChatOpenAI
-try:
-    from langchain.memory import ConversationSummaryBufferMemory
-except ImportError:
-    try:
-        from langchain_community.memory import ConversationSummaryBufferMemory
-    except ImportError:
-        print("Warning: Could not import ConversationSummaryBufferMemory, using simple memory")
-        ConversationSummaryBufferMemory = None
+from core.risk import moderation_cache_stats
+from core.risk_state import risk_state_stats
+from core.risk_patterns import PatternPackError, pack_info, current_name, activate as activate_pattern_pack
+from core.retriever import (
+    embed_cache_stats,
+    embed_batch_stats,
+    reload as reload_index,
+    index_info,
+    start_index_watcher,
+)
+from core.pipeline import ChatContext, pipeline_stats
+from core.response_cache import response_cache_stats
+from core.safety import should_abstain, abstention_reply
 
 # ===== extra imports for HITL review console =====
 from fastapi import HTTPException, Query
@@ -30,29 +37,40 @@ import csv, io
 
 from core.persistent_memory import (
     save_chat_turn,
-    load_context_for_compose,
     get_conversation_history,
     get_user_conversation_stats,
 )
 
 load_dotenv()
-app = FastAPI(title="Safe Mental Health Copilot (Exam Anxiety)")
+
+# WARMUP=0 skips eager loading (resources then load on the first request)
+WARMUP = os.getenv("WARMUP", "1") != "0"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP:
+        warmup()
+    start_index_watcher()  # polls CURRENT every INDEX_WATCH_SECS (0 disables)
+    yield
+
+
+app = FastAPI(title="Safe Mental Health Copilot (Exam Anxiety)", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
 )
 
-SOURCES = {
-    s["id"]: s["url"]
-    for s in yaml.safe_load(open("data/sources.yaml", "r", encoding="utf-8"))
-}
-
 
 def source_tag(source_id: str) -> str:
     return source_id.split("_", 1)[0].upper()
 
 
-SOURCE_TAGS = {sid: source_tag(sid) for sid in SOURCES.keys()}
-SOURCE_TAGS = sorted(set(SOURCE_TAGS.values()))
+@lru_cache(maxsize=1)
+def get_source_tags() -> list:
+    import yaml
+    with open("data/sources.yaml", "r", encoding="utf-8") as f:
+        sources = {s["id"]: s["url"] for s in yaml.safe_load(f)}
+    return sorted({source_tag(sid) for sid in sources.keys()})
 
 DB_PATH = "storage/audit_log.sqlite"
 
@@ -78,6 +96,8 @@ def init_db():
         con.execute("ALTER TABLE chats ADD COLUMN reviewed INTEGER DEFAULT 0;")
     if "label" not in cols:
         con.execute("ALTER TABLE chats ADD COLUMN label TEXT;")
+    if "crisis" not in cols:
+        con.execute("ALTER TABLE chats ADD COLUMN crisis INTEGER;")
     if "rating_empathy" not in cols:
         con.execute("ALTER TABLE chats ADD COLUMN rating_empathy INTEGER;")
     if "rating_factual" not in cols:
@@ -186,18 +206,44 @@ class SimpleMemory:
         self.history.append(f"Assistant: {outputs.get('output', '')}")
 
 
-_LLM = (
-    ChatOpenAI(model="gpt-4o-mini", temperature=0) if ConversationSummaryBufferMemory else None
-)
+# --- LangChain memory for multi-turn context (imported on first use) ---
+_LLM = None
+_SUMMARY_MEMORY_CLS = None
+_LANGCHAIN_LOADED = False
+_LANGCHAIN_LOCK = threading.Lock()
 _MEMORY: dict[str, any] = {}
 
 
+def _langchain():
+    """(ConversationSummaryBufferMemory or None, ChatOpenAI or None)"""
+    global _LLM, _SUMMARY_MEMORY_CLS, _LANGCHAIN_LOADED
+    if not _LANGCHAIN_LOADED:
+        with _LANGCHAIN_LOCK:
+            if not _LANGCHAIN_LOADED:
+                with timed_resource("app.langchain_memory"):
+                    try:
+                        from langchain.memory import ConversationSummaryBufferMemory
+                    except ImportError:
+                        try:
+                            from langchain_community.memory import ConversationSummaryBufferMemory
+                        except ImportError:
+                            print("Warning: Could not import ConversationSummaryBufferMemory, using simple memory")
+                            ConversationSummaryBufferMemory = None
+                    if ConversationSummaryBufferMemory:
+                        from langchain_openai import ChatOpenAI
+                        _LLM = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+                    _SUMMARY_MEMORY_CLS = ConversationSummaryBufferMemory
+                _LANGCHAIN_LOADED = True
+    return _SUMMARY_MEMORY_CLS, _LLM
+
+
 def get_memory(user_id: str):
     mem = _MEMORY.get(user_id)
     if mem is None:
-        if ConversationSummaryBufferMemory and _LLM:
+        ConversationSummaryBufferMemory, llm = _langchain()
+        if ConversationSummaryBufferMemory and llm:
             mem = ConversationSummaryBufferMemory(
-                llm=_LLM,
+                llm=llm,
                 max_token_limit=1200,
                 memory_key="chat_history",
                 return_messages=False,
@@ -219,197 +265,89 @@ def save_turn(user_id: str, user_msg: str, assistant_msg: str):
     mem.save_context({"input": user_msg}, {"output": assistant_msg})
 
 
-# -------- Main endpoint WITH CONFIDENCE SCORING --------
-@app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    # 1) Load conversation context
-    context_text = load_context_for_compose(req.user_id, format_type="full")
-
-    # 2) Risk classification WITH CONFIDENCE
-    tier, confidence, details = classify_tier_with_confidence(req.message)
-    risk_details = RiskDetails(**details)
-
-    from core.tone import analyze_tone_and_cues, build_tone_block
-
-    tone_analysis_dict = analyze_tone_and_cues(req.message)
-    tone_block_text = build_tone_block(tone_analysis_dict)
-
-    # Create ToneAnalysis object
-    tone_analysis = ToneAnalysis(
-        empathy_level=tone_analysis_dict["empathy_level"],
-        cues=tone_analysis_dict["cues"],
-        template=tone_analysis_dict["template"],
-        tone_block=tone_block_text,
-    )
-
-    # 3) Early abstention for crisis (no retrieval → had_evidence=None)
-    if should_abstain(tier, had_evidence=True):
-        if tier == 3:
-            reply = abstention_reply(tier)
-            save_chat(
-                req.user_id,
-                tier,
-                True,
-                req.message,
-                reply,
-                "[]",
-                confidence=confidence,
-                risk_details=details,
-                had_evidence=None,
-            )
-            assistant_metadata = {
-                "tier": tier,
-                "confidence": confidence,
-                "citations": [],
-                "tone_analysis": {
-                    "empathy_level": tone_analysis_dict["empathy_level"],
-                    "template": tone_analysis_dict["template"],
-                    "cues": tone_analysis_dict["cues"],
-                },
-                "risk_details": details,
-            }
-            save_chat_turn(
-                req.user_id, req.message, reply, assistant_metadata=assistant_metadata
-            )
-
-            return ChatResponse(
-                text=reply,
-                citations=[],
-                tier=tier,
-                abstained=True,
-                confidence=confidence,
-                risk_details=risk_details,
-                tone_analysis=tone_analysis,
-            )
-
-    # 4) Retrieval
-    hits = search(req.message, k=4)
-    had_evidence = len(hits) > 0
-    if should_abstain(tier, had_evidence):
-        reply = abstention_reply(tier)
-        save_chat(
-            req.user_id,
-            tier,
-            True,
-            req.message,
-            reply,
-            "[]",
-            confidence=confidence,
-            risk_details=details,
-            had_evidence=had_evidence,
-        )
-        assistant_metadata = {
-            "tier": tier,
-            "confidence": confidence,
-            "citations": [],
-            "tone_analysis": {
-                "empathy_level": tone_analysis_dict["empathy_level"],
-                "template": tone_analysis_dict["template"],
-                "cues": tone_analysis_dict["cues"],
-            },
-            "risk_details": details,
-        }
-        save_chat_turn(
-            req.user_id, req.message, reply, assistant_metadata=assistant_metadata
-        )
-        return ChatResponse(
-            text=reply,
-            citations=[],
-            tier=tier,
-            abstained=True,
-            confidence=confidence,
-            risk_details=risk_details,
-            tone_analysis=tone_analysis,
-        )
-
-    # 5) Compose with CONTEXT
-    text, tags = compose(
-        req.message,
-        hits,
-        empathy_level(req.message),
-        tier,
-        context_text=context_text,
-        allowed_tags=SOURCE_TAGS,
-    )
-
-    # 6) Post-generation safety (retrieval already happened → had_evidence=True)
-    if red_flag(text):
-        reply = abstention_reply(3)
-        save_chat(
-            req.user_id,
-            3,
-            True,
-            req.message,
-            reply,
-            "[]",
-            confidence=confidence,
-            risk_details=details,
-            had_evidence=True,
-        )
-        assistant_metadata = {
-            "tier": 3,
-            "confidence": confidence,
-            "citations": [],
-            "tone_analysis": {
-                "empathy_level": tone_analysis_dict["empathy_level"],
-                "template": tone_analysis_dict["template"],
-                "cues": tone_analysis_dict["cues"],
-            },
-            "risk_details": details,
-        }
-        save_chat_turn(
-            req.user_id, req.message, reply, assistant_metadata=assistant_metadata
-        )
-        return ChatResponse(
-            text=reply,
-            citations=[],
-            tier=3,
-            abstained=True,
-            confidence=confidence,
-            risk_details=risk_details,
-            tone_analysis=tone_analysis,
-        )
-
-    # 7) Render citations
-    citations = []
-    for tag, url in tags:
-        citations.append(Citation(source_id=tag.strip("[]"), url=url))
-
-    # 8) Save logs + update memory (normal reply, retrieval done → had_evidence=True)
+def _chat_response(ctx: ChatContext, tier: int, text: str, abstained: bool, had_evidence,
+                   citations: list = (), **metadata) -> ChatResponse:
+    """Log the turn (audit log + conversation memory) and build the response."""
+    citations = list(citations)
+    _, confidence, details = ctx.risk
     save_chat(
-        req.user_id,
+        ctx.user_id,
         tier,
-        False,
-        req.message,
+        abstained,
+        ctx.message,
         text,
         str(citations),
         confidence=confidence,
         risk_details=details,
-        had_evidence=True,
+        had_evidence=had_evidence,
+    )
+    assistant_metadata = ctx.metadata(
+        tier, [{"source_id": c.source_id, "url": c.url} for c in citations], **metadata
     )
-    assistant_metadata = {
-        "tier": tier,
-        "confidence": confidence,
-        "citations": [{"source_id": c.source_id, "url": c.url} for c in citations],
-        "tone_analysis": {
-            "empathy_level": tone_analysis_dict["empathy_level"],
-            "template": tone_analysis_dict["template"],
-            "cues": tone_analysis_dict["cues"],
-        },
-        "risk_details": details,
-    }
     save_chat_turn(
-        req.user_id, req.message, text, assistant_metadata=assistant_metadata
+        ctx.user_id, ctx.message, text, assistant_metadata=assistant_metadata
     )
-
+    tone = ctx.tone
     return ChatResponse(
         text=text,
         citations=citations,
         tier=tier,
-        abstained=False,
+        abstained=abstained,
         confidence=confidence,
-        risk_details=risk_details,
-        tone_analysis=tone_analysis,
+        risk_details=RiskDetails(**details),
+        tone_analysis=ToneAnalysis(
+            empathy_level=tone["empathy_level"],
+            cues=tone["cues"],
+            template=tone["template"],
+            tone_block=tone["tone_block"],
+        ),
+    )
+
+
+# -------- Main endpoint WITH CONFIDENCE SCORING --------
+@app.post("/chat", response_model=ChatResponse)
+def chat(req: ChatRequest):
+    # 1) Start the moderation call and speculative retrieval first; the
+    #    stages up to the risk decision (tone, context) overlap with them.
+    #    Each stage runs once and is timed (core/pipeline.py).
+    ctx = ChatContext(req.user_id, req.message, allowed_tags=get_source_tags()).start()
+    ctx.context
+
+    # 2) Risk classification WITH CONFIDENCE (waits at most MODERATION_TIMEOUT
+    #    from the start of the request for the moderation result), raised by
+    #    the user's rolling risk state
+    tier = ctx.risk[0]
+
+    # 3) Early abstention for crisis (retrieval result unused → had_evidence=None)
+    if should_abstain(tier, had_evidence=True):
+        if tier == 3:
+            ctx.cancel_retrieval()
+            return _chat_response(ctx, tier, abstention_reply(tier), True, had_evidence=None)
+
+    # 4) Retrieval (started above)
+    # hits below the similarity floor are already dropped, so an empty list
+    # means off-topic / unsupported: abstain without paying for the LLM
+    had_evidence = len(ctx.hits) > 0
+    if should_abstain(tier, had_evidence):
+        return _chat_response(ctx, tier, abstention_reply(tier), True, had_evidence=had_evidence)
+
+    # 5) Compose with CONTEXT (or reuse a cached tier-1 reply)
+    text, tags, cached = ctx.reply
+
+    # 6) Post-generation safety (retrieval already happened → had_evidence=True)
+    if not ctx.safe:
+        return _chat_response(ctx, 3, abstention_reply(3), True, had_evidence=True)
+
+    # only replies that passed the safety check are cached
+    ctx.cache_reply()
+
+    # 7) Render citations
+    citations = [Citation(source_id=tag.strip("[]"), url=url) for tag, url in tags]
+
+    # 8) Save logs + update memory (normal reply, retrieval done → had_evidence=True)
+    return _chat_response(
+        ctx, tier, text, False, had_evidence=True, citations=citations,
+        response_cache=({"hit": True, "similarity": round(cached["similarity"], 4)} if cached else None),
     )
 
 
@@ -502,6 +440,9 @@ def update_review(chat_id: int, upd: ReviewUpdate):
     if upd.label is not None:
         fields.append("label = ?")
         args.append(upd.label)
+    if upd.crisis is not None:
+        fields.append("crisis = ?")
+        args.append(1 if upd.crisis else 0)
     if upd.rating_empathy is not None:
         fields.append("rating_empathy = ?")
         args.append(int(upd.rating_empathy))
@@ -549,6 +490,9 @@ def metrics():
         "label_hallucination": one(
             "SELECT COUNT(*) FROM chats WHERE label='hallucination'"
         ),
+        # reviewer's crisis judgment (training data for the local moderation model)
+        "crisis_yes": one("SELECT COUNT(*) FROM chats WHERE crisis=1"),
+        "crisis_no": one("SELECT COUNT(*) FROM chats WHERE crisis=0"),
         "avg_empathy": one(
             "SELECT AVG(rating_empathy) FROM chats WHERE rating_empathy IS NOT NULL"
         ),
@@ -601,6 +545,76 @@ def metrics():
     return m
 
 
+# ======================================================
+#             ADMIN
+# ======================================================
+
+
+@app.get("/admin/index")
+def admin_index_info():
+    """Index version loaded by this worker vs. the published one."""
+    return index_info()
+
+
+@app.post("/admin/reload-index")
+def admin_reload_index(force: bool = False):
+    """
+    Hot-swap this worker to the version in storage/index/CURRENT without a
+    restart. Other workers pick it up within INDEX_WATCH_SECS.
+    """
+    try:
+        return reload_index(force=force)
+    except Exception as e:
+        raise HTTPException(500, f"Index reload failed, old version still live: {e!r}")
+
+
+@app.get("/admin/risk-patterns")
+def admin_risk_patterns():
+    """Risk pattern pack used by this worker, the one in CURRENT, and the packs on disk."""
+    return pack_info()
+
+
+@app.post("/admin/risk-patterns/reload")
+def admin_reload_risk_patterns(pack: str | None = None):
+    """
+    Validate and compile a pack from data/risk_patterns/ (default: CURRENT),
+    swap it in atomically and record it in CURRENT for the other workers.
+    """
+    try:
+        return activate_pattern_pack(pack or current_name())
+    except PatternPackError as e:
+        raise HTTPException(400, f"Pattern pack rejected, old pack still live: {e}")
+
+
+@app.get("/startup")
+def startup_timings():
+    """Import time per core module and load time per lazily created resource."""
+    return startup_report()
+
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    """Hit/miss/eviction counters for the in-process and persistent caches."""
+    return {
+        "embeddings": embed_cache_stats(),
+        "responses": response_cache_stats(),
+        "moderation": moderation_cache_stats(),
+        "risk_state": risk_state_stats(),
+    }
+
+
+@app.get("/metrics/batching")
+def batching_metrics():
+    """Batch-size histogram for coalesced embeddings calls."""
+    return {"embeddings": embed_batch_stats()}
+
+
+@app.get("/metrics/pipeline")
+def pipeline_metrics():
+    """Per-stage /chat timings (count, mean, p50/p95/max ms over recent requests)."""
+    return pipeline_stats()
+
+
 @app.get("/export/reviews.csv")
 def export_reviews_csv(status: str = Query("all", pattern="^(pending|all)$")):
     """Download chats as CSV for offline review."""
@@ -0,0 +1,223 @@
+#core/ann.py
+
+"""
+FAISS index construction shared by scripts/ingest.py and scripts/bench_ann.py.
+
+All index types use inner product on L2-normalized vectors (= cosine):
+  flat   exact brute force (IndexFlatIP)
+  ivf    inverted lists over k-means cells (IndexIVFFlat)      knob: nprobe
+  hnsw   navigable small-world graph (IndexHNSWFlat)          knob: efSearch
+  pq     product-quantized codes, brute force (IndexPQ)
+  ivfpq  inverted lists + PQ codes (IndexIVFPQ)                knob: nprobe
+
+Defaults scale with the corpus size so tiny corpora still train.
+
+Passing `ids` wraps the index in IndexIDMap2, so vectors carry stable chunk
+labels instead of row numbers and incremental ingest can remove / replace
+them in place (update_index).
+"""
+
+import math
+from typing import Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+
+
+def _pq_m(d: int, want: int) -> int:
+    """Largest sub-quantizer count <= want that divides d."""
+    m = max(1, min(want, d))
+    while d % m:
+        m -= 1
+    return m
+
+
+def default_params(index_type: str, n: int, d: int) -> Dict:
+    n = max(1, n)
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))  # ~39 training points per cell
+    nbits = max(1, min(8, int(math.log2(max(2, n // 39)))))    # same rule for 2^nbits PQ centroids
+    if index_type == "flat":
+        return {}
+    if index_type == "ivf":
+        return {"nlist": nlist, "nprobe": max(1, min(nlist, 8))}
+    if index_type == "hnsw":
+        return {"M": 32, "efConstruction": 80, "efSearch": 64}
+    if index_type == "pq":
+        return {"m": _pq_m(d, min(64, max(1, d // 8))), "nbits": nbits}
+    if index_type == "ivfpq":
+        return {"nlist": nlist, "nprobe": max(1, min(nlist, 8)), "m": _pq_m(d, min(64, max(1, d // 8))), "nbits": nbits}
+    raise ValueError(f"Unknown index type: {index_type!r} (expected one of {INDEX_TYPES})")
+
+
+def new_index(index_type: str, d: int, params: Dict):
+    """Empty (possibly untrained) index of the given type."""
+    ip = faiss.METRIC_INNER_PRODUCT
+    if index_type == "flat":
+        return faiss.IndexFlatIP(d)
+    if index_type == "ivf":
+        return faiss.IndexIVFFlat(faiss.IndexFlatIP(d), d, params["nlist"], ip)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, params["M"], ip)
+        index.hnsw.efConstruction = params["efConstruction"]
+        return index
+    if index_type == "pq":
+        return faiss.IndexPQ(d, params["m"], params["nbits"], ip)
+    if index_type == "ivfpq":
+        return faiss.IndexIVFPQ(faiss.IndexFlatIP(d), d, params["nlist"], params["m"], params["nbits"], ip)
+    raise ValueError(f"Unknown index type: {index_type!r} (expected one of {INDEX_TYPES})")
+
+
+def build_index(X: np.ndarray, index_type: str = "flat", params: Optional[Dict] = None,
+                ids: Optional[np.ndarray] = None) -> Tuple[object, Dict]:
+    """
+    Train (if needed) and fill an index with the rows of X.
+    With `ids`, the index is ID-mapped and row i gets label ids[i].
+    Returns (index, params actually used) so callers can record them.
+    """
+    X = np.ascontiguousarray(X, dtype="float32")
+    n, d = X.shape
+    used = default_params(index_type, n, d)
+    used.update({k: v for k, v in (params or {}).items() if v is not None})
+    index = new_index(index_type, d, used)
+    if not index.is_trained:
+        index.train(X)
+    if ids is None:
+        index.add(X)
+        return index, used
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(X, np.ascontiguousarray(ids, dtype="int64"))
+    return index, used
+
+
+class IndexBuilder:
+    """
+    Streaming counterpart of build_index for corpora that don't fit in memory.
+    Batches passed to add() go straight into the index; index types that need
+    training (ivf, pq, ivfpq) first buffer `train_size` vectors, size their
+    defaults from that sample, train, and then stream the rest.
+    """
+
+    def __init__(self, index_type: str = "flat", params: Optional[Dict] = None,
+                 train_size: int = 20000, id_map: bool = True):
+        self.index_type = index_type
+        self.params = {k: v for k, v in (params or {}).items() if v is not None}
+        self.train_size = train_size
+        self.id_map = id_map
+        self.index = None
+        self.used: Dict = {}
+        self._pending: list = []  # (X, ids) held back until the index is trained
+        self._pending_n = 0
+
+    def _create(self, X: np.ndarray):
+        self.used = default_params(self.index_type, len(X), X.shape[1])
+        self.used.update(self.params)
+        index = new_index(self.index_type, X.shape[1], self.used)
+        if not index.is_trained:
+            index.train(X)
+        self.index = faiss.IndexIDMap2(index) if self.id_map else index
+
+    def _add(self, X, ids):
+        if self.id_map:
+            self.index.add_with_ids(X, ids)
+        else:
+            self.index.add(X)
+
+    def _flush_pending(self):
+        X = np.concatenate([x for x, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending])
+        self._pending, self._pending_n = [], 0
+        self._create(X)
+        self._add(X, ids)
+
+    def add(self, X: np.ndarray, ids: np.ndarray):
+        if not len(X):
+            return
+        X = np.ascontiguousarray(X, dtype="float32")
+        ids = np.ascontiguousarray(ids, dtype="int64")
+        if self.index is not None:
+            self._add(X, ids)
+            return
+        self._pending.append((X, ids))
+        self._pending_n += len(X)
+        needs_training = self.index_type in ("ivf", "pq", "ivfpq")
+        if not needs_training or self._pending_n >= self.train_size:
+            self._flush_pending()
+
+    def finish(self) -> Tuple[object, Dict]:
+        if self.index is None:
+            if not self._pending:
+                raise ValueError("No vectors were added")
+            self._flush_pending()
+        return self.index, self.used
+
+
+def supports_remove(index_type: str) -> bool:
+    """HNSW graphs can't drop nodes; those indexes are rebuilt instead."""
+    return index_type != "hnsw"
+
+
+def update_index(index, remove_ids: np.ndarray, X: np.ndarray, ids: np.ndarray):
+    """
+    In-place update of an ID-mapped index: drop `remove_ids`, then add the
+    rows of X under `ids`. IVF / PQ keep their trained centroids, so after
+    large corpus changes a full rebuild gives better cells.
+    """
+    if len(remove_ids):
+        index.remove_ids(np.ascontiguousarray(remove_ids, dtype="int64"))
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(X, dtype="float32"), np.ascontiguousarray(ids, dtype="int64"))
+    return index
+
+
+def is_id_mapped(index) -> bool:
+    return isinstance(faiss.downcast_index(index), faiss.IndexIDMap)
+
+
+def index_type_of(index) -> str:
+    """Best-effort reverse mapping for indexes loaded from disk."""
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap):
+        inner = faiss.downcast_index(inner.index)
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+
+def supports_selector(index_type: str) -> bool:
+    """IndexPQ rejects SearchParameters; callers post-filter instead."""
+    return index_type != "pq"
+
+
+def search_parameters(index_type: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      selector=None):
+    """
+    Per-call FAISS SearchParameters (thread-safe, unlike setting index.nprobe).
+    `selector` (e.g. faiss.IDSelectorBatch) restricts the search to those ids;
+    the caller must keep it alive as long as the parameters are used.
+    Returns None when there is nothing to set.
+    """
+    kw = {"sel": selector} if selector is not None and supports_selector(index_type) else {}
+    if index_type in ("ivf", "ivfpq") and (nprobe or kw):
+        if nprobe:
+            kw["nprobe"] = int(nprobe)
+        return faiss.SearchParametersIVF(**kw)
+    if index_type == "hnsw" and (ef_search or kw):
+        if ef_search:
+            kw["efSearch"] = int(ef_search)
+        return faiss.SearchParametersHNSW(**kw)
+    if kw:
+        return faiss.SearchParameters(**kw)
+    return None
+
+
+def index_nbytes(index) -> int:
+    """Serialized size, a good proxy for resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
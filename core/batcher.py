@@ -0,0 +1,156 @@
+#core/batcher.py
+
+"""
+Cross-request micro-batching.
+
+FastAPI runs our sync endpoints in a thread pool, so concurrent /chat calls
+arrive on different threads. MicroBatcher collects items submitted within
+`max_wait_ms` of each other (up to `max_batch`) and hands them to `fn` as one
+list; every caller blocks only on its own result.
+
+Collected batches run on a small pool, so up to `max_inflight` calls of `fn`
+are in flight at once and one slow or hung request doesn't hold up every
+query behind it; while all slots are busy, new items keep queueing and go
+out together in the next batch. A caller that gives up (timeout) cancels
+its item, and items cancelled before their batch starts are not sent.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "batcher",
+        max_inflight: int = 4,
+    ):
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.max_inflight = max(1, int(max_inflight))
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.inflight = 0
+        self.histogram: Counter = Counter()  # batch size -> number of batches
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix=self.name)
+                t = threading.Thread(target=self._run, name=self.name, daemon=True)
+                t.start()
+                self._thread = t
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        if self.max_batch == 1:
+            # Batching disabled: call through on the caller's thread.
+            self._dispatch([(item, fut)])
+            return fut
+        self._ensure_worker()
+        self._queue.put((item, fut))
+        return fut
+
+    def __call__(self, item: Any, timeout: float | None = None) -> Any:
+        """Result for one item; raises TimeoutError after `timeout` seconds."""
+        fut = self.submit(item)
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            fut.cancel()
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self, batch: List[tuple]):
+        live = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+        if len(live) < len(batch):
+            with self._stats_lock:
+                self.cancelled += len(batch) - len(live)
+        batch = live
+        if not batch:
+            return
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.histogram[len(batch)] += 1
+        try:
+            results = self.fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"{self.name}: got {len(results)} results for {len(batch)} items"
+                )
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for (_, fut), res in zip(batch, results):
+            fut.set_result(res)
+
+    def _run_slot(self, batch: List[tuple]):
+        try:
+            self._dispatch(batch)
+        finally:
+            with self._stats_lock:
+                self.inflight -= 1
+            self._slots.release()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._slots.acquire()  # at most max_inflight batches in flight
+            with self._stats_lock:
+                self.inflight += 1
+            self._pool.submit(self._run_slot, batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "max_inflight": self.max_inflight,
+                "inflight": self.inflight,
+                "batches": self.batches,
+                "items": self.items,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+                "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+                "histogram": dict(sorted(self.histogram.items())),
+            }
@@ -0,0 +1,131 @@
+#core/bm25.py
+
+"""
+Lexical (BM25) inverted index built by scripts/ingest.py next to the FAISS
+index. Term weights are precomputed at build time and stored CSR-style in a
+single .npz (no pickle), so a query is a few array lookups plus one bincount.
+"""
+
+import math
+import re
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for",
+    "with", "by", "from", "is", "are", "was", "were", "be", "been", "it",
+    "this", "that", "these", "those", "as", "i", "me", "my", "you", "your",
+    "we", "our", "so", "do", "does", "did", "am", "im", "i'm", "just", "can",
+    "about", "before", "after", "very", "really", "e", "g",
+}
+
+
+def _stem(tok: str) -> str:
+    # deliberately tiny: plurals and a couple of verb endings
+    if tok.endswith("n't"):
+        return tok
+    if len(tok) > 4 and tok.endswith("ies"):
+        return tok[:-3] + "y"
+    if len(tok) > 5 and tok.endswith("ing"):
+        return tok[:-3]
+    if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+        return tok[:-1]
+    return tok
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(t) for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, terms: np.ndarray, indptr: np.ndarray, docs: np.ndarray,
+                 weights: np.ndarray, n_docs: int, k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.n_docs = int(n_docs)
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.vocab = {t: i for i, t in enumerate(terms.tolist())}
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        postings = {}  # term -> {doc: tf}
+        doc_len = []
+        for d, text in enumerate(texts):
+            toks = tokenize(text)
+            doc_len.append(len(toks))
+            for t in toks:
+                p = postings.setdefault(t, {})
+                p[d] = p.get(d, 0) + 1
+        n = len(doc_len)
+        avgdl = (sum(doc_len) / n) if n else 0.0
+        terms = sorted(postings)
+        indptr = [0]
+        docs, weights = [], []
+        for t in terms:
+            p = postings[t]
+            idf = math.log(1.0 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for d in sorted(p):
+                tf = p[d]
+                norm = k1 * (1.0 - b + b * (doc_len[d] / avgdl if avgdl else 0.0))
+                docs.append(d)
+                weights.append(idf * tf * (k1 + 1.0) / (tf + norm))
+            indptr.append(len(docs))
+        return cls(
+            np.array(terms, dtype=str),
+            np.array(indptr, dtype="int64"),
+            np.array(docs, dtype="int32"),
+            np.array(weights, dtype="float32"),
+            n, k1, b,
+        )
+
+    def save(self, path: str):
+        np.savez(
+            path, terms=self.terms, indptr=self.indptr, docs=self.docs,
+            weights=self.weights, params=np.array([self.n_docs, self.k1, self.b], dtype="float64"),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        z = np.load(path, allow_pickle=False)
+        n_docs, k1, b = z["params"].tolist()
+        return cls(z["terms"], z["indptr"], z["docs"], z["weights"], int(n_docs), k1, b)
+
+    def search(self, query: str, k: int = 10,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, doc_ids) of the top-k docs, best first.
+        `mask` (bool per doc) restricts results to the docs where it is True."""
+        spans = []
+        for t in set(tokenize(query)):
+            i = self.vocab.get(t)
+            if i is not None:
+                spans.append((self.indptr[i], self.indptr[i + 1]))
+        if not spans:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        docs = np.concatenate([self.docs[s:e] for s, e in spans])
+        w = np.concatenate([self.weights[s:e] for s, e in spans])
+        if mask is not None:
+            keep = mask[docs]
+            docs, w = docs[keep], w[keep]
+            if docs.size == 0:
+                return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        uniq, inv = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inv, weights=w).astype("float32")
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], uniq[top].astype("int64")
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int, rrf_k: float = 60.0) -> List[Tuple[int, float]]:
+    """Fuse several best-first id lists; returns [(id, fused_score)] best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
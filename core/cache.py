@@ -0,0 +1,293 @@
+#core/cache.py
+
+"""
+Small caching helpers shared by the hot-path modules.
+
+- LRUCache:    bounded in-memory LRU with optional TTL (per process)
+- SQLiteStore: persistent key -> blob store with TTL, shared by all workers
+- TieredCache: memory first, then SQLite, with hit/miss/eviction counters
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFKC, casefolded, single spaces."""
+    t = unicodedata.normalize("NFKC", text or "")
+    return " ".join(t.casefold().split())
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live (seconds)."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, stored_at = item
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class SQLiteStore:
+    """
+    Persistent key -> blob store. WAL mode lets every uvicorn worker read and
+    write the same file; entries older than `ttl` are treated as missing.
+    """
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        con = self._connect()
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table}(
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            created_at REAL NOT NULL
+        );"""
+        )
+        con.commit()
+        con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5.0)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            con = self._connect()
+            row = con.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            con.close()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: bytes):
+        try:
+            con = self._connect()
+            con.execute(
+                f"INSERT OR REPLACE INTO {self.table}(key, value, created_at) VALUES (?,?,?)",
+                (key, sqlite3.Binary(value), time.time()),
+            )
+            con.commit()
+            con.close()
+        except sqlite3.Error:
+            self.errors += 1
+
+    def update(self, key: str, fn: Callable[[Optional[bytes]], bytes]) -> Optional[bytes]:
+        """
+        Atomic read-modify-write of one key across all workers: under
+        BEGIN IMMEDIATE (one writer at a time), read the current value (None
+        if missing or expired), store fn(value) and return it. Returns None
+        if SQLite fails; nothing is written then.
+        """
+        con = None
+        try:
+            con = self._connect()
+            con.isolation_level = None  # explicit transaction below
+            con.execute("BEGIN IMMEDIATE")
+            row = con.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            current = None
+            if row is not None and (self.ttl is None or time.time() - row[1] <= self.ttl):
+                current = row[0]
+            value = fn(current)
+            con.execute(
+                f"INSERT OR REPLACE INTO {self.table}(key, value, created_at) VALUES (?,?,?)",
+                (key, sqlite3.Binary(value), time.time()),
+            )
+            con.execute("COMMIT")
+        except sqlite3.Error:
+            self.errors += 1
+            if con is not None and con.in_transaction:
+                try:
+                    con.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            return None
+        finally:
+            if con is not None:
+                con.close()
+        if current is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Bulk get over one connection; missing/expired keys are left out."""
+        out: Dict[str, bytes] = {}
+        try:
+            con = self._connect()
+            for i in range(0, len(keys), 500):  # stay under SQLite's variable limit
+                part = keys[i:i + 500]
+                q = f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({','.join('?' * len(part))})"
+                for k, v, ts in con.execute(q, part):
+                    if self.ttl is None or time.time() - ts <= self.ttl:
+                        out[k] = v
+            con.close()
+        except sqlite3.Error:
+            self.errors += 1
+            return {}
+        self.hits += len(out)
+        self.misses += len(keys) - len(out)
+        return out
+
+    def set_many(self, items: Dict[str, bytes]):
+        try:
+            con = self._connect()
+            now = time.time()
+            con.executemany(
+                f"INSERT OR REPLACE INTO {self.table}(key, value, created_at) VALUES (?,?,?)",
+                [(k, sqlite3.Binary(v), now) for k, v in items.items()],
+            )
+            con.commit()
+            con.close()
+        except sqlite3.Error:
+            self.errors += 1
+
+    def purge_expired(self) -> int:
+        """Delete expired rows; returns how many were removed."""
+        if self.ttl is None:
+            return 0
+        con = self._connect()
+        cur = con.execute(
+            f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        n = cur.rowcount
+        con.commit()
+        con.close()
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            con = self._connect()
+            size = con.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            con.close()
+        except sqlite3.Error:
+            size = None
+        return {
+            "path": self.path,
+            "size": size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+
+class TieredCache:
+    """
+    Memory LRU in front of an optional SQLiteStore.
+    `encode`/`decode` convert values to and from the bytes kept on disk.
+    """
+
+    def __init__(
+        self,
+        memory: LRUCache,
+        store: Optional[SQLiteStore] = None,
+        encode: Callable[[Any], bytes] = lambda v: v,
+        decode: Callable[[bytes], Any] = lambda b: b,
+    ):
+        self.memory = memory
+        self.store = store
+        self.encode = encode
+        self.decode = decode
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.store is None:
+            return None
+        blob = self.store.get(key)
+        if blob is None:
+            return None
+        value = self.decode(blob)
+        self.memory.set(key, value)  # promote
+        return value
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.store is not None:
+            self.store.set(key, self.encode(value))
+
+    def stats(self) -> Dict[str, Any]:
+        out = {"memory": self.memory.stats()}
+        if self.store is not None:
+            out["persistent"] = self.store.stats()
+        return out
@@ -0,0 +1,181 @@
+#core/chunkstore.py
+
+"""
+Compact, memory-mapped chunk store (replaces the pickled storage/meta.npy).
+
+Layout in the index directory:
+  chunks.npy  structured array, one fixed-width record per chunk:
+              id, source_id, ns (UTF-8 bytes) + offset/length into the blob
+              + label (stable FAISS id) and hash (sha1 of the text)
+  chunks.bin  all chunk texts concatenated as UTF-8
+  vectors.f32 optional: the chunk embeddings, float32, one row per record
+              (for query-time reranking such as MMR; the index may not be
+              able to reconstruct them exactly)
+
+Both files are opened with mmap, so every worker shares the same page-cache
+pages and a search only decodes the k rows it returns. No pickle involved.
+"""
+
+import hashlib
+import mmap
+import os
+from itertools import repeat
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+RECORDS_FILE = "chunks.npy"
+BLOB_FILE = "chunks.bin"
+VECTORS_FILE = "vectors.f32"
+STR_FIELDS = ("id", "source_id", "ns")
+
+
+def content_hash(text: str) -> str:
+    """What an embedding depends on: the chunk text, nothing else."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_label(chunk_id: str) -> int:
+    """
+    Stable non-negative 63-bit FAISS id for a chunk id, so a chunk keeps its
+    vector id across ingests and can be removed / replaced in place.
+    """
+    return int.from_bytes(hashlib.sha1(chunk_id.encode("utf-8")).digest()[:8], "big") & ((1 << 63) - 1)
+
+
+class ChunkStoreWriter:
+    """Streams texts to the blob; the small fixed-width records are written on close()."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._blob = open(os.path.join(directory, BLOB_FILE), "wb")
+        self._cols: Dict[str, List[bytes]] = {f: [] for f in STR_FIELDS}
+        self._offsets: List[int] = []
+        self._lengths: List[int] = []
+        self._labels: List[int] = []
+        self._hashes: List[bytes] = []
+        self._pos = 0
+        self._vecs = None      # opened on the first vector
+        self._n_vecs = 0
+
+    def add(self, row: Dict, label: Optional[int] = None, vector: Optional[np.ndarray] = None) -> int:
+        """
+        Append one chunk; returns its row number. `label` defaults to the row
+        number. Vectors are kept only if every row gets one.
+        """
+        for f in STR_FIELDS:
+            self._cols[f].append(str(row.get(f, "") or "").encode("utf-8"))
+        text = str(row.get("text", ""))
+        data = text.encode("utf-8")
+        self._labels.append(len(self._offsets) if label is None else int(label))
+        self._hashes.append(content_hash(text).encode("ascii"))
+        self._blob.write(data)
+        if vector is not None:
+            if self._vecs is None:
+                self._vecs = open(os.path.join(self.directory, VECTORS_FILE), "wb")
+            self._vecs.write(np.ascontiguousarray(vector, dtype="<f4").tobytes())
+            self._n_vecs += 1
+        self._offsets.append(self._pos)
+        self._lengths.append(len(data))
+        self._pos += len(data)
+        return len(self._offsets) - 1
+
+    def close(self) -> int:
+        self._blob.close()
+        n = len(self._offsets)
+        if self._vecs is not None:
+            self._vecs.close()
+            if self._n_vecs != n:
+                os.remove(os.path.join(self.directory, VECTORS_FILE))
+        dtype = [(f, f"S{max([1] + [len(v) for v in self._cols[f]])}") for f in STR_FIELDS]
+        dtype += [("offset", "<i8"), ("length", "<i4"), ("label", "<i8"), ("hash", "S40")]
+        rec = np.zeros(n, dtype=dtype)
+        for f in STR_FIELDS:
+            rec[f] = self._cols[f]
+        rec["offset"] = self._offsets
+        rec["length"] = self._lengths
+        rec["label"] = self._labels
+        rec["hash"] = self._hashes
+        np.save(os.path.join(self.directory, RECORDS_FILE), rec, allow_pickle=False)
+        return n
+
+
+def write_chunk_store(directory: str, rows: Iterable[Dict], labels: Optional[Iterable[int]] = None) -> int:
+    w = ChunkStoreWriter(directory)
+    for r, label in zip(rows, labels if labels is not None else repeat(None)):
+        w.add(r, label)
+    return w.close()
+
+
+class ChunkStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.records = np.load(os.path.join(directory, RECORDS_FILE), mmap_mode="r", allow_pickle=False)
+        self._fh = open(os.path.join(directory, BLOB_FILE), "rb")
+        size = os.fstat(self._fh.fileno()).st_size
+        self._blob = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.vectors = None
+        vpath = os.path.join(directory, VECTORS_FILE)
+        if len(self.records) and os.path.exists(vpath):
+            flat = np.memmap(vpath, dtype="<f4", mode="r")
+            if flat.size % len(self.records) == 0:
+                self.vectors = flat.reshape(len(self.records), -1)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, RECORDS_FILE)) and \
+            os.path.exists(os.path.join(directory, BLOB_FILE))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def labels(self) -> np.ndarray:
+        """FAISS id per row (row numbers for stores written before labels existed)."""
+        if "label" in self.records.dtype.names:
+            return np.asarray(self.records["label"])
+        return np.arange(len(self), dtype="int64")
+
+    def hashes(self) -> List[str]:
+        if "hash" in self.records.dtype.names:
+            return [h.decode("ascii") for h in self.records["hash"]]
+        return [content_hash(t) for t in self.iter_texts()]
+
+    def text(self, i: int) -> str:
+        r = self.records[i]
+        off, ln = int(r["offset"]), int(r["length"])
+        return self._blob[off:off + ln].decode("utf-8")
+
+    def row(self, i: int) -> Dict:
+        r = self.records[i]
+        out = {f: r[f].decode("utf-8") for f in STR_FIELDS}
+        off, ln = int(r["offset"]), int(r["length"])
+        out["text"] = self._blob[off:off + ln].decode("utf-8")
+        return out
+
+    def rows(self, ids: Iterable[int]) -> List[Dict]:
+        return [self.row(int(i)) for i in ids]
+
+    def rows_many(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        """{row: dict} for many rows: one fancy-index read and vectorized decodes."""
+        ids = np.unique(np.fromiter(ids, dtype="int64"))
+        if ids.size == 0:
+            return {}
+        recs = self.records[ids]
+        cols = {f: np.char.decode(recs[f], "utf-8").tolist() for f in STR_FIELDS}
+        out = {}
+        for j, (i, off, ln) in enumerate(zip(ids.tolist(), recs["offset"].tolist(), recs["length"].tolist())):
+            row = {f: cols[f][j] for f in STR_FIELDS}
+            row["text"] = self._blob[off:off + ln].decode("utf-8")
+            out[i] = row
+        return out
+
+    def iter_texts(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._fh.close()
@@ -1,7 +1,7 @@
 
 
-from openai import OpenAI
 import os
+import threading
 from dotenv import load_dotenv
 from typing import List, Optional, Tuple
 
@@ -9,8 +9,26 @@ load_dotenv()
 
 # Import tone analysis utilities
 from core.tone import analyze_tone_and_cues, build_tone_block
+from core.startup import timed_resource
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """OpenAI client, created on first use (importing openai is slow)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                with timed_resource("composer.openai_client"):
+                    from openai import OpenAI
+                    _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+def warmup():
+    get_client()
 
 # IMPROVED SYSTEM PROMPT - More conversational and helpful
 SYS = """You are a warm, supportive mental health companion for students dealing with exam anxiety.
@@ -104,9 +122,9 @@ def compose(
     if not context_text:
         context_text = "(no recent conversation history)"
 
-    # Build tone block
+    # Build tone block (reuse the one the chat pipeline already built)
     if tone:
-        tone_block = build_tone_block(tone)
+        tone_block = tone.get("tone_block") or build_tone_block(tone)
     else:
         tone_analysis = analyze_tone_and_cues(user_msg)
         tone_block = build_tone_block(tone_analysis)
@@ -145,7 +163,7 @@ def compose(
         "Now respond naturally and helpfully. If they asked you to create something, actually create it!"
     )
 
-    resp = client.chat.completions.create(
+    resp = get_client().chat.completions.create(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": SYS},
@@ -0,0 +1,135 @@
+#core/dedup.py
+
+"""
+Near-duplicate chunk detection for scripts/ingest.py (MinHash + LSH).
+
+Each chunk is reduced to a MinHash signature over its word 3-gram shingles;
+the estimated Jaccard similarity of two chunks is the fraction of equal
+signature slots. LSH splits signatures into bands so only chunks that share
+a band bucket are compared, which keeps detection ~linear in corpus size.
+
+NearDuplicateFilter works on the ingest stream: the first chunk of a cluster
+is kept (corpus.jsonl comes before scraped documents, so curated text wins),
+later chunks at or above the threshold are dropped and recorded in clusters.
+"""
+
+import re
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def shingles(text: str, n: int = 3) -> List[str]:
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) <= n:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + n]) for i in range(len(words) - n + 1)]
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # universal hashing h(x) = (a*x + b) mod p; a, x < 2^31 so a*x fits in uint64
+        self.a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        sh = shingles(text, self.shingle_size)
+        if not sh:
+            return np.full(self.num_perm, int(_PRIME), dtype=np.uint32)
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in set(sh)), dtype=np.uint64) % _PRIME
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def jaccard_estimate(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands * rows == num_perm whose S-curve midpoint
+    (1/bands)^(1/rows) sits a little below the threshold: LSH only proposes
+    candidates, every candidate is then checked against the real threshold.
+    """
+    target = max(0.05, threshold - 0.1)
+    pairs = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    return min(pairs, key=lambda br: abs((1.0 / br[0]) ** (1.0 / br[1]) - target))
+
+
+class MinHashLSH:
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self._buckets: List[Dict[bytes, List]] = [{} for _ in range(self.bands)]
+        self._sigs: Dict = {}
+
+    def _keys(self, sig: np.ndarray):
+        for i in range(self.bands):
+            yield i, sig[i * self.rows:(i + 1) * self.rows].tobytes()
+
+    def insert(self, key, sig: np.ndarray):
+        self._sigs[key] = sig
+        for i, k in self._keys(sig):
+            self._buckets[i].setdefault(k, []).append(key)
+
+    def query(self, sig: np.ndarray) -> List[Tuple[object, float]]:
+        """Stored keys with estimated Jaccard >= threshold, most similar first."""
+        cands = set()
+        for i, k in self._keys(sig):
+            cands.update(self._buckets[i].get(k, ()))
+        hits = [(c, jaccard_estimate(sig, self._sigs[c])) for c in cands]
+        return sorted((h for h in hits if h[1] >= self.threshold), key=lambda h: -h[1])
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+
+class NearDuplicateFilter:
+    """
+    Streaming filter over ingest rows. mode="drop" removes near-duplicates,
+    mode="report" only records them. clusters: kept id -> [(dup id, similarity)].
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, mode: str = "drop",
+                 hasher: Optional[MinHasher] = None):
+        if mode not in ("drop", "report"):
+            raise ValueError(f"Unknown dedup mode: {mode!r} (expected 'drop' or 'report')")
+        self.mode = mode
+        self.hasher = hasher or MinHasher(num_perm)
+        self.lsh = MinHashLSH(threshold, self.hasher.num_perm)
+        self.clusters: Dict[str, List[Tuple[str, float]]] = {}
+        self.seen = 0
+        self.dropped = 0
+
+    def __call__(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        for r in rows:
+            self.seen += 1
+            sig = self.hasher.signature(r["text"])
+            hits = self.lsh.query(sig)
+            if hits:
+                kept, sim = hits[0]
+                self.clusters.setdefault(kept, []).append((r["id"], round(sim, 3)))
+                if self.mode == "drop":
+                    self.dropped += 1
+                    continue
+            else:
+                self.lsh.insert(r["id"], sig)
+            yield r
+
+    def report(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "threshold": self.lsh.threshold,
+            "num_perm": self.hasher.num_perm,
+            "bands": self.lsh.bands,
+            "chunks_seen": self.seen,
+            "duplicates": sum(len(v) for v in self.clusters.values()),
+            "dropped": self.dropped,
+            "clusters": {k: [{"id": i, "similarity": s} for i, s in v] for k, v in self.clusters.items()},
+        }
@@ -0,0 +1,264 @@
+#core/documents.py
+
+"""
+Streaming readers and token-aware chunking for scripts/ingest.py.
+
+Besides the hand-written chunks in data/corpus.jsonl, a source in
+data/sources.yaml can point at local documents:
+
+    - id: APA_sleep
+      url: https://...
+      ns: sleep                      # namespace for its chunks (default: general)
+      path: docs/apa_sleep.html      # file, directory or glob, relative to data/
+
+.txt, .md and .html files are read incrementally and split into paragraphs,
+then packed into chunks of at most CHUNK_TOKENS tokens (tiktoken) with
+CHUNK_OVERLAP tokens carried over between neighbours. Everything is a
+generator, so memory use doesn't depend on document or corpus size.
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import yaml
+
+from core.startup import record_fallback, timed_resource
+
+DATA_DIR = "data"
+DOC_EXTENSIONS = (".txt", ".md", ".markdown", ".html", ".htm")
+DEFAULT_NS = "general"
+
+# CHUNK_TOKENS / CHUNK_OVERLAP: chunk size and overlap in tokens
+# CHUNK_ENCODING: tiktoken encoding (cl100k_base = text-embedding-3-*)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")
+
+_READ_BYTES = 1 << 16
+_MD_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+")
+_MD_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_WS = re.compile(r"\s+")
+_PIECE = re.compile(r"\s*\S+|\s+")
+
+
+# ------------------------------------------------------------------
+# tokenizer
+# ------------------------------------------------------------------
+
+class _WhitespaceEncoding:
+    """Stand-in when the tiktoken encoding can't be loaded (offline): word pieces."""
+
+    name = "whitespace"
+
+    def encode(self, text: str) -> List[str]:
+        return _PIECE.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+_ENCODING = None
+_ENCODING_LOCK = threading.Lock()
+
+def encoding():
+    global _ENCODING
+    if _ENCODING is None:
+        with _ENCODING_LOCK:
+            if _ENCODING is None:
+                with timed_resource("documents.encoding"):
+                    _ENCODING = _load_encoding()
+    return _ENCODING
+
+
+def _load_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(CHUNK_ENCODING)
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use
+        reason = f"tiktoken encoding {CHUNK_ENCODING!r} unavailable ({e.__class__.__name__})"
+        print(f"Warning: {reason}; counting whitespace-separated words instead")
+        record_fallback("documents.encoding", f"{reason}: counting whitespace-separated words")
+        return _WhitespaceEncoding()
+
+
+# ------------------------------------------------------------------
+# readers: path -> paragraphs
+# ------------------------------------------------------------------
+
+def _clean(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+
+def iter_text_paragraphs(path: str, markdown: bool = False) -> Iterator[str]:
+    """Blank-line separated paragraphs, read line by line."""
+    buf: List[str] = []
+    in_fence = False
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if markdown:
+                if line.lstrip().startswith("```"):
+                    in_fence = not in_fence
+                    continue
+                if in_fence:
+                    continue
+                if _MD_HEADING.match(line):
+                    # a heading ends the paragraph before it and stands alone
+                    if buf:
+                        yield _clean(" ".join(buf)); buf = []
+                    line = _MD_HEADING.sub("", line)
+                line = _MD_LINK.sub(r"\1", line)
+            if line.strip():
+                buf.append(line)
+            elif buf:
+                yield _clean(" ".join(buf)); buf = []
+    if buf:
+        yield _clean(" ".join(buf))
+
+
+class _HTMLParagraphs(HTMLParser):
+    BLOCK = {"p", "div", "section", "article", "li", "ul", "ol", "br", "tr", "table",
+             "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "header", "footer", "main"}
+    SKIP = {"script", "style", "noscript", "head", "nav", "svg", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self._buf: List[str] = []
+        self._skip = 0
+
+    def _flush(self):
+        text = _clean("".join(self._buf))
+        self._buf = []
+        if text:
+            self.out.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.BLOCK:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.BLOCK:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._buf.append(data)
+
+
+def iter_html_paragraphs(path: str) -> Iterator[str]:
+    """Text of block-level elements, fed to the parser 64 KiB at a time."""
+    parser = _HTMLParagraphs()
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            data = f.read(_READ_BYTES)
+            if not data:
+                break
+            parser.feed(data)
+            yield from parser.out
+            parser.out = []
+    parser.close()
+    parser._flush()
+    yield from parser.out
+
+
+def iter_paragraphs(path: str) -> Iterator[str]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".html", ".htm"):
+        return iter_html_paragraphs(path)
+    return iter_text_paragraphs(path, markdown=ext in (".md", ".markdown"))
+
+
+# ------------------------------------------------------------------
+# chunking
+# ------------------------------------------------------------------
+
+def chunk_paragraphs(paragraphs: Iterable[str], max_tokens: int = CHUNK_TOKENS,
+                     overlap: int = CHUNK_OVERLAP, enc=None) -> Iterator[str]:
+    """
+    Pack paragraphs into chunks of <= max_tokens tokens. Chunks end on a
+    paragraph boundary when possible; longer paragraphs are cut by tokens.
+    The last `overlap` tokens of a chunk start the next one.
+    """
+    enc = enc or encoding()
+    overlap = max(0, min(overlap, max_tokens // 2))
+    sep = enc.encode("\n\n")
+    buf: list = []
+    carried = 0  # tokens in buf that were already emitted (the overlap)
+
+    def emit(tokens):
+        return enc.decode(list(tokens)).strip()
+
+    for p in paragraphs:
+        toks = enc.encode(p)
+        if not toks:
+            continue
+        if len(buf) > carried and len(buf) + len(sep) + len(toks) > max_tokens:
+            yield emit(buf)
+            buf = buf[len(buf) - overlap:] if overlap else []
+            carried = len(buf)
+        buf = buf + sep + toks if buf else list(toks)
+        while len(buf) > max_tokens:
+            yield emit(buf[:max_tokens])
+            buf = buf[max_tokens - overlap:]
+            carried = overlap
+    if len(buf) > carried:
+        yield emit(buf)
+
+
+# ------------------------------------------------------------------
+# sources -> rows
+# ------------------------------------------------------------------
+
+def source_paths(source: Dict, data_dir: str = DATA_DIR) -> List[str]:
+    """Document files for a sources.yaml entry (file, directory or glob)."""
+    spec = source.get("path")
+    if not spec:
+        return []
+    full = os.path.join(data_dir, spec)
+    if os.path.isdir(full):
+        paths = [os.path.join(dp, f) for dp, _, fs in os.walk(full) for f in fs]
+    else:
+        paths = glob.glob(full, recursive=True)
+    return sorted(p for p in paths if p.lower().endswith(DOC_EXTENSIONS))
+
+
+def iter_document_rows(sources_path: str, data_dir: str = DATA_DIR,
+                       max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> Iterator[Dict]:
+    """Chunk rows for every document referenced from sources.yaml."""
+    with open(sources_path, "r", encoding="utf-8") as f:
+        sources = yaml.safe_load(f) or []
+    for src in sources:
+        for path in source_paths(src, data_dir):
+            stem = os.path.splitext(os.path.relpath(path, data_dir))[0].replace(os.sep, "/")
+            for n, text in enumerate(chunk_paragraphs(iter_paragraphs(path), max_tokens, overlap)):
+                yield {
+                    "id": f"{src['id']}:{stem}#{n}",
+                    "source_id": src["id"],
+                    "ns": src.get("ns") or DEFAULT_NS,
+                    "text": text,
+                }
+
+
+def iter_corpus_rows(corpus_path: str) -> Iterator[Dict]:
+    """Hand-written chunks from corpus.jsonl, one line at a time."""
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_rows(corpus_path: Optional[str], sources_path: str, data_dir: str = DATA_DIR,
+              max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> Iterator[Dict]:
+    if corpus_path and os.path.exists(corpus_path):
+        yield from iter_corpus_rows(corpus_path)
+    yield from iter_document_rows(sources_path, data_dir, max_tokens, overlap)
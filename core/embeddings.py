@@ -0,0 +1,199 @@
+#core/embeddings.py
+
+"""
+Embedding backends shared by scripts/ingest.py and core/retriever.py.
+
+- "openai":  text-embedding-3-small via the API (default)
+- "hashing": fully local hashed word/char n-gram projection (NumPy only),
+             no network, deterministic across processes and machines
+
+Pick one with EMBED_BACKEND. Ingest records backend.signature() next to the
+index and the retriever refuses to search an index built with another one.
+"""
+
+import os
+import re
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_BACKEND = "openai"
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def l2_normalize(X: np.ndarray) -> np.ndarray:
+    X = np.asarray(X, dtype="float32")
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+
+class EmbeddingBackend:
+    """Interface: embed_many() returns L2-normalized float32 rows."""
+
+    name = "base"
+    remote = False  # True when every call leaves the process (worth caching/batching)
+    dim = 0
+    # default evidence floors for the retriever (query/chunk cosine); 0 = none
+    min_similarity = 0.0
+    hit_min_similarity = 0.0
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def signature(self) -> Dict:
+        """Everything that must match between the index and the query side."""
+        return {"backend": self.name, "dim": self.dim}
+
+    @property
+    def key(self) -> str:
+        sig = self.signature()
+        return ":".join(str(sig[k]) for k in sorted(sig))
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    name = "openai"
+    remote = True
+    # text-embedding-3 cosines: unrelated text ~0.0-0.15, on-topic ~0.3+
+    min_similarity = 0.2
+    hit_min_similarity = 0.15
+    DIMS = {
+        "text-embedding-3-small": 1536,
+        "text-embedding-3-large": 3072,
+        "text-embedding-ada-002": 1536,
+    }
+
+    def __init__(self, model: str = "text-embedding-3-small", client=None):
+        self.model = model
+        self.dim = self.DIMS.get(model, 0)
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        resp = self.client.embeddings.create(model=self.model, input=list(texts))
+        X = np.array([d.embedding for d in resp.data], dtype="float32")
+        if not self.dim:
+            self.dim = X.shape[1]
+        return l2_normalize(X)
+
+    def signature(self) -> Dict:
+        return {"backend": self.name, "model": self.model, "dim": self.dim}
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Signed feature hashing of word unigrams/bigrams and character n-grams,
+    with sublinear term frequency (1 + log tf). Lexical rather than semantic,
+    but good enough for CI, load tests and as an API fallback.
+    """
+
+    name = "hashing"
+    remote = False
+
+    def __init__(self, dim: int = 512, char_ngrams=(3, 5), word_ngrams: int = 2):
+        self.dim = int(dim)
+        self.char_ngrams = (int(char_ngrams[0]), int(char_ngrams[1]))
+        self.word_ngrams = int(word_ngrams)
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD_RE.findall((text or "").lower())
+        feats = []
+        for n in range(1, self.word_ngrams + 1):
+            for i in range(len(words) - n + 1):
+                feats.append("w:" + " ".join(words[i:i + n]))
+        lo, hi = self.char_ngrams
+        for w in words:
+            padded = f"<{w}>"
+            for n in range(lo, hi + 1):
+                for i in range(len(padded) - n + 1):
+                    feats.append("c:" + padded[i:i + n])
+        return feats
+
+    def _vector(self, text: str) -> np.ndarray:
+        counts: Dict[int, float] = {}
+        for f in self._features(text):
+            h = zlib.crc32(f.encode("utf-8"))
+            idx = h % self.dim
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            counts[idx] = counts.get(idx, 0.0) + sign
+        v = np.zeros(self.dim, dtype="float32")
+        for idx, c in counts.items():
+            v[idx] = np.sign(c) * (1.0 + np.log(abs(c))) if c else 0.0
+        return v
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype="float32")
+        return l2_normalize(np.stack([self._vector(t) for t in texts]))
+
+    def signature(self) -> Dict:
+        return {
+            "backend": self.name,
+            "dim": self.dim,
+            "char_ngrams": list(self.char_ngrams),
+            "word_ngrams": self.word_ngrams,
+        }
+
+
+def get_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Build the configured backend.
+    EMBED_BACKEND=openai|hashing, EMBED_MODEL (openai), EMBED_DIM (hashing).
+    """
+    name = (name or os.getenv("EMBED_BACKEND") or DEFAULT_BACKEND).strip().lower()
+    if name == "openai":
+        return OpenAIEmbeddingBackend(os.getenv("EMBED_MODEL", "text-embedding-3-small"))
+    if name == "hashing":
+        return HashingEmbeddingBackend(dim=int(os.getenv("EMBED_DIM", "512")))
+    raise ValueError(f"Unknown embedding backend: {name!r} (expected 'openai' or 'hashing')")
+
+
+def embed_with_store(backend: EmbeddingBackend, texts: List[str], hashes: List[str], store=None,
+                     batch_size: int = 256):
+    """
+    Embed texts, reusing vectors persisted under (backend.key, content hash).
+    `store` is a core.cache.SQLiteStore (or None to always embed); only the
+    misses go to the backend, in batches of `batch_size`, and are written back.
+    Returns (X, number of texts actually embedded).
+    """
+    keys = [f"{backend.key}:{h}" for h in hashes]
+    found = store.get_many(list(dict.fromkeys(keys))) if store is not None else {}
+    vecs: Dict[str, np.ndarray] = {k: np.frombuffer(b, dtype="float32") for k, b in found.items()}
+    todo, seen = [], set()  # first row of every distinct text that still needs embedding
+    for i, k in enumerate(keys):
+        if k not in vecs and k not in seen:
+            seen.add(k)
+            todo.append(i)
+    for start in range(0, len(todo), batch_size):
+        part = todo[start:start + batch_size]
+        new = dict(zip((keys[i] for i in part), backend.embed_many([texts[i] for i in part])))
+        vecs.update(new)
+        if store is not None:
+            store.set_many({k: v.astype("float32").tobytes() for k, v in new.items()})
+    rows = [vecs[k] for k in keys]
+    X = np.vstack(rows).astype("float32") if rows else np.zeros((0, backend.dim or 0), dtype="float32")
+    return X, len(todo)
+
+
+def check_compatible(index_sig: Dict, backend: EmbeddingBackend):
+    """Raise if an index was built with a different embedding backend."""
+    want = backend.signature()
+    diffs = {
+        k: (index_sig.get(k), v)
+        for k, v in want.items()
+        if index_sig.get(k) != v and not (k == "dim" and not v)
+    }
+    if diffs:
+        detail = ", ".join(f"{k}: index={a!r} configured={b!r}" for k, (a, b) in diffs.items())
+        raise RuntimeError(
+            f"Vector index was built with a different embedding backend ({detail}). "
+            "Re-run scripts/ingest.py with the same EMBED_BACKEND."
+        )
@@ -0,0 +1,108 @@
+#core/evidence.py
+
+"""
+Evidence selection between retrieval and compose.
+
+search() over-fetches candidates; select_evidence() then picks chunks by
+maximal marginal relevance (MMR): each step takes the candidate with the best
+
+    lambda * sim(query, chunk) - (1 - lambda) * max sim(chunk, already picked)
+
+so near-identical chunks don't crowd out different advice. Picking stops at
+k chunks or when the EVIDENCE token budget (tiktoken) would be exceeded.
+Namespace quotas ({ns: n}, e.g. the sleep template's two sleep chunks) are
+pinned first; MMR only fills the remaining slots, counting the pinned
+chunks as already picked.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from core.documents import encoding
+
+# EVIDENCE_MMR=0 keeps the plain top-k; FETCH_K = candidates retrieved for MMR
+EVIDENCE_MMR = os.getenv("EVIDENCE_MMR", "1") != "0"
+EVIDENCE_FETCH_K = int(os.getenv("EVIDENCE_FETCH_K", "12"))
+# 1.0 = pure relevance, 0.0 = pure diversity
+EVIDENCE_MMR_LAMBDA = float(os.getenv("EVIDENCE_MMR_LAMBDA", "0.7"))
+# max tokens of chunk text in the EVIDENCE section (0 = no limit)
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", "600"))
+
+
+def count_tokens(text: str) -> int:
+    return len(encoding().encode(text))
+
+
+def warmup():
+    """Load the token encoder for the EVIDENCE budget (tiktoken may download it)."""
+    encoding()
+
+
+def mmr_order(query_vec: np.ndarray, vectors: np.ndarray, lambda_: float = EVIDENCE_MMR_LAMBDA,
+              pinned: Sequence[int] = ()) -> List[int]:
+    """
+    Candidate indices in MMR order (vectors are L2-normalized rows). `pinned`
+    indices come first, as given, and count as already picked for the rest.
+    """
+    n = len(vectors)
+    if n == 0:
+        return []
+    V = np.asarray(vectors, dtype="float32")
+    rel = V @ np.asarray(query_vec, dtype="float32")
+    pair = V @ V.T
+    order: List[int] = list(pinned)
+    red = np.zeros(n, dtype="float32")  # max similarity to anything picked so far
+    left = np.ones(n, dtype=bool)
+    for i in order:
+        left[i] = False
+        red = np.maximum(red, pair[i])
+    for _ in range(n - len(order)):
+        score = np.where(left, lambda_ * rel - (1.0 - lambda_) * red, -np.inf)
+        i = int(np.argmax(score))
+        order.append(i)
+        left[i] = False
+        red = np.maximum(red, pair[i])
+    return order
+
+
+def quota_picks(hits: List[Dict], k: int, quotas: Optional[Dict[str, int]] = None) -> List[int]:
+    """Indices of the best-ranked hits filling each {ns: n} quota, at most k in all."""
+    pinned: List[int] = []
+    for ns, n in (quotas or {}).items():
+        for i, h in enumerate(hits):
+            if n <= 0 or len(pinned) >= k:
+                break
+            if h.get("ns") == ns and i not in pinned:
+                pinned.append(i)
+                n -= 1
+    return pinned
+
+
+def select_evidence(hits: List[Dict], k: int, query_vec: Optional[np.ndarray] = None,
+                    vectors: Optional[np.ndarray] = None, lambda_: float = EVIDENCE_MMR_LAMBDA,
+                    token_budget: int = EVIDENCE_TOKEN_BUDGET,
+                    quotas: Optional[Dict[str, int]] = None) -> List[Dict]:
+    """
+    Up to k hits within the token budget. Hits filling `quotas` come first;
+    with a query vector and one vector per hit the rest are taken in MMR
+    order, otherwise in rank order. A chunk that doesn't fit the remaining
+    budget is skipped, but the first pick is always kept so there is some
+    evidence.
+    """
+    pinned = quota_picks(hits, k, quotas)
+    if query_vec is not None and vectors is not None and len(vectors) == len(hits):
+        order = mmr_order(query_vec, vectors, lambda_, pinned)
+    else:
+        order = pinned + [i for i in range(len(hits)) if i not in pinned]
+    picked, used = [], 0
+    for i in order:
+        if len(picked) >= k:
+            break
+        n = count_tokens(hits[i].get("text", "")) if token_budget > 0 else 0
+        if picked and token_budget > 0 and used + n > token_budget:
+            continue
+        picked.append(hits[i])
+        used += n
+    return picked
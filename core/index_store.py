@@ -0,0 +1,146 @@
+#core/index_store.py
+
+"""
+Versioned on-disk layout for everything scripts/ingest.py produces.
+
+    storage/index/
+        CURRENT                    -> name of the live version (one line)
+        v20261016-101500123-3fa2/  -> one complete, immutable index version
+            vectordb.faiss  index_meta.json  bm25.npz  chunks.npy  chunks.bin
+
+Ingest builds a version in a hidden temp dir, renames it into place and then
+atomically replaces CURRENT, so readers never see a half-written index.
+Serving workers compare CURRENT with the version they loaded (admin endpoint
+or file watch) and swap to the new one. A tree without CURRENT falls back to
+the flat pre-versioning layout directly under storage/.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+STORAGE_DIR = "storage"
+INDEX_ROOT = os.path.join(STORAGE_DIR, "index")
+CURRENT_FILE = "CURRENT"
+
+VEC_FILE = "vectordb.faiss"
+META_FILE = "index_meta.json"
+BM25_FILE = "bm25.npz"
+
+
+def _current_path(root: str) -> str:
+    return os.path.join(root, CURRENT_FILE)
+
+
+def current_version(root: str = INDEX_ROOT) -> Optional[str]:
+    try:
+        with open(_current_path(root), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_dir(root: str = INDEX_ROOT) -> str:
+    """Directory of the live version, or the legacy flat storage/ layout."""
+    v = current_version(root)
+    return os.path.join(root, v) if v else STORAGE_DIR
+
+
+def current_mtime(root: str = INDEX_ROOT) -> float:
+    try:
+        return os.stat(_current_path(root)).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _version_key(root: str, d: str):
+    # creation time from the name (the random suffix doesn't order anything),
+    # then the directory mtime for names from the same millisecond
+    stamp = d.rsplit("-", 1)[0]
+    try:
+        return stamp, os.path.getmtime(os.path.join(root, d))
+    except OSError:
+        return stamp, 0.0
+
+
+def list_versions(root: str = INDEX_ROOT) -> List[str]:
+    """Published versions, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        (d for d in os.listdir(root)
+         if d.startswith("v") and os.path.isdir(os.path.join(root, d))),
+        key=lambda d: _version_key(root, d),
+    )
+
+
+_last_stamp = ""
+_stamp_lock = threading.Lock()
+
+
+def new_version_name() -> str:
+    """
+    v<date>-<time with milliseconds>-<random>. The time part strictly
+    increases within a process, so versions sort by creation time even when
+    several are published in the same second. (Older names without
+    milliseconds still sort before newer ones from the same second.)
+    """
+    global _last_stamp
+    with _stamp_lock:
+        now = time.time()
+        while True:
+            stamp = time.strftime("v%Y%m%d-%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+            if stamp > _last_stamp:
+                break
+            now += 0.001
+        _last_stamp = stamp
+    return f"{stamp}-{uuid.uuid4().hex[:4]}"
+
+
+def staging_dir(version: str, root: str = INDEX_ROOT) -> str:
+    d = os.path.join(root, f".tmp-{version}")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def publish(version: str, root: str = INDEX_ROOT) -> str:
+    """Move a finished staging dir into place and point CURRENT at it."""
+    final = os.path.join(root, version)
+    os.rename(os.path.join(root, f".tmp-{version}"), final)
+    tmp = _current_path(root) + f".{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _current_path(root))
+    return final
+
+
+def gc_versions(keep: int = 3, root: str = INDEX_ROOT) -> List[str]:
+    """
+    Delete all but the newest `keep` versions (never the current one) and any
+    abandoned staging dirs. Workers still holding an old version keep working:
+    its index and BM25 are in memory and mmapped chunk files stay valid on
+    POSIX until unmapped. Deletion errors (e.g. files in use on Windows) are
+    skipped and retried on the next run.
+    """
+    cur = current_version(root)
+    versions = list_versions(root)
+    doomed = [v for v in versions[:-keep] if v != cur] if keep > 0 else [v for v in versions if v != cur]
+    if os.path.isdir(root):
+        # staging dirs of a concurrent ingest are young; only abandoned ones go
+        doomed += [
+            d for d in os.listdir(root)
+            if d.startswith(".tmp-") and time.time() - os.path.getmtime(os.path.join(root, d)) > 3600
+        ]
+    removed = []
+    for v in doomed:
+        try:
+            shutil.rmtree(os.path.join(root, v))
+            removed.append(v)
+        except OSError:
+            pass
+    return removed
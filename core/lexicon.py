@@ -0,0 +1,114 @@
+#core/lexicon.py
+
+"""
+One lexical pass per message, shared by core/risk.py and core/tone.py.
+
+Both used to lowercase and scan the same message on their own, over largely
+the same words ("panic", "overwhelmed", "can't sleep", "hopeless", "numb").
+analyze() now lowercases it once and checks every vocabulary literal once:
+the required literals of the active risk pattern pack plus the tone cue
+terms below, de-duplicated. The resulting match table (LexicalAnalysis)
+drives both
+- risk: only the pack regexes whose literals occur are run, on the same
+  lowercased text (SignalMatcher.scan_text), and
+- tone: cues, empathy level and template are set lookups on the table
+  (tone.analyze_tone_and_cues(msg, lex)).
+Outputs are identical to scanning separately: scripts/check_lexicon.py
+checks that against the pre-lexicon tone analysis and its own term lists,
+and scripts/bench_lexicon.py times both.
+
+Plain substring probes are used on purpose: CPython's substring search
+beats a single-pass trie regex over this vocabulary, on chat turns and
+on long messages alike.
+"""
+
+from dataclasses import dataclass
+from typing import FrozenSet, Optional, Tuple
+
+from core.risk_patterns import PatternPack, active_pack, _PREFILTER_FOLD
+
+# Tone cue buckets, in report order: (cue, empathy level, substring terms)
+TONE_CUES: Tuple[Tuple[str, int, FrozenSet[str]], ...] = (
+    # Panic / overwhelm / acute stress
+    ("panic/overwhelm", 3, frozenset({
+        "panic", "panicking", "panic attack",
+        "overwhelmed", "overwhelming",
+        "shaking", "heart is racing",
+        "can't breathe", "cannot breathe",
+        "freaking out", "losing my mind", "lose my mind",
+        "breakdown", "meltdown",
+    })),
+    # Sleep / exhaustion / insomnia
+    ("sleep/insomnia", 2, frozenset({
+        "can't sleep", "cannot sleep", "insomnia",
+        "haven't slept", "no sleep",
+        "stayed up all night", "awake all night",
+        "exhausted", "drained",
+    })),
+    # Negative self-talk / low self-worth
+    ("negative_self_talk", 3, frozenset({
+        "hopeless", "worthless", "numb",
+        "i'm a failure", "im a failure",
+        "i am a failure",
+        "i'm so dumb", "im so dumb",
+        "i'm stupid", "im stupid",
+        "i hate myself",
+    })),
+    # General exam anxiety (milder but relevant)
+    ("exam_stress", 2, frozenset({
+        "exam", "finals", "midterm", "test",
+        "grade", "gpa",
+        "study stress", "too much to study",
+        "so much to study",
+        "failed before", "failed last time",
+    })),
+)
+# Only reported when no cue above matched
+GENERIC_STRESS: Tuple[str, int, FrozenSet[str]] = ("general_stress", 2, frozenset({
+    "stressed", "anxious", "anxiety",
+    "nervous", "worried", "worrying",
+}))
+
+TONE_TERMS: FrozenSet[str] = frozenset().union(*(terms for _, _, terms in TONE_CUES), GENERIC_STRESS[2])
+
+
+@dataclass(frozen=True)
+class LexicalAnalysis:
+    text: str                # msg.lower(), what the risk regexes run on
+    matches: FrozenSet[str]  # vocabulary literals in the text (ı/ſ folded, for the risk prefilter)
+    exact: FrozenSet[str]    # literals in the text as is (tone); same set unless the text has ı/ſ
+    pack: PatternPack        # pack whose literals were checked; risk must use this one
+
+
+class Lexicon:
+    """The vocabulary of one pattern pack plus the tone terms."""
+
+    def __init__(self, pack: PatternPack):
+        self.pack = pack
+        self.literals = tuple(sorted(set(pack.matcher.literals) | TONE_TERMS))
+
+    def analyze(self, msg: str) -> LexicalAnalysis:
+        m = (msg or "").lower()
+        if "\u0131" in m or "\u017f" in m:
+            folded = m.translate(_PREFILTER_FOLD)
+            matches = frozenset(l for l in self.literals if l in folded)
+            return LexicalAnalysis(m, matches, frozenset(l for l in matches if l in m), self.pack)
+        matches = frozenset(l for l in self.literals if l in m)
+        return LexicalAnalysis(m, matches, matches, self.pack)
+
+
+_lexicon: Optional[Lexicon] = None
+
+
+def active_lexicon() -> Lexicon:
+    """Lexicon for the active pattern pack, rebuilt when the pack is swapped."""
+    global _lexicon
+    pack = active_pack()
+    lex = _lexicon
+    if lex is None or lex.pack is not pack:
+        lex = _lexicon = Lexicon(pack)
+    return lex
+
+
+def analyze(msg: str) -> LexicalAnalysis:
+    return active_lexicon().analyze(msg)
@@ -0,0 +1,218 @@
+#core/moderation.py
+
+"""
+Moderation backends for the "second opinion" in core/risk.py.
+
+- "openai": omni-moderation-latest via the API (default)
+- "local":  logistic regression over hashed word/char n-grams, trained from
+            labelled audit-log rows by scripts/train_moderation.py; runs
+            in-process, no network
+- "off":    no second opinion
+
+Pick one with MODERATION_BACKEND. With MODERATION_FALLBACK=local (default)
+the local model, if trained, answers when the API times out or fails.
+Every backend returns (flagged, score) with score in [0, 1], comparable to
+the API's max(self_harm, violence) category score.
+"""
+
+import json
+import os
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.startup import timed_resource
+
+DEFAULT_BACKEND = "openai"
+# LOCAL_MODERATION_MODEL: weights written by scripts/train_moderation.py
+LOCAL_MODERATION_MODEL = os.getenv("LOCAL_MODERATION_MODEL", "storage/moderation_model.npz")
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class ModerationBackend:
+    """Interface: moderate_many() returns one (flagged, score) per text."""
+
+    name = "base"
+    remote = False  # True when every call leaves the process (worth caching / bounding)
+
+    def moderate_many(self, texts: List[str]) -> List[Tuple[bool, float]]:
+        raise NotImplementedError
+
+    def moderate(self, text: str) -> Tuple[bool, float]:
+        return self.moderate_many([text])[0]
+
+    def signature(self) -> Dict:
+        return {"backend": self.name}
+
+    @property
+    def key(self) -> str:
+        sig = self.signature()
+        return ":".join(str(sig[k]) for k in sorted(sig))
+
+
+class OpenAIModeration(ModerationBackend):
+    name = "openai"
+    remote = True
+
+    def __init__(self, model: str = "omni-moderation-latest", timeout: Optional[float] = None, client=None):
+        self.model = model
+        self.timeout = timeout  # HTTP timeout per request (None = client default)
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            with timed_resource("moderation.openai_client"):
+                from openai import OpenAI
+                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                if self.timeout:
+                    client = client.with_options(timeout=self.timeout, max_retries=0)
+                self._client = client
+        return self._client
+
+    def moderate_many(self, texts: List[str]) -> List[Tuple[bool, float]]:
+        mod = self.client.moderations.create(model=self.model, input=list(texts))
+        out = []
+        for result in mod.results:
+            cat = result.categories
+            scores = result.category_scores
+            is_flagged = bool(getattr(cat, "self_harm", False) or getattr(cat, "violence", False))
+            self_harm_score = getattr(scores, "self_harm", 0.0)
+            violence_score = getattr(scores, "violence", 0.0)
+            out.append((is_flagged, float(max(self_harm_score, violence_score))))
+        return out
+
+    def signature(self) -> Dict:
+        return {"backend": self.name, "model": self.model}
+
+
+def hashed_features(text: str, dim: int, word_ngrams: int = 2, char_ngrams=(3, 5)) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sparse (indices, values) of signed hashed word and character n-grams with
+    sublinear term frequency, L2-normalized. Same feature set as the hashing
+    embedding backend, but in a much larger space since nothing is stored per
+    chunk.
+    """
+    words = _WORD_RE.findall((text or "").lower())
+    counts: Dict[int, float] = {}
+
+    def add(f: str):
+        h = zlib.crc32(f.encode("utf-8"))
+        idx = h % dim
+        counts[idx] = counts.get(idx, 0.0) + (1.0 if (h >> 31) & 1 else -1.0)
+
+    for n in range(1, word_ngrams + 1):
+        for i in range(len(words) - n + 1):
+            add("w:" + " ".join(words[i:i + n]))
+    lo, hi = char_ngrams
+    for w in words:
+        padded = f"<{w}>"
+        for n in range(lo, hi + 1):
+            for i in range(len(padded) - n + 1):
+                add("c:" + padded[i:i + n])
+    idx = np.fromiter((i for i, c in counts.items() if c), dtype=np.int64)
+    val = np.fromiter((np.sign(c) * (1.0 + np.log(abs(c))) for c in counts.values() if c), dtype=np.float32)
+    norm = float(np.linalg.norm(val))
+    return idx, (val / norm if norm else val)
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30.0, 30.0)))
+
+
+class LocalModeration(ModerationBackend):
+    """Hashed n-gram logistic regression; score = P(crisis | text)."""
+
+    name = "local"
+    remote = False
+
+    def __init__(self, weights: np.ndarray, bias: float = 0.0, threshold: float = 0.5, meta: Optional[Dict] = None):
+        self.w = np.asarray(weights, dtype="float32")
+        self.b = float(bias)
+        self.threshold = float(threshold)
+        self.meta = meta or {}
+
+    @property
+    def dim(self) -> int:
+        return len(self.w)
+
+    def score(self, text: str) -> float:
+        idx, val = hashed_features(text, self.dim)
+        return float(_sigmoid(float(self.w[idx] @ val) + self.b))
+
+    def moderate_many(self, texts: List[str]) -> List[Tuple[bool, float]]:
+        out = []
+        for t in texts:
+            s = self.score(t)
+            out.append((s >= self.threshold, s))
+        return out
+
+    def signature(self) -> Dict:
+        return {"backend": self.name, "dim": self.dim, "trained_at": self.meta.get("trained_at", "")}
+
+    @classmethod
+    def train(cls, texts: Iterable[str], labels: Iterable[int], dim: int = 1 << 18, epochs: int = 20,
+              lr: float = 0.5, l2: float = 1e-5, threshold: float = 0.5, seed: int = 0) -> "LocalModeration":
+        """
+        Plain SGD on the log loss, with positives re-weighted to balance the
+        classes (crisis rows are rare in the audit log).
+        """
+        rows = [hashed_features(t, dim) for t in texts]
+        y = np.asarray(list(labels), dtype="float32")
+        pos = float(y.sum())
+        if not len(rows) or pos == 0 or pos == len(y):
+            raise ValueError("Need both positive and negative examples to train")
+        cw = {1.0: len(y) / (2 * pos), 0.0: len(y) / (2 * (len(y) - pos))}
+        w = np.zeros(dim, dtype="float32")
+        b = 0.0
+        rng = np.random.default_rng(seed)
+        for epoch in range(epochs):
+            step = lr / (1.0 + epoch)
+            for i in rng.permutation(len(rows)):
+                idx, val = rows[i]
+                g = (float(_sigmoid(float(w[idx] @ val) + b)) - y[i]) * cw[float(y[i])]
+                if l2:
+                    w[idx] *= (1.0 - step * l2)
+                w[idx] -= step * g * val
+                b -= step * g
+        return cls(w, b, threshold)
+
+    def save(self, path: str):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, w=self.w, b=np.float32(self.b), threshold=np.float32(self.threshold),
+                            meta=np.array(json.dumps(self.meta)))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = LOCAL_MODERATION_MODEL) -> "LocalModeration":
+        with timed_resource("moderation.local_model"):
+            with np.load(path) as z:
+                return cls(z["w"], float(z["b"]), float(z["threshold"]), json.loads(str(z["meta"])))
+
+
+def local_model_available(path: str = LOCAL_MODERATION_MODEL) -> bool:
+    return bool(path) and os.path.exists(path)
+
+
+def get_moderation_backend(name: Optional[str] = None, timeout: Optional[float] = None) -> Optional[ModerationBackend]:
+    """
+    Build the configured backend (None for "off").
+    MODERATION_BACKEND=openai|local|off, MODERATION_MODEL (openai).
+    """
+    name = (name or os.getenv("MODERATION_BACKEND") or DEFAULT_BACKEND).strip().lower()
+    if name == "openai":
+        return OpenAIModeration(os.getenv("MODERATION_MODEL", "omni-moderation-latest"), timeout=timeout)
+    if name == "local":
+        if not local_model_available():
+            raise RuntimeError(f"No local moderation model at {LOCAL_MODERATION_MODEL}; "
+                               "train one with scripts/train_moderation.py")
+        return LocalModeration.load(LOCAL_MODERATION_MODEL)
+    if name == "off":
+        return None
+    raise ValueError(f"Unknown moderation backend: {name!r} (expected 'openai', 'local' or 'off')")
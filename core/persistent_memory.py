@@ -136,6 +136,9 @@ def get_conversation_history(
     return history
 
 
+EMPTY_CONTEXT = "(No previous conversation)"
+
+
 def format_conversation_context(history: List[Dict[str, Any]]) -> str:
     """
     Format conversation history into a readable context string
@@ -147,7 +150,7 @@ def format_conversation_context(history: List[Dict[str, Any]]) -> str:
         Formatted string for LLM context
     """
     if not history:
-        return "(No previous conversation)"
+        return EMPTY_CONTEXT
     
     formatted = []
     for turn in history:
@@ -172,7 +175,7 @@ def get_conversation_summary(user_id: str, max_chars: int = 500) -> str:
     history = get_conversation_history(user_id, limit=10)
     
     if not history:
-        return "(No previous conversation)"
+        return EMPTY_CONTEXT
     
     summary_parts = []
     char_count = 0
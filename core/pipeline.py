@@ -0,0 +1,261 @@
+#core/pipeline.py
+
+"""
+The /chat flow as explicit stages around one ChatContext per request.
+
+Stages: lexicon, tone, context, risk, retrieval, compose, safety. Each is a
+property of the context that runs its stage on first access, memoizes the
+result and records the stage's wall time in ctx.timings (ms). Later reads
+are free, so e.g. the empathy level compose() needs is the one tone already
+computed, and the lexical pass is shared by tone and risk.
+
+start() kicks off the slow I/O first: the moderation request (read by the
+risk stage) and speculative retrieval on the prefetch pool (unused if the
+turn is a crisis, see cancel_retrieval()). app.chat decides the branches
+and persistence; metadata() is the assistant metadata stored with the turn.
+
+Stage timings are also aggregated per worker for GET /metrics/pipeline.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.composer import compose
+from core.lexicon import LexicalAnalysis, analyze
+from core.persistent_memory import EMPTY_CONTEXT, load_context_for_compose
+from core.response_cache import RESPONSE_CACHE, RESPONSE_CACHE_STORE
+from core.retriever import index_version, namespace_quotas_for_template, search_evidence
+from core.risk import classify_tier_with_confidence, start_moderation
+from core.risk_state import observe as observe_risk_state
+from core.safety import red_flag
+from core.tone import analyze_tone_and_cues, build_tone_block
+
+# PIPELINE_STATS_WINDOW: recent requests per stage kept for the percentiles
+# RETRIEVAL_TIMEOUT: seconds /chat waits for retrieval before treating the
+# turn as having no evidence (abstains); 0 = no limit
+PIPELINE_STATS_WINDOW = int(os.getenv("PIPELINE_STATS_WINDOW", "1000"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "15"))
+RETRIEVAL_K = 4
+
+# speculative retrieval runs here while the risk tier is still being decided
+_PREFETCH = ThreadPoolExecutor(max_workers=8, thread_name_prefix="prefetch")
+
+
+class StageStats:
+    """Per-stage call count, mean and recent p50/p95/max in ms."""
+
+    def __init__(self, window: int = PIPELINE_STATS_WINDOW):
+        self.window = max(1, window)
+        self._lock = threading.Lock()
+        self._count: Dict[str, int] = {}
+        self._total: Dict[str, float] = {}
+        self._recent: Dict[str, deque] = {}
+
+    def record(self, stage: str, ms: float):
+        with self._lock:
+            self._count[stage] = self._count.get(stage, 0) + 1
+            self._total[stage] = self._total.get(stage, 0.0) + ms
+            self._recent.setdefault(stage, deque(maxlen=self.window)).append(ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for stage, recent in self._recent.items():
+                xs = sorted(recent)
+                out[stage] = {
+                    "count": self._count[stage],
+                    "mean_ms": round(self._total[stage] / self._count[stage], 2),
+                    "p50_ms": round(xs[len(xs) // 2], 2),
+                    "p95_ms": round(xs[min(len(xs) - 1, int(len(xs) * 0.95))], 2),
+                    "max_ms": round(xs[-1], 2),
+                }
+            return {"window": self.window, "stages": out}
+
+
+STAGE_STATS = StageStats()
+
+
+def pipeline_stats() -> Dict[str, Any]:
+    return STAGE_STATS.stats()
+
+
+class ChatContext:
+    def __init__(self, user_id: str, message: str, allowed_tags: Optional[List[str]] = None):
+        self.user_id = user_id
+        self.message = message
+        self.allowed_tags = allowed_tags
+        self.timings: Dict[str, float] = {}
+        self._results: Dict[str, Any] = {}
+        self._moderation = None
+        self._hits_future: Optional[Future] = None
+        self._hits: Optional[List[Dict]] = None
+        self._query_vec = None  # query embedding from retrieval (None in lexical mode)
+        self.retrieval_status = "ok"  # ok | timeout
+        self._cache_entry = None  # (x, group, version) of a reply to cache once it passes safety
+
+    def _stage(self, name: str, fn: Callable[[], Any]) -> Any:
+        if name in self._results:
+            return self._results[name]
+        t0 = time.perf_counter()
+        try:
+            value = fn()
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self.timings[name] = round(ms, 2)
+            STAGE_STATS.record(name, ms)
+        self._results[name] = value
+        return value
+
+    def start(self) -> "ChatContext":
+        """Start moderation and speculative retrieval; both overlap the stages up to risk."""
+        self._moderation = start_moderation(self.message)
+        self.tone  # retrieval quotas follow the tone template
+        self._hits_future = _PREFETCH.submit(self._retrieve)
+        return self
+
+    def cancel_retrieval(self):
+        if self._hits_future is not None:
+            self._hits_future.cancel()  # no-op if it already started
+
+    # ---- stages ----
+
+    @property
+    def lex(self) -> LexicalAnalysis:
+        return self._stage("lexicon", lambda: analyze(self.message))
+
+    @property
+    def tone(self) -> Dict:
+        """analyze_tone_and_cues() plus the prompt's tone block under "tone_block"."""
+        def run():
+            tone = analyze_tone_and_cues(self.message, self.lex)
+            tone["tone_block"] = build_tone_block(tone)
+            return tone
+        return self._stage("tone", run)
+
+    @property
+    def context(self) -> str:
+        return self._stage("context", lambda: load_context_for_compose(self.user_id, format_type="full"))
+
+    @property
+    def risk(self) -> Tuple[int, float, Dict]:
+        """
+        (tier, confidence, details). Waits at most MODERATION_TIMEOUT from
+        start() for moderation, then folds the turn into the user's rolling
+        risk state; sustained distress or a recent crisis raises the tier.
+        """
+        def run():
+            tier, confidence, details = classify_tier_with_confidence(
+                self.message, moderation=self._moderation, lex=self.lex)
+            conversation = observe_risk_state(self.user_id, tier, details)
+            if conversation:
+                details["conversation"] = conversation
+                if conversation["floor"] > tier:
+                    details["reasoning"] = (f"{details['reasoning']} | raised from Tier {tier}: "
+                                            f"{', '.join(conversation['reasons'])}")
+                    tier = conversation["floor"]
+            return tier, confidence, details
+        return self._stage("risk", run)
+
+    def _retrieve(self) -> List[Dict]:
+        # over-fetch, then diverse chunks within the evidence token budget;
+        # keep the query vector for the response cache
+        hits, self._query_vec = self._stage("retrieval", lambda: search_evidence(
+            self.message, k=RETRIEVAL_K, quotas=namespace_quotas_for_template(self.tone["template"]),
+            with_query_vec=True))
+        return hits
+
+    @property
+    def hits(self) -> List[Dict]:
+        """
+        Evidence for the turn. A retrieval that takes longer than
+        RETRIEVAL_TIMEOUT (or whose embedding exceeds EMBED_TIMEOUT) counts
+        as no evidence, so the turn abstains instead of hanging;
+        retrieval_status records it.
+        """
+        if self._hits is not None:
+            return self._hits
+        t0 = time.perf_counter()
+        try:
+            if self._hits_future is None:
+                self._hits = self._retrieve()
+            else:
+                self._hits = self._hits_future.result(timeout=RETRIEVAL_TIMEOUT or None)
+        except TimeoutError:
+            self.cancel_retrieval()
+            self.retrieval_status = "timeout"
+            self._hits = []
+        if self._hits_future is not None:
+            self.timings.setdefault("retrieval_wait", round((time.perf_counter() - t0) * 1000, 2))
+        return self._hits
+
+    @property
+    def reply(self) -> Tuple[str, List[Tuple[str, str]], Optional[Dict]]:
+        """
+        (text, tags, cached): cached is the response-cache entry when a
+        tier-1 turn without history reuses a reply composed for a
+        near-identical message over the same evidence, else None. The
+        lookup reuses retrieval's query vector and never embeds on its own,
+        so lexical mode (no vector) bypasses the cache.
+        """
+        def run():
+            tier = self.risk[0]
+            hits = self.hits  # retrieval, and with it the query vector, is done
+            cached = None
+            if RESPONSE_CACHE and RESPONSE_CACHE_STORE.eligible(
+                    tier, self.context != EMPTY_CONTEXT, self._query_vec is not None) is None:
+                x = self._query_vec
+                version = index_version()
+                group = RESPONSE_CACHE_STORE.group_key(tier, self.tone["template"], [h["id"] for h in hits])
+                cached = RESPONSE_CACHE_STORE.get(x, group, version)
+                if cached is None:
+                    self._cache_entry = (x, group, version)
+            if cached is not None:
+                return cached["text"], [tuple(t) for t in cached["tags"]], cached
+            text, tags = compose(
+                self.message,
+                hits,
+                self.tone["empathy_level"],
+                tier,
+                context_text=self.context,
+                allowed_tags=self.allowed_tags,
+                tone=self.tone,
+            )
+            return text, tags, None
+        return self._stage("compose", run)
+
+    @property
+    def safe(self) -> bool:
+        """Post-generation safety check of the reply."""
+        return self._stage("safety", lambda: not red_flag(self.reply[0]))
+
+    def cache_reply(self):
+        """Store a freshly composed reply in the response cache (only after it passed safety)."""
+        if self._cache_entry is not None and self.safe:
+            x, group, version = self._cache_entry
+            text, tags, _ = self.reply
+            RESPONSE_CACHE_STORE.set(x, group, version, text, tags)
+            self._cache_entry = None
+
+    # ---- output ----
+
+    def metadata(self, tier: int, citations: List[Dict], **extra) -> Dict:
+        """Assistant metadata saved with the turn in conversation memory."""
+        tone = self.tone
+        return {
+            "tier": tier,
+            "confidence": self.risk[1],
+            "citations": citations,
+            "tone_analysis": {
+                "empathy_level": tone["empathy_level"],
+                "template": tone["template"],
+                "cues": tone["cues"],
+            },
+            "risk_details": self.risk[2],
+            "retrieval_status": self.retrieval_status,
+            **extra,
+            "timings": dict(self.timings),
+        }
@@ -0,0 +1,158 @@
+#core/response_cache.py
+
+"""
+Semantic cache for composed replies.
+
+A stored reply is reused when a new turn has the same risk tier, tone
+template, retrieved chunk ids and index version, and its query embedding is
+within RESPONSE_CACHE_THRESHOLD cosine similarity of the stored one. Only
+tier-1 turns without conversation history are eligible: crisis and
+elevated-risk turns, and anything personalised by memory, always go to the
+LLM.
+
+Entries live in-process (LRU + TTL). An entry built on another index
+version is dropped when it is next looked at, so a reload never serves
+replies grounded in evidence that changed.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# RESPONSE_CACHE=0 disables; SIZE = max entries per worker; TTL in seconds
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+# cosine similarity of the query embeddings needed for a hit
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+
+CACHEABLE_TIERS = (1,)
+
+
+class SemanticResponseCache:
+    def __init__(self, maxsize: int = 2048, ttl: Optional[float] = 86400, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()  # LRU order
+        self._groups: Dict[Tuple, List[int]] = {}  # exact part of the key -> entry ids
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed: Dict[str, int] = {}
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def group_key(tier: int, template: Optional[str], chunk_ids: List[str]) -> Tuple:
+        return (tier, template or "", tuple(sorted(chunk_ids)))
+
+    def eligible(self, tier: int, has_context: bool, has_query_vec: bool = True) -> Optional[str]:
+        """None if the turn may use the cache, else the reason it may not."""
+        if tier not in CACHEABLE_TIERS:
+            reason = f"tier_{tier}"
+        elif has_context:
+            reason = "personal_context"
+        elif not has_query_vec:
+            reason = "no_query_vector"  # lexical retrieval, or retrieval failed
+        else:
+            return None
+        with self._lock:
+            self.bypassed[reason] = self.bypassed.get(reason, 0) + 1
+        return reason
+
+    def _drop(self, eid: int):
+        e = self._entries.pop(eid, None)
+        if e is None:
+            return
+        ids = self._groups.get(e["group"])
+        if ids is not None:
+            ids.remove(eid)
+            if not ids:
+                del self._groups[e["group"]]
+
+    def get(self, x: np.ndarray, group: Tuple, version: str) -> Optional[Dict]:
+        """Best stored entry for embedding x in this group, or None."""
+        now = time.time()
+        with self._lock:
+            best, best_sim = None, self.threshold
+            for eid in list(self._groups.get(group, ())):
+                e = self._entries[eid]
+                if e["version"] != version:
+                    self._drop(eid)
+                    self.invalidations += 1
+                    continue
+                if self.ttl is not None and now - e["created_at"] > self.ttl:
+                    self._drop(eid)
+                    self.expirations += 1
+                    continue
+                sim = float(np.dot(e["x"], x))
+                if sim >= best_sim:
+                    best, best_sim = eid, sim
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            e = self._entries[best]
+            e["hits"] += 1
+            return {"text": e["text"], "tags": list(e["tags"]), "similarity": best_sim}
+
+    def set(self, x: np.ndarray, group: Tuple, version: str, text: str, tags: List):
+        with self._lock:
+            eid = self._next
+            self._next += 1
+            self._entries[eid] = {
+                "x": np.asarray(x, dtype="float32"), "group": group, "version": version,
+                "text": text, "tags": list(tags), "created_at": time.time(), "hits": 0,
+            }
+            self._groups.setdefault(group, []).append(eid)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, version: Optional[str] = None) -> int:
+        """Drop every entry not built on `version` (all entries if None)."""
+        with self._lock:
+            doomed = [eid for eid, e in self._entries.items() if version is None or e["version"] != version]
+            for eid in doomed:
+                self._drop(eid)
+            self.invalidations += len(doomed)
+            return len(doomed)
+
+    def clear(self):
+        self.invalidate(None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": RESPONSE_CACHE,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "bypassed": dict(self.bypassed),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+RESPONSE_CACHE_STORE = SemanticResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_THRESHOLD)
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    return RESPONSE_CACHE_STORE.stats()
@@ -1,28 +1,592 @@
 #core/retriever.py
-import os, json, yaml, faiss, numpy as np
-from openai import OpenAI
+
+# Nothing heavy happens at import: NumPy/FAISS, the vector index, the chunk
+# store, the BM25 index, sources.yaml and the embedding client are created on
+# first use by resources() / backend(), or up front by warmup().
+#
+# The loaded index version is one immutable Resources object. reload() builds
+# the next one off to the side and swaps the module reference; a search holds
+# its own reference for its whole duration, so in-flight searches finish on
+# the version they started with. configure_search() works the same way: it
+# swaps in a copy that shares the loaded data but carries the new nprobe /
+# efSearch, which are passed per query as SearchParameters (the FAISS index
+# itself is never modified after loading).
+
+import os, json, hashlib, threading, time
 from dotenv import load_dotenv
-load_dotenv()  
+from core.cache import LRUCache, SQLiteStore, TieredCache, normalize_text
+from core.batcher import MicroBatcher
+from core.startup import timed_resource
+from core import index_store
+from core.index_store import VEC_FILE, META_FILE, BM25_FILE
+load_dotenv()
+
+SOURCES_PATH = "data/sources.yaml"
+
+# INDEX_WATCH_SECS: every worker polls the mtime of storage/index/CURRENT this
+# often and hot-reloads when it changes. POST /admin/reload-index only swaps
+# the worker that handles it, so with 0 the other workers keep the old
+# version until they restart.
+INDEX_WATCH_SECS = float(os.getenv("INDEX_WATCH_SECS", "5"))
+
+# RETRIEVAL_MODE: dense (FAISS only) | lexical (BM25 only, never calls the
+# embeddings API) | hybrid (both, fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense").strip().lower()
+HYBRID_OVERFETCH = int(os.getenv("HYBRID_OVERFETCH", "4"))  # each ranker returns k * this
+RRF_K = float(os.getenv("RRF_K", "60"))
+
+# ---- Evidence floor ----
+# RETRIEVAL_MIN_SCORE: if no hit's query/chunk cosine reaches this, search()
+#   returns nothing and the chat flow abstains without calling the LLM
+# RETRIEVAL_HIT_MIN_SCORE: individual hits below this cosine are dropped
+# Cosine scales differ per embedding backend, so unset means the backend's
+# default (openai: 0.2 / 0.15; hashing: off, its cosines don't separate
+# on- and off-topic queries). 0 disables.
+RETRIEVAL_MIN_SCORE = float(os.environ["RETRIEVAL_MIN_SCORE"]) if os.getenv("RETRIEVAL_MIN_SCORE") else None
+RETRIEVAL_HIT_MIN_SCORE = float(os.environ["RETRIEVAL_HIT_MIN_SCORE"]) if os.getenv("RETRIEVAL_HIT_MIN_SCORE") else None
+
+# ---- ANN search-time knobs ----
+# Ingest records the index type and its tuned defaults; FAISS_NPROBE (ivf/ivfpq)
+# and FAISS_EF_SEARCH (hnsw) override them, as does configure_search() at runtime.
+NPROBE = int(os.getenv("FAISS_NPROBE", "0")) or None
+EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0")) or None
+
+# ---- Namespace routing ----
+# Every chunk has an `ns` (coping, sleep, cbt, ...). search() can be restricted
+# to some namespaces (FAISS ID selector + BM25 mask) or given per-namespace
+# quotas. With NS_ROUTING=1 the chat flow derives quotas from the tone template.
+NS_ROUTING = os.getenv("NS_ROUTING", "1") != "0"
+TEMPLATE_NAMESPACE_QUOTAS = {
+    "sleep": {"sleep": 2},
+    "panic": {"cbt": 1, "test-anxiety": 1},
+    "self_talk": {"cbt": 2},
+}
+
+# ---- Query-embedding cache ----
+# EMBED_CACHE_SIZE: max vectors kept in memory per worker (0 disables the memory tier)
+# EMBED_CACHE_TTL:  seconds before a cached vector is re-fetched (0 = never expires)
+# EMBED_CACHE_PATH: SQLite file shared by all workers ("" disables the persistent tier)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", str(7 * 24 * 3600)))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "storage/embed_cache.sqlite")
+
+# ---- Cross-request micro-batching of embedding calls ----
+# EMBED_BATCH_MAX:     max queries per embeddings request (1 disables batching)
+# EMBED_BATCH_WAIT_MS: how long the first query in a batch waits for company
+# EMBED_BATCH_INFLIGHT: embeddings requests in flight at once per worker
+# EMBED_TIMEOUT:       seconds a query waits for its embedding (0 = no limit);
+#                      raises TimeoutError, which the chat flow treats as no evidence
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+EMBED_BATCH_INFLIGHT = int(os.getenv("EMBED_BATCH_INFLIGHT", "4"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "10"))
+
+_LOCK = threading.RLock()  # resources() -> backend() re-enters
+_BACKEND = None
+_RESOURCES = None
+_EMBED_CACHE = None
+
+
+class NamespaceFilter:
+    def __init__(self, ids, mask, selector, params):
+        self.ids = ids            # sorted chunk-store rows in the namespaces
+        self.mask = mask          # bool per row, for BM25 and post-filtering
+        self.selector = selector  # keeps the faiss IDSelector alive for `params`
+        self.params = params      # SearchParameters with the selector + knobs
+
+
+class Resources:
+    """Everything loaded from the index directory, plus derived search settings."""
+
+    def __init__(self, directory, index, index_meta, chunks, bm25, sources):
+        from core.ann import index_type_of, is_id_mapped
+        self.directory = directory
+        self.version = index_meta.get("version") or "legacy"
+        self.loaded_at = time.time()
+        self.index = index
+        self.index_meta = index_meta
+        self.chunks = chunks
+        self.bm25 = bm25
+        self.sources = sources
+        self.index_type = index_meta.get("index", {}).get("type") or index_type_of(index)
+        self.index_params = index_meta.get("index", {}).get("params", {})
+        self.ns_rows = self._namespace_rows()
+        # ID-mapped indexes return chunk labels; map them back to chunk-store rows
+        import numpy as np
+        self.labels = chunks.labels
+        self.id_mapped = is_id_mapped(index)
+        self._label_order = np.argsort(self.labels, kind="stable") if self.id_mapped else None
+        self._sorted_labels = self.labels[self._label_order] if self.id_mapped else None
+        self._init_search()
+
+    def _init_search(self):
+        from core.ann import search_parameters
+        self.nprobe = NPROBE or self.index_params.get("nprobe")
+        self.ef_search = EF_SEARCH or self.index_params.get("efSearch")
+        self.search_params = search_parameters(self.index_type, self.nprobe, self.ef_search)
+        self._ns_filters = {}
+
+    def with_search_knobs(self) -> "Resources":
+        """Copy sharing the loaded data, with the current NPROBE / EF_SEARCH."""
+        import copy
+        out = copy.copy(self)
+        out._init_search()
+        return out
+
+    def _namespace_rows(self) -> dict:
+        import numpy as np
+        ns_col = np.asarray(self.chunks.records["ns"])
+        return {
+            name.decode("utf-8"): np.flatnonzero(ns_col == name).astype("int64")
+            for name in np.unique(ns_col)
+        }
+
+    def hits_for(self, ids, scores) -> list:
+        """One row of FAISS results (-1 = no result) -> [(chunk-store row, score)]."""
+        import numpy as np
+        ids = np.asarray(ids, dtype="int64")
+        keep = ids >= 0
+        ids, scores = ids[keep], np.asarray(scores)[keep]
+        if self.id_mapped:
+            pos = np.searchsorted(self._sorted_labels, ids).clip(0, len(self.labels) - 1)
+            ok = self._sorted_labels[pos] == ids
+            ids, scores = self._label_order[pos[ok]], scores[ok]
+        return list(zip(ids.tolist(), scores.tolist()))
+
+    def namespace_filter(self, namespaces) -> NamespaceFilter:
+        """Cached ID selector / mask for a set of namespaces (unknown ones match nothing)."""
+        key = frozenset(namespaces)
+        filt = self._ns_filters.get(key)
+        if filt is None:
+            import faiss, numpy as np
+            from core.ann import search_parameters
+            parts = [self.ns_rows[n] for n in key if n in self.ns_rows]
+            ids = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype="int64")
+            mask = np.zeros(len(self.chunks), dtype=bool)
+            mask[ids] = True
+            sel = faiss.IDSelectorBatch(self.labels[ids] if self.id_mapped else ids)
+            params = search_parameters(self.index_type, self.nprobe, self.ef_search, selector=sel)
+            filt = NamespaceFilter(ids, mask, sel, params)
+            self._ns_filters[key] = filt
+        return filt
+
+
+def backend():
+    """The configured embedding backend (EMBED_BACKEND=openai|hashing)."""
+    global _BACKEND
+    if _BACKEND is None:
+        with _LOCK:
+            if _BACKEND is None:
+                with timed_resource("retriever.embedding_backend"):
+                    from core.embeddings import get_backend
+                    _BACKEND = get_backend()
+    return _BACKEND
+
+
+def _load_resources(directory: str) -> Resources:
+    import yaml
+    from core.embeddings import check_compatible
+    from core.bm25 import BM25Index
+    from core.chunkstore import ChunkStore
+
+    with timed_resource("retriever.faiss_index"):
+        import faiss
+        index = faiss.read_index(os.path.join(directory, VEC_FILE))
+    with timed_resource("retriever.index_meta"):
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                index_meta = json.load(f)
+        else:
+            # indexes built before backends were recorded came from the OpenAI model
+            index_meta = {"embedding": {"backend": "openai", "model": "text-embedding-3-small", "dim": index.d}}
+        be = backend()
+        check_compatible(index_meta["embedding"], be)
+        if index.d != (be.dim or index.d):
+            raise RuntimeError(f"Index dimension {index.d} != embedding dimension {be.dim}")
+    with timed_resource("retriever.chunk_store"):
+        if not ChunkStore.exists(directory):
+            raise RuntimeError(f"No chunk store in {directory}/ (chunks.npy, chunks.bin); re-run scripts/ingest.py")
+        chunks = ChunkStore(directory)  # memory-mapped; rows are decoded on demand
+    with timed_resource("retriever.bm25"):
+        bm25_path = os.path.join(directory, BM25_FILE)
+        bm25 = BM25Index.load(bm25_path) if os.path.exists(bm25_path) else None
+    with timed_resource("retriever.sources"):
+        with open(SOURCES_PATH, "r", encoding="utf-8") as f:
+            sources = {s["id"]: s["url"] for s in yaml.safe_load(f)}
+    return Resources(directory, index, index_meta, chunks, bm25, sources)
+
+
+def resources() -> Resources:
+    global _RESOURCES
+    if _RESOURCES is None:
+        with _LOCK:
+            if _RESOURCES is None:
+                _RESOURCES = _load_resources(index_store.current_dir())
+    return _RESOURCES
+
+
+_RELOAD_LOCK = threading.Lock()
+
+def reload(force: bool = False) -> dict:
+    """
+    Swap to the version CURRENT points at (no-op if already loaded, unless
+    force). The new version is fully loaded before the swap; if loading fails
+    the old one stays live and the error propagates.
+    """
+    global _RESOURCES
+    with _RELOAD_LOCK:
+        old = _RESOURCES
+        directory = index_store.current_dir()
+        if old is not None and not force and os.path.abspath(old.directory) == os.path.abspath(directory):
+            return {"reloaded": False, "version": old.version, "previous": old.version}
+        new = _load_resources(directory)
+        _RESOURCES = new  # atomic reference swap
+        return {
+            "reloaded": True,
+            "version": new.version,
+            "previous": old.version if old is not None else None,
+        }
+
+
+def index_version() -> str:
+    return resources().version
+
+
+def index_info() -> dict:
+    res = _RESOURCES
+    return {
+        "loaded_version": res.version if res is not None else None,
+        "loaded_at": res.loaded_at if res is not None else None,
+        "current_version": index_store.current_version(),
+        "available_versions": index_store.list_versions(),
+    }
+
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  
+_WATCHER = None
 
-INDEX = faiss.read_index("storage/vectordb.faiss")
-META = np.load("storage/meta.npy", allow_pickle=True)
-SOURCES = {s["id"]: s["url"] for s in yaml.safe_load(open("data/sources.yaml","r",encoding="utf-8"))}
+def start_index_watcher(interval: float | None = None):
+    """Background thread that hot-reloads when CURRENT changes (one per worker)."""
+    global _WATCHER
+    interval = INDEX_WATCH_SECS if interval is None else interval
+    if interval <= 0 or _WATCHER is not None:
+        return _WATCHER
+
+    def _watch():
+        last = index_store.current_mtime()
+        while True:
+            time.sleep(interval)
+            m = index_store.current_mtime()
+            if m == last:
+                continue
+            if _RESOURCES is None:
+                last = m  # not loaded yet: the first request loads CURRENT anyway
+                continue
+            try:
+                reload()
+                last = m
+            except Exception as e:
+                # keep serving the old version; retry on the next tick
+                print(f"Warning: index reload failed: {e!r}")
+
+    _WATCHER = threading.Thread(target=_watch, name="index-watcher", daemon=True)
+    _WATCHER.start()
+    return _WATCHER
+
+
+def configure_search(nprobe: int | None = None, ef_search: int | None = None):
+    """
+    Change nprobe / efSearch for subsequent searches in this worker. Searches
+    already running keep the Resources (and knobs) they started with.
+    """
+    global NPROBE, EF_SEARCH, _RESOURCES
+    with _RELOAD_LOCK, _LOCK:  # don't undo a concurrent reload() or first load
+        if nprobe is not None:
+            NPROBE = nprobe
+        if ef_search is not None:
+            EF_SEARCH = ef_search
+        if _RESOURCES is not None:
+            _RESOURCES = _RESOURCES.with_search_knobs()  # atomic reference swap
+
+
+def _embed_cache() -> TieredCache:
+    global _EMBED_CACHE
+    if _EMBED_CACHE is None:
+        with _LOCK:
+            if _EMBED_CACHE is None:
+                import numpy as np
+                with timed_resource("retriever.embed_cache"):
+                    _EMBED_CACHE = TieredCache(
+                        LRUCache(EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL),
+                        SQLiteStore(EMBED_CACHE_PATH, table="query_embeddings", ttl=EMBED_CACHE_TTL) if EMBED_CACHE_PATH else None,
+                        encode=lambda v: v.astype("float32").tobytes(),
+                        decode=lambda b: np.frombuffer(b, dtype="float32").copy(),
+                    )
+    return _EMBED_CACHE
+
+
+def _embed_batch(texts: list) -> list:
+    """One embeddings request for many texts; duplicates are sent once."""
+    uniq = list(dict.fromkeys(texts))
+    X = backend().embed_many(uniq)
+    by_text = dict(zip(uniq, X))
+    return [by_text[t] for t in texts]
+
+_BATCHER = MicroBatcher(_embed_batch, max_batch=EMBED_BATCH_MAX, max_wait_ms=EMBED_BATCH_WAIT_MS,
+                        name="embed-batcher", max_inflight=EMBED_BATCH_INFLIGHT)
+
+def embed_batch_stats() -> dict:
+    return _BATCHER.stats()
+
+def _cache_key(q: str) -> str:
+    return backend().key + ":" + hashlib.sha1(normalize_text(q).encode("utf-8")).hexdigest()
+
+def embed_cache_stats() -> dict:
+    return _embed_cache().stats()
 
 def embed(q:str):
-    v = client.embeddings.create(model="text-embedding-3-small", input=[q]).data[0].embedding
-    x = np.array(v, dtype="float32"); faiss.normalize_L2(x.reshape(1,-1)); return x
+    be = backend()
+    if not be.remote:
+        # local backends are cheaper to run than to look up
+        return be.embed_many([normalize_text(q)])[0]
+    cache = _embed_cache()
+    key = _cache_key(q)
+    x = cache.get(key)
+    if x is not None:
+        return x
+    x = _BATCHER(normalize_text(q), timeout=EMBED_TIMEOUT or None)
+    cache.set(key, x)
+    return x
 
-def search(query: str, k=4):
-    x = embed(query)
-    D,I = INDEX.search(x.reshape(1,-1), k)
+def embed_many(queries: list):
+    """
+    Query embeddings for a whole batch: cache lookups first, then one
+    embeddings request for all distinct misses (bypassing the micro-batcher,
+    which exists to coalesce single queries).
+    """
+    import numpy as np
+    be = backend()
+    norm = [normalize_text(q) for q in queries]
+    if not be.remote:
+        uniq = list(dict.fromkeys(norm))
+        X = be.embed_many(uniq)
+        pos = {t: i for i, t in enumerate(uniq)}
+        return X[[pos[t] for t in norm]]
+    cache = _embed_cache()
+    keys = [_cache_key(q) for q in queries]
+    vecs = {}
+    for key in dict.fromkeys(keys):
+        x = cache.get(key)
+        if x is not None:
+            vecs[key] = x
+    misses = list(dict.fromkeys(t for t, key in zip(norm, keys) if key not in vecs))
+    if misses:
+        for t, x in zip(misses, _embed_batch(misses)):
+            key = _cache_key(t)
+            cache.set(key, x)
+            vecs[key] = x
+    return np.vstack([vecs[key] for key in keys]).astype("float32")
+
+def _rows(res: Resources, ranked, sims: dict | None = None):
+    """(row, score) pairs -> hit dicts with url, score and similarity."""
     hits = []
-    for i in I[0]:
-        if i < 0:
-            continue
-        obj = META[i]                     # this is already a dict
-        row = dict(obj)                   # make a shallow copy so we can add url
-        row["url"] = SOURCES.get(row["source_id"], "")
+    for i, score in ranked:
+        row = res.chunks.row(i)           # only the returned rows are decoded
+        row["url"] = res.sources.get(row["source_id"], "")
+        row["row"] = i
+        row["score"] = score
+        row["similarity"] = sims.get(i) if sims is not None else None
         hits.append(row)
     return hits
+
+def _dense_hits(res: Resources, x, k: int, filt: NamespaceFilter | None = None) -> list:
+    """[(row, cosine)] best first."""
+    return _dense_hits_many(res, x.reshape(1, -1), k, filt)[0]
+
+def _dense_hits_many(res: Resources, X, k: int, filt: NamespaceFilter | None = None) -> list:
+    """_dense_hits for a matrix of queries: one index.search call."""
+    from core.ann import supports_selector
+    if filt is not None and filt.ids.size == 0:
+        return [[] for _ in range(len(X))]
+    if filt is None:
+        D,I = res.index.search(X, k, params=res.search_params)
+        return [res.hits_for(i, d) for i, d in zip(I, D)]
+    if supports_selector(res.index_type):
+        D,I = res.index.search(X, min(k, filt.ids.size), params=filt.params)
+        return [res.hits_for(i, d) for i, d in zip(I, D)]
+    # index type without selector support: rank everything, keep the namespace
+    D,I = res.index.search(X, res.index.ntotal, params=res.search_params)
+    return [[h for h in res.hits_for(i, d) if filt.mask[h[0]]][:k] for i, d in zip(I, D)]
+
+def _lexical_hits(res: Resources, query: str, k: int, filt: NamespaceFilter | None = None) -> list:
+    """[(row, bm25 score)] best first."""
+    scores, ids = res.bm25.search(query, k, mask=filt.mask if filt is not None else None)
+    return list(zip(ids.tolist(), scores.tolist()))
+
+def _fuse(dense: list, lexical: list, k: int) -> list:
+    from core.bm25 import reciprocal_rank_fusion
+    return reciprocal_rank_fusion([[i for i, _ in dense], [i for i, _ in lexical]], k, rrf_k=RRF_K)
+
+def _ranked(res: Resources, query: str, x, k: int, mode: str, filt: NamespaceFilter | None, sims: dict) -> list:
+    """[(row, score)] for the mode; dense cosines are collected into `sims`."""
+    if mode == "lexical":
+        return _lexical_hits(res, query, k, filt)
+    dense = _dense_hits(res, x, k if mode == "dense" else max(k, k * HYBRID_OVERFETCH), filt)
+    sims.update(dense)
+    if mode == "dense":
+        return dense
+    return _fuse(dense, _lexical_hits(res, query, max(k, k * HYBRID_OVERFETCH), filt), k)
+
+def namespace_quotas_for_template(template: str | None) -> dict | None:
+    """Per-namespace quotas for a core.tone template ("sleep" -> sleep chunks)."""
+    if not NS_ROUTING or not template:
+        return None
+    return TEMPLATE_NAMESPACE_QUOTAS.get(template)
+
+def _apply_floor(hits: list, min_score: float | None, hit_min_score: float | None) -> list:
+    """
+    Drop hits whose similarity is below hit_min_score, and everything if the
+    best similarity is below min_score. Hits without a similarity (lexical
+    mode, or BM25-only hits in hybrid) are judged by the others.
+    """
+    if min_score is None:
+        min_score = RETRIEVAL_MIN_SCORE if RETRIEVAL_MIN_SCORE is not None else backend().min_similarity
+    if hit_min_score is None:
+        hit_min_score = RETRIEVAL_HIT_MIN_SCORE if RETRIEVAL_HIT_MIN_SCORE is not None else backend().hit_min_similarity
+    sims = [h["similarity"] for h in hits if h["similarity"] is not None]
+    if sims and max(sims) < min_score:
+        return []
+    return [h for h in hits if h["similarity"] is None or h["similarity"] >= hit_min_score]
+
+def _resolve_mode(res: Resources, mode: str | None) -> str:
+    mode = (mode or RETRIEVAL_MODE).lower()
+    if mode not in ("dense", "lexical", "hybrid"):
+        raise ValueError(f"Unknown retrieval mode: {mode!r}")
+    if mode != "dense" and res.bm25 is None:
+        if mode == "lexical":
+            raise RuntimeError(f"No BM25 index in {res.directory}; re-run scripts/ingest.py")
+        mode = "dense"
+    return mode
+
+def search(query: str, k=4, mode: str | None = None,
+           namespaces: list | None = None, quotas: dict | None = None,
+           min_score: float | None = None, hit_min_score: float | None = None):
+    """
+    Top-k chunks for `query`. `mode` overrides RETRIEVAL_MODE for this call.
+    Without a BM25 index, hybrid degrades to dense; lexical raises.
+
+    namespaces: only search chunks whose `ns` is in this list
+    quotas:     {ns: n} - take up to n hits from each listed namespace first,
+                then fill the remaining slots from the whole (filtered) index
+    min_score / hit_min_score: override RETRIEVAL_MIN_SCORE / RETRIEVAL_HIT_MIN_SCORE
+                (0 disables)
+
+    Each hit carries "score" (cosine for dense, BM25 for lexical, RRF for
+    hybrid) and "similarity" (query/chunk cosine, None if unknown). An empty
+    list means no chunk was similar enough to count as evidence.
+    """
+    return _search(resources(), query, k, mode, namespaces, quotas, min_score, hit_min_score)
+
+
+def _search(res: Resources, query: str, k, mode, namespaces, quotas, min_score, hit_min_score):
+    mode = _resolve_mode(res, mode)
+    x = embed(query) if mode != "lexical" else None
+    filt = res.namespace_filter(namespaces) if namespaces else None
+    sims = {}
+    if not quotas:
+        ranked = _ranked(res, query, x, k, mode, filt, sims)
+    else:
+        picked = {}
+        for ns, n in quotas.items():
+            if n <= 0 or len(picked) >= k or (namespaces and ns not in namespaces):
+                continue
+            for i, s in _ranked(res, query, x, min(n, k - len(picked)), mode, res.namespace_filter([ns]), sims):
+                picked.setdefault(i, s)
+        if len(picked) < k:
+            for i, s in _ranked(res, query, x, k + len(picked), mode, filt, sims):
+                if len(picked) >= k:
+                    break
+                picked.setdefault(i, s)
+        ranked = list(picked.items())[:k]
+    return _apply_floor(_rows(res, ranked, sims if mode != "lexical" else None), min_score, hit_min_score)
+
+
+def search_many(queries: list, k=4, mode: str | None = None, namespaces: list | None = None,
+                min_score: float | None = None, hit_min_score: float | None = None) -> list:
+    """
+    search() for a batch of queries (offline evaluation, audit-log replay):
+    one embeddings request for the uncached queries, one FAISS search over
+    the stacked query matrix, and each distinct result row decoded once.
+    Returns one hit list per query. Per-namespace quotas are not supported.
+    """
+    res = resources()
+    mode = _resolve_mode(res, mode)
+    if not queries:
+        return []
+
+    filt = res.namespace_filter(namespaces) if namespaces else None
+    depth = k if mode == "dense" else max(k, k * HYBRID_OVERFETCH)
+    dense = _dense_hits_many(res, embed_many(queries), depth, filt) if mode != "lexical" else None
+    if mode == "dense":
+        ranked = dense
+    else:
+        lexical = [_lexical_hits(res, q, depth if mode == "hybrid" else k, filt) for q in queries]
+        ranked = lexical if mode == "lexical" else [_fuse(d, l, k) for d, l in zip(dense, lexical)]
+
+    rows = res.chunks.rows_many(i for hits in ranked for i, _ in hits[:k])
+    for i, row in rows.items():
+        row["url"] = res.sources.get(row["source_id"], "")
+        row["row"] = i
+    out = []
+    for qi, hits in enumerate(ranked):
+        sims = dict(dense[qi]) if dense is not None else {}
+        out.append(_apply_floor([
+            {**rows[i], "score": s, "similarity": sims.get(i) if dense is not None else None}
+            for i, s in hits[:k]
+        ], min_score, hit_min_score))
+    return out
+
+
+def search_evidence(query: str, k=4, fetch_k: int | None = None, mode: str | None = None,
+                    namespaces: list | None = None, quotas: dict | None = None,
+                    token_budget: int | None = None, lambda_: float | None = None,
+                    with_query_vec: bool = False):
+    """
+    Evidence for compose(): search() over-fetches `fetch_k` candidates, then
+    core.evidence picks up to k diverse ones (MMR over the stored chunk
+    vectors) within the EVIDENCE token budget. Quota hits are pinned before
+    MMR fills the remaining slots, so they survive the re-ranking. Falls
+    back to rank order when the index has no vectors.f32 or the mode never
+    embeds the query.
+
+    with_query_vec=True returns (hits, query vector) so callers can reuse
+    the embedding; the vector is None when the mode never embeds the query.
+    """
+    from core import evidence
+    res = resources()
+    qvec = embed(query) if _resolve_mode(res, mode) != "lexical" else None  # _search() reuses it from the cache
+    if not evidence.EVIDENCE_MMR:
+        hits = _search(res, query, k, mode, namespaces, quotas, None, None)
+        hits = evidence.select_evidence(hits, k, quotas=quotas,
+                                        token_budget=evidence.EVIDENCE_TOKEN_BUDGET if token_budget is None else token_budget)
+    else:
+        fetch_k = max(k, fetch_k or evidence.EVIDENCE_FETCH_K)
+        hits = _search(res, query, fetch_k, mode, namespaces, quotas, None, None)
+        vecs = res.chunks.vectors[[h["row"] for h in hits]] if res.chunks.vectors is not None else None
+        hits = evidence.select_evidence(
+            hits, k, qvec if vecs is not None else None, vecs,
+            lambda_=evidence.EVIDENCE_MMR_LAMBDA if lambda_ is None else lambda_,
+            token_budget=evidence.EVIDENCE_TOKEN_BUDGET if token_budget is None else token_budget,
+            quotas=quotas,
+        )
+    return (hits, qvec) if with_query_vec else hits
+
+
+def warmup():
+    """Load the index, chunk store, BM25, sources and embedding client now."""
+    res = resources()
+    be = backend()
+    if be.remote:
+        _embed_cache()
+        getattr(be, "client", None)
+    return res
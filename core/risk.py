@@ -1,107 +1,177 @@
 #core/risk.py
 import re
+import json
+import hashlib
 from typing import Tuple, Optional, Dict, List
-from openai import OpenAI
 import os
-from dataclasses import dataclass
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from core.startup import timed_resource
+from core.cache import LRUCache, SQLiteStore, TieredCache, normalize_text
+from core.risk_patterns import RiskSignal, active_pack
+from core.lexicon import LexicalAnalysis, analyze
+from core.moderation import (
+    ModerationBackend, OpenAIModeration, LocalModeration, get_moderation_backend, local_model_available,
+)
 
-@dataclass
-class RiskSignal:
-    pattern: str
-    weight: float
-    matched_text: str
-    tier: int
+USE_LLM_MOD = True
+# MODERATION_TIMEOUT: seconds a classification waits for the moderation call
+# (counted from when it was started); MODERATION_WORKERS: concurrent calls
+MODERATION_TIMEOUT = float(os.getenv("MODERATION_TIMEOUT", "2.0"))
+MODERATION_WORKERS = int(os.getenv("MODERATION_WORKERS", "8"))
+# messages per moderation request in classify_many()
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", "32"))
+# MODERATION_FALLBACK=local: answer from the local model (if trained) when
+# a remote backend times out or fails ("" = no fallback)
+MODERATION_FALLBACK = os.getenv("MODERATION_FALLBACK", "local").strip().lower()
+# Moderation results by normalized message: MODERATION_CACHE=0 disables,
+# SIZE = entries in memory per worker, TTL in seconds, PATH = SQLite file
+# shared by all workers ("" keeps it in memory only)
+MODERATION_CACHE = os.getenv("MODERATION_CACHE", "1") != "0"
+MODERATION_CACHE_SIZE = int(os.getenv("MODERATION_CACHE_SIZE", "4096"))
+MODERATION_CACHE_TTL = float(os.getenv("MODERATION_CACHE_TTL", str(24 * 3600)))
+MODERATION_CACHE_PATH = os.getenv("MODERATION_CACHE_PATH", "storage/moderation_cache.sqlite")
+_backend = None
+_fallback = None
+_backend_loaded = False
+_mod_cache = None
+_pool = None
+_pool_lock = threading.Lock()
 
-# Tier 3: Crisis keywords
-CRISIS_PATTERNS = {
-    r"\b(?:kill|killing) (?:myself|me)\b": 1.0,
-    r"\bsuicid(?:e|al)\b": 1.0,
-    r"\bend my life\b": 1.0,
-    r"\btake my (?:own )?life\b": 0.95,
-    r"\boverdose\b": 0.95,
-    r"\bend (?:it all|everything|things)\b": 0.85,
-    r"\b(?:check|clock|tap) out\b": 0.80,
-    r"\b(?:end|stop) living\b": 0.90,
-    r"\b(?:not|no longer|don'?t) want to (?:live|be here|exist)\b": 0.85,
-    r"\bcan(?:not|'?t) go on(?: anymore| any longer)?\b": 0.80,
-    r"\bself[-\s]?harm(?:ing)?\b": 0.90,
-    r"\b(?:cut|cutting|hurt|hurting|harm|harming) (?:myself|me)\b": 0.85,
-    r"\bpainless (?:way|method|means)\b": 0.95,
-    r"\blethal (?:dose|method|amount)\b": 0.95,
-    r"\bhow (?:to|can I) (?:kill|end|overdose)\b": 0.90,
-    r"\bjump (?:off|from)\b": 0.75,
-    r"\b(?:wish|hope) I (?:was|were) dead\b": 0.80,
-    r"\bI don'?t care if I (?:live|die)\b": 0.75,
-    r"\bdo something (?:horrible|terrible|stupid|extreme)\b": 0.70,
-    r"\bmight (?:hurt|harm) myself\b": 0.80,
-}
+def moderation_backend() -> Optional[ModerationBackend]:
+    """The configured backend (None when off), built on first use."""
+    global _backend, _fallback, _backend_loaded
+    if not _backend_loaded:
+        with _pool_lock:
+            if not _backend_loaded:
+                # the HTTP timeout bounds the worker thread, not just the caller's wait
+                _backend = get_moderation_backend(timeout=max(1.0, MODERATION_TIMEOUT * 2))
+                if (MODERATION_FALLBACK == "local" and _backend is not None and _backend.remote
+                        and local_model_available()):
+                    _fallback = LocalModeration.load()
+                _backend_loaded = True
+    return _backend
 
-# Tier 2: Heightened anxiety
-HEIGHTENED_PATTERNS = {
-    r"\bpanic(?:king|ked| attack)?\b": 0.70,
-    r"\b(?:can'?t|cannot|unable) breathe\b": 0.75,
-    r"\boverwhelmed\b": 0.60,
-    r"\bshaking\b": 0.55,
-    r"\bbreathe\b": 0.50,
-    r"\blosing my mind\b": 0.65,
-    r"\bhopeless(?:ness)?\b": 0.70,
-    r"\bnumb\b": 0.60,
-    r"\b(?:can'?t|cannot) sleep\b": 0.50,
-    r"\bterrified\b": 0.65,
-    r"\bbreakdown\b": 0.70,
-    r"\bfail(?:ing)? (?:my|the) exam\b": 0.55,
-    r"\bextremely anxious\b": 0.65,
-    r"\bcompletely stressed\b": 0.55,
-}
+def warmup():
+    active_pack()
+    if USE_LLM_MOD:
+        be = moderation_backend()
+        if isinstance(be, OpenAIModeration):
+            be.client
 
-# Tier 1: Normal anxiety
-NORMAL_PATTERNS = {
-    r"\banxious\b": 0.40,
-    r"\bstressed\b": 0.35,
-    r"\bworried\b": 0.35,
-    r"\bnervous\b": 0.40,
-    r"\bexam\b": 0.30,
-    r"\btest\b": 0.30,
-    r"\bstudy(?:ing)?\b": 0.35,
-    r"\bhello\b": 0.90,
-}
+def _moderate(msg: str) -> Tuple[bool, float]:
+    """One moderation request; raises on API errors."""
+    return moderation_backend().moderate(msg)
 
-# Sarcasm detection
-NEGATION_PATTERNS = [
-    r"\bnot (?:really|actually|seriously)\b",
-    r"\bjust kidding\b",
-    r"\bjk\b",
-    r"\blol\b",
-    r"\bhaha\b",
-    r"\bjust joking\b",
-    r"\bsarcasm\b",
-]
+def _moderation_cache() -> TieredCache:
+    global _mod_cache
+    if _mod_cache is None:
+        with _pool_lock:
+            if _mod_cache is None:
+                with timed_resource("risk.moderation_cache"):
+                    _mod_cache = TieredCache(
+                        LRUCache(MODERATION_CACHE_SIZE, ttl=MODERATION_CACHE_TTL),
+                        SQLiteStore(MODERATION_CACHE_PATH, table="moderation", ttl=MODERATION_CACHE_TTL)
+                        if MODERATION_CACHE_PATH else None,
+                        encode=lambda v: json.dumps(v).encode("utf-8"),
+                        decode=lambda b: tuple(json.loads(b)),
+                    )
+    return _mod_cache
 
-USE_LLM_MOD = True
-_client: Optional[OpenAI] = None
+def _moderation_key(msg: str) -> str:
+    return moderation_backend().key + ":" + hashlib.sha1(normalize_text(msg).encode("utf-8")).hexdigest()
 
-def _llm_flags_crisis(msg: str) -> Tuple[bool, float]:
-    global _client
-    if not USE_LLM_MOD:
-        return False, 0.0
-    if _client is None:
-        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    try:
-        mod = _client.moderations.create(model="omni-moderation-latest", input=msg)
-        result = mod.results[0]
-        cat = result.categories
-        scores = result.category_scores
-        is_flagged = bool(getattr(cat, "self_harm", False) or getattr(cat, "violence", False))
-        self_harm_score = getattr(scores, "self_harm", 0.0)
-        violence_score = getattr(scores, "violence", 0.0)
-        llm_confidence = max(self_harm_score, violence_score)
-        return is_flagged, llm_confidence
-    except Exception:
-        return False, 0.0
+def moderation_cache_stats() -> Dict:
+    if not MODERATION_CACHE:
+        return {"enabled": False}
+    return {"enabled": True, **_moderation_cache().stats()}
+
+def _moderation_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=MODERATION_WORKERS, thread_name_prefix="moderation")
+    return _pool
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+class ModerationCall:
+    """
+    A moderation request started with start_moderation(). Remote backends
+    run in the background (and are cached); the local model answers inline.
+    """
+
+    def __init__(self, msg: str):
+        self.msg = msg
+        self.started = time.perf_counter()
+        self.future: Optional[Future] = None
+        self.answer: Optional[Tuple[bool, float]] = None
+        self.cached = False
+        self.key = None
+        self.backend = moderation_backend() if USE_LLM_MOD else None
+        if self.backend is None:
+            return
+        if not self.backend.remote:
+            # microseconds in-process: cheaper than a cache lookup
+            self.answer = self.backend.moderate(msg)
+            return
+        if MODERATION_CACHE:
+            self.key = _moderation_key(msg)
+            self.answer = _moderation_cache().get(self.key)
+            self.cached = self.answer is not None
+        if self.answer is None:
+            self.future = _moderation_pool().submit(_moderate, msg)
+
+    def _failed(self, status: Dict) -> Tuple[bool, float, Dict]:
+        status["latency_ms"] = _elapsed_ms(self.started)
+        if _fallback is None:
+            return False, 0.0, status
+        flagged, conf = _fallback.moderate(self.msg)
+        status["fallback"] = _fallback.name
+        return flagged, conf, status
+
+    def result(self, timeout: Optional[float] = None) -> Tuple[bool, float, Dict]:
+        """
+        (flagged, confidence, status). Waits until `timeout` seconds after the
+        call was started; a timeout or API error is reported in status
+        ("timeout" / "error"). The answer then comes from the local fallback
+        model if there is one, else it is flagged=False, confidence 0.0.
+        """
+        if self.backend is None:
+            return False, 0.0, {"status": "disabled"}
+        if self.answer is not None:
+            flagged, conf = self.answer
+            status = {"status": "ok", "backend": self.backend.name, "latency_ms": _elapsed_ms(self.started)}
+            if self.cached:
+                status["cached"] = True
+            return flagged, conf, status
+        timeout = MODERATION_TIMEOUT if timeout is None else timeout
+        remaining = max(0.0, timeout - (time.perf_counter() - self.started))
+        try:
+            flagged, conf = self.future.result(timeout=remaining)
+        except FutureTimeout:
+            return self._failed({"status": "timeout", "backend": self.backend.name, "timeout_s": timeout})
+        except Exception as e:
+            return self._failed({"status": "error", "backend": self.backend.name,
+                                 "error": f"{e.__class__.__name__}: {e}"[:200]})
+        if self.key is not None:
+            # only real answers are cached, never timeouts or errors
+            _moderation_cache().set(self.key, (bool(flagged), float(conf)))
+        self.answer = (flagged, conf)
+        return flagged, conf, {"status": "ok", "backend": self.backend.name, "latency_ms": _elapsed_ms(self.started)}
 
-def detect_sarcasm(msg: str) -> bool:
+def start_moderation(msg: str) -> ModerationCall:
+    """Start the moderation call now so it overlaps with the rest of the request."""
+    return ModerationCall(msg)
+
+# reference implementations (one re.search / re.finditer per pattern); the
+# matcher is checked against them by scripts/check_risk_matcher.py
+def detect_sarcasm(msg: str, patterns: Optional[List[str]] = None) -> bool:
     m = msg.lower()
-    for pattern in NEGATION_PATTERNS:
+    for pattern in (active_pack().negations if patterns is None else patterns):
         if re.search(pattern, m):
             return True
     return False
@@ -161,29 +231,104 @@ def calculate_tier_scores(tier1_signals: List[RiskSignal],
     
     return scores
 
-def classify_tier_with_confidence(msg: str) -> Tuple[int, float, Dict]:
+def classify_tier_with_confidence(msg: str, moderation: Optional[ModerationCall] = None,
+                                  lex: Optional[LexicalAnalysis] = None) -> Tuple[int, float, Dict]:
     """
     SIMPLIFIED: Confidence = Score of the assigned tier
     
     Returns: (tier, confidence, details)
+
+    `moderation` is a call already started with start_moderation(msg);
+    otherwise one is started here. Either way the patterns are scanned
+    while it runs, and its status (ok / timeout / error / disabled) and
+    latency end up in details["moderation"]. `lex` is the message's
+    lexicon.analyze() result when the caller already has it (shared with tone).
     
     Confidence interpretation:
     - High score (0.7-1.0) = Strong match with this tier
     - Medium score (0.4-0.7) = Moderate match
     - Low score (0.0-0.4) = Weak match, uncertain
     """
-    m = msg.strip().lower()
-    
-    # Detect sarcasm
-    sarcasm_detected = detect_sarcasm(msg)
-    
-    # Extract signals
-    tier3_signals = extract_signals(msg, CRISIS_PATTERNS, tier=3)
-    tier2_signals = extract_signals(msg, HEIGHTENED_PATTERNS, tier=2)
-    tier1_signals = extract_signals(msg, NORMAL_PATTERNS, tier=1)
+    if moderation is None:
+        moderation = start_moderation(msg)
+
+    # Extract signals and detect sarcasm in one pass (one pack for the whole message)
+    if lex is None:
+        lex = analyze(msg)
+    pack = lex.pack
+    signals, sarcasm_detected = pack.matcher.scan_text(lex.text, lex.matches)
     
-    # Get LLM signal
-    llm_flagged, llm_confidence = _llm_flags_crisis(msg)
+    # Get LLM signal (bounded by MODERATION_TIMEOUT)
+    llm_flagged, llm_confidence, moderation_status = moderation.result()
+
+    return _decide(signals, sarcasm_detected, llm_flagged, llm_confidence, moderation_status, pack.version)
+
+def classify_many(messages: List[str]) -> List[Tuple[int, float, Dict]]:
+    """
+    classify_tier_with_confidence() for many messages: the pattern engine
+    runs over all of them, then moderation goes out as batched list inputs
+    (see moderate_many). Same (tier, confidence, details) per message.
+    """
+    messages = list(messages)
+    pack = active_pack()
+    scans = [pack.matcher.scan(m) for m in messages]
+    mods = moderate_many(messages)
+    return [_decide(signals, sarcasm, *mod, pack.version) for (signals, sarcasm), mod in zip(scans, mods)]
+
+def _moderate_batch(backend: ModerationBackend, texts: List[str]) -> Tuple[Optional[List], Dict]:
+    started = time.perf_counter()
+    try:
+        return backend.moderate_many(texts), {"status": "ok", "backend": backend.name,
+                                              "batch": len(texts), "latency_ms": _elapsed_ms(started)}
+    except Exception as e:
+        return None, {"status": "error", "backend": backend.name, "batch": len(texts),
+                      "error": f"{e.__class__.__name__}: {e}"[:200], "latency_ms": _elapsed_ms(started)}
+
+def moderate_many(messages: List[str]) -> List[Tuple[bool, float, Dict]]:
+    """
+    (flagged, confidence, status) per message. For a remote backend, cached
+    answers are reused, the remaining distinct messages are sent
+    MODERATION_BATCH_SIZE at a time (up to MODERATION_WORKERS requests in
+    flight), and a failed batch falls back like a single call does.
+    """
+    backend = moderation_backend() if USE_LLM_MOD else None
+    if backend is None:
+        return [(False, 0.0, {"status": "disabled"}) for _ in messages]
+    if not backend.remote:
+        return [(f, c, {"status": "ok", "backend": backend.name}) for f, c in backend.moderate_many(messages)]
+
+    keys = [_moderation_key(m) for m in messages]
+    answers: Dict[str, Tuple[bool, float, Dict]] = {}
+    if MODERATION_CACHE:
+        cache = _moderation_cache()
+        for k in dict.fromkeys(keys):
+            hit = cache.get(k)
+            if hit is not None:
+                answers[k] = (hit[0], hit[1], {"status": "ok", "backend": backend.name, "cached": True})
+    pending: Dict[str, str] = {}
+    for k, m in zip(keys, messages):
+        if k not in answers:
+            pending.setdefault(k, m)
+    todo = list(pending.items())
+    batches = [todo[i:i + MODERATION_BATCH_SIZE] for i in range(0, len(todo), MODERATION_BATCH_SIZE)]
+    results = _moderation_pool().map(lambda b: _moderate_batch(backend, [m for _, m in b]), batches)
+    for batch, (out, status) in zip(batches, results):
+        for (k, m), ans in zip(batch, out or [None] * len(batch)):
+            if ans is not None:
+                answers[k] = (bool(ans[0]), float(ans[1]), status)
+                if MODERATION_CACHE:
+                    _moderation_cache().set(k, (bool(ans[0]), float(ans[1])))
+            elif _fallback is not None:
+                flagged, conf = _fallback.moderate(m)
+                answers[k] = (flagged, conf, {**status, "fallback": _fallback.name})
+            else:
+                answers[k] = (False, 0.0, status)
+    return [answers[k] for k in keys]
+
+def _decide(signals: Dict[int, List[RiskSignal]], sarcasm_detected: bool, llm_flagged: bool,
+            llm_confidence: float, moderation_status: Dict, pattern_pack: str) -> Tuple[int, float, Dict]:
+    """Tier, confidence and details from the pattern signals and the moderation answer."""
+    tier3_signals, tier2_signals, tier1_signals = signals[3], signals[2], signals[1]
     
     # Calculate scores for all tiers
     tier_scores = calculate_tier_scores(
@@ -232,11 +377,14 @@ def classify_tier_with_confidence(msg: str) -> Tuple[int, float, Dict]:
             for s in primary_signals
         ],
         "signal_count": len(primary_signals),
+        "tier_signal_counts": {t: len(signals[t]) for t in (3, 2, 1)},
         "sarcasm_detected": sarcasm_detected,
         "llm_flagged": llm_flagged,
         "llm_confidence": llm_confidence,
+        "moderation": moderation_status,
         "reasoning": reasoning,
         "tier_scores": tier_scores,
+        "pattern_pack": pattern_pack,
     }
     
     return assigned_tier, confidence, details
@@ -268,6 +416,8 @@ def print_classification_report(msg: str):
         print("\n⚠️  Sarcasm detected")
     if details['llm_flagged']:
         print(f"\n⚠️  LLM flagged (conf: {details['llm_confidence']:.3f})")
+    if details['moderation']['status'] not in ("ok", "disabled"):
+        print(f"\n⚠️  Moderation {details['moderation']['status']}: LLM signal missing")
     
     print(f"\n💡 Interpretation:")
     print(f"   Confidence = Tier {tier} score = {confidence:.0%}")
@@ -280,7 +430,9 @@ def print_classification_report(msg: str):
     print(f"{'='*70}\n")
 
 if __name__ == "__main__":
-    test_cases = [
+    # python -m core.risk "message" ...   (bulk: scripts/score_risk.py)
+    import sys
+    test_cases = sys.argv[1:] or [
         "I want to kill myself",
         "I just want to kill myself lol jk",
         "I am panicking about my exam tomorrow",
@@ -0,0 +1,381 @@
+#core/risk_patterns.py
+
+"""
+Risk pattern packs: the regexes and weights behind core/risk.py.
+
+A pack is a YAML (or JSON) file under data/risk_patterns/ with a `version`,
+per-tier {regex: weight} maps and a list of sarcasm/negation regexes (see
+data/risk_patterns/default.yaml). load_pack() validates a file and compiles
+it into a SignalMatcher once; classification only ever reads the active
+pack, which activate() swaps in with a single reference assignment, so a
+request sees either the old or the new pack, never a mix.
+
+The active pack's file name is kept in data/risk_patterns/CURRENT (written
+atomically by activate(), e.g. via POST /admin/risk-patterns/reload). Other
+workers notice a changed CURRENT within RISK_PATTERNS_WATCH_SECS and compile
+the new pack in a background thread before swapping it in.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import yaml
+
+from core.startup import timed_resource
+
+try:
+    from re import _parser as _sre_parse, _constants as _sre_const  # Python 3.11+
+except ImportError:
+    import sre_parse as _sre_parse, sre_constants as _sre_const
+
+PATTERN_DIR = "data/risk_patterns"
+CURRENT_FILE = "CURRENT"
+# RISK_PATTERN_PACK: pack used when CURRENT doesn't exist (file name in PATTERN_DIR)
+DEFAULT_PACK = os.getenv("RISK_PATTERN_PACK", "default.yaml")
+# RISK_PATTERNS_WATCH_SECS: how often a worker checks CURRENT (0 = only at startup / via activate)
+RISK_PATTERNS_WATCH_SECS = float(os.getenv("RISK_PATTERNS_WATCH_SECS", "5"))
+PACK_EXTENSIONS = (".yaml", ".yml", ".json")
+TIERS = (3, 2, 1)
+
+
+class PatternPackError(ValueError):
+    """A pattern pack that can't be used (missing fields, bad regex or weight)."""
+
+
+@dataclass
+class RiskSignal:
+    pattern: str
+    weight: float
+    matched_text: str
+    tier: int
+
+
+# ------------------------------------------------------------------
+# compiled matcher: literal prefilter + per-pattern regex confirm
+# ------------------------------------------------------------------
+
+# characters that IGNORECASE matches against ASCII letters but str.lower()
+# leaves alone; folded only for the prefilter so it never misses a match
+_PREFILTER_FOLD = str.maketrans({"\u0131": "i", "\u017f": "s"})
+
+
+def _required_literals(seq) -> Optional[Set[str]]:
+    """
+    Literals at least one of which occurs in every match of the parsed
+    pattern (lowercased), preferring the set whose shortest literal is
+    longest. None if no such set can be derived.
+    """
+    options, run = [], []
+
+    def flush():
+        if run:
+            options.append({"".join(run).lower()})
+            run.clear()
+
+    for op, av in seq:
+        if op is _sre_const.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is _sre_const.AT:  # \b etc. are zero-width, the run continues
+            continue
+        flush()
+        sub = None
+        if op is _sre_const.SUBPATTERN:
+            sub = _required_literals(av[-1])
+        elif op is _sre_const.BRANCH:
+            subs = [_required_literals(b) for b in av[1]]
+            sub = set().union(*subs) if all(subs) else None
+        elif op in (_sre_const.MAX_REPEAT, _sre_const.MIN_REPEAT) and av[0] >= 1:
+            sub = _required_literals(av[2])
+        if sub:
+            options.append(sub)
+    flush()
+    return max(options, key=lambda o: min(map(len, o))) if options else None
+
+
+@dataclass
+class _CompiledPattern:
+    pattern: str
+    weight: float
+    tier: int
+    regex: "re.Pattern"
+    literals: Optional[Set[str]]  # None = always confirm
+
+
+class SignalMatcher:
+    """
+    Risk and sarcasm patterns compiled once. scan() lowercases the message
+    once, checks each pattern's required literals with a substring test and
+    runs only the regexes whose literals occur, in the same order (and with
+    the same flags) as risk.extract_signals() / risk.detect_sarcasm(), so
+    the signals are identical.
+    """
+
+    def __init__(self, tiers: Dict[int, Dict[str, float]], negations: List[str]):
+        self.patterns: List[_CompiledPattern] = []
+        for tier, patterns in tiers.items():
+            for pattern, weight in patterns.items():
+                self.patterns.append(self._compile(pattern, weight, tier, re.IGNORECASE))
+        self.negations = [self._compile(pattern, 0.0, 0, 0) for pattern in negations]
+        self.tiers = list(tiers)
+        self.literals = sorted({l for c in self.patterns + self.negations for l in (c.literals or ())})
+        self._patterns_by_literal = self._index(self.patterns)
+        self._negations_by_literal = self._index(self.negations)
+
+    @staticmethod
+    def _index(compiled: List[_CompiledPattern]) -> Tuple[Dict[str, Tuple[int, ...]], Tuple[int, ...]]:
+        """({literal: positions of the patterns it admits}, positions always confirmed)."""
+        by_literal: Dict[str, List[int]] = {}
+        for i, c in enumerate(compiled):
+            for l in c.literals or ():
+                by_literal.setdefault(l, []).append(i)
+        always = tuple(i for i, c in enumerate(compiled) if c.literals is None)
+        return {l: tuple(ix) for l, ix in by_literal.items()}, always
+
+    @staticmethod
+    def _compile(pattern: str, weight: float, tier: int, flags: int) -> _CompiledPattern:
+        return _CompiledPattern(pattern, weight, tier, re.compile(pattern, flags),
+                                _required_literals(_sre_parse.parse(pattern, flags)))
+
+    def _present(self, m: str) -> Set[str]:
+        folded = m.translate(_PREFILTER_FOLD)
+        return {l for l in self.literals if l in folded}
+
+    @staticmethod
+    def _candidates(index, compiled: List[_CompiledPattern], present: Set[str]) -> List[_CompiledPattern]:
+        """Patterns admitted by the present literals, in pack order."""
+        by_literal, always = index
+        pos = set(always)
+        for l in present:
+            pos.update(by_literal.get(l, ()))
+        return [compiled[i] for i in sorted(pos)]
+
+    def scan(self, msg: str) -> Tuple[Dict[int, List[RiskSignal]], bool]:
+        """({tier: [RiskSignal]}, sarcasm_detected) for one message."""
+        m = msg.lower()
+        return self.scan_text(m, self._present(m))
+
+    def scan_text(self, m: str, present: Set[str]) -> Tuple[Dict[int, List[RiskSignal]], bool]:
+        """
+        scan() for an already lowercased message whose literals were found
+        elsewhere (core/lexicon.py); `present` must cover self.literals.
+        """
+        signals: Dict[int, List[RiskSignal]] = {t: [] for t in self.tiers}
+        for c in self._candidates(self._patterns_by_literal, self.patterns, present):
+            for match in c.regex.finditer(m):
+                signals[c.tier].append(RiskSignal(pattern=c.pattern, weight=c.weight,
+                                                  matched_text=match.group(0), tier=c.tier))
+        sarcasm = any(c.regex.search(m) for c in self._candidates(self._negations_by_literal, self.negations, present))
+        return signals, sarcasm
+
+
+@dataclass
+class PatternPack:
+    name: str
+    version: str
+    path: str
+    tiers: Dict[int, Dict[str, float]]
+    negations: List[str]
+    matcher: SignalMatcher
+    description: str = ""
+    loaded_at: float = field(default_factory=time.time)
+    compile_ms: float = 0.0
+
+    def info(self) -> Dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "description": self.description,
+            "path": self.path,
+            "patterns": {t: len(p) for t, p in self.tiers.items()},
+            "negations": len(self.negations),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+            "compile_ms": self.compile_ms,
+        }
+
+
+def validate_pack(data, source: str = "pack") -> Tuple[str, Dict[int, Dict[str, float]], List[str]]:
+    """(version, tiers, negations) from parsed pack data; raises PatternPackError."""
+    if not isinstance(data, dict):
+        raise PatternPackError(f"{source}: expected a mapping at the top level")
+    version = data.get("version")
+    if not isinstance(version, (str, int, float)) or not str(version).strip():
+        raise PatternPackError(f"{source}: missing `version`")
+    raw_tiers = data.get("tiers")
+    if not isinstance(raw_tiers, dict):
+        raise PatternPackError(f"{source}: missing `tiers` mapping")
+    try:
+        raw_tiers = {int(t): p for t, p in raw_tiers.items()}
+    except (TypeError, ValueError):
+        raise PatternPackError(f"{source}: tier keys must be {', '.join(map(str, TIERS))}")
+    if set(raw_tiers) != set(TIERS):
+        raise PatternPackError(f"{source}: `tiers` must have exactly the keys {', '.join(map(str, TIERS))}")
+    tiers: Dict[int, Dict[str, float]] = {}
+    for t in TIERS:  # crisis first, like the signal order in risk_details
+        patterns = raw_tiers[t] or {}
+        if not isinstance(patterns, dict):
+            raise PatternPackError(f"{source}: tier {t} must map regex -> weight")
+        tiers[t] = {}
+        for pattern, weight in patterns.items():
+            where = f"{source}: tier {t} pattern {pattern!r}"
+            if not isinstance(pattern, str) or not pattern:
+                raise PatternPackError(f"{where}: not a string")
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not 0 < weight <= 1:
+                raise PatternPackError(f"{where}: weight must be in (0, 1], got {weight!r}")
+            try:
+                re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise PatternPackError(f"{where}: {e}")
+            tiers[t][pattern] = float(weight)
+    negations = data.get("negations") or []
+    if not isinstance(negations, list):
+        raise PatternPackError(f"{source}: `negations` must be a list")
+    for pattern in negations:
+        if not isinstance(pattern, str) or not pattern:
+            raise PatternPackError(f"{source}: negation {pattern!r}: not a string")
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise PatternPackError(f"{source}: negation {pattern!r}: {e}")
+    return str(version), tiers, list(negations)
+
+
+def load_pack(path: str) -> PatternPack:
+    """Read, validate and compile a pack file."""
+    t0 = time.perf_counter()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f) if path.endswith(".json") else yaml.safe_load(f)
+    except OSError as e:
+        raise PatternPackError(f"{path}: {e.strerror or e}")
+    except (ValueError, yaml.YAMLError) as e:
+        raise PatternPackError(f"{path}: not valid {'JSON' if path.endswith('.json') else 'YAML'} ({e})")
+    version, tiers, negations = validate_pack(data, os.path.basename(path))
+    matcher = SignalMatcher(tiers, negations)
+    return PatternPack(
+        name=os.path.basename(path), version=version, path=path, tiers=tiers, negations=negations,
+        matcher=matcher, description=str(data.get("description") or ""),
+        compile_ms=round((time.perf_counter() - t0) * 1000, 2),
+    )
+
+
+def pack_path(name: str, pattern_dir: str = PATTERN_DIR) -> str:
+    """Path of a pack by file name; names can't leave the pattern dir."""
+    if not name or os.path.basename(name) != name or not name.endswith(PACK_EXTENSIONS):
+        raise PatternPackError(f"Invalid pack name {name!r} (a {'/'.join(PACK_EXTENSIONS)} file in {pattern_dir})")
+    return os.path.join(pattern_dir, name)
+
+
+def list_packs(pattern_dir: str = PATTERN_DIR) -> List[str]:
+    if not os.path.isdir(pattern_dir):
+        return []
+    return sorted(f for f in os.listdir(pattern_dir) if f.endswith(PACK_EXTENSIONS))
+
+
+def current_name(pattern_dir: str = PATTERN_DIR) -> str:
+    try:
+        with open(os.path.join(pattern_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        if name:
+            return name
+    except FileNotFoundError:
+        pass
+    return DEFAULT_PACK
+
+
+def _current_mtime(pattern_dir: str = PATTERN_DIR) -> Optional[float]:
+    try:
+        return os.stat(os.path.join(pattern_dir, CURRENT_FILE)).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+# ------------------------------------------------------------------
+# active pack
+# ------------------------------------------------------------------
+
+_ACTIVE: Optional[PatternPack] = None
+_ACTIVE_MTIME: Optional[float] = None
+_LOCK = threading.Lock()
+_next_check = 0.0
+_refreshing = False
+
+
+def active_pack() -> PatternPack:
+    """The pack every classification reads; loaded on first use."""
+    global _ACTIVE, _ACTIVE_MTIME
+    pack = _ACTIVE
+    if pack is None:
+        with _LOCK:
+            if _ACTIVE is None:
+                with timed_resource("risk.pattern_pack"):
+                    _ACTIVE_MTIME = _current_mtime()
+                    _ACTIVE = load_pack(pack_path(current_name()))
+            pack = _ACTIVE
+    elif RISK_PATTERNS_WATCH_SECS > 0:
+        _maybe_refresh()
+    return pack
+
+
+def _maybe_refresh():
+    """If CURRENT changed, compile the new pack in the background (never on the request)."""
+    global _next_check, _refreshing
+    now = time.monotonic()
+    if now < _next_check or _refreshing:
+        return
+    _next_check = now + RISK_PATTERNS_WATCH_SECS
+    mtime = _current_mtime()
+    if mtime == _ACTIVE_MTIME:
+        return
+    _refreshing = True
+
+    def run():
+        global _refreshing
+        try:
+            reload_pack()
+        except PatternPackError as e:
+            print(f"Warning: risk pattern pack not reloaded: {e}")
+        finally:
+            _refreshing = False
+
+    threading.Thread(target=run, name="risk-pattern-reload", daemon=True).start()
+
+
+def reload_pack(name: Optional[str] = None) -> Dict:
+    """Compile `name` (default: CURRENT) and swap it in; the old pack keeps serving on errors."""
+    global _ACTIVE, _ACTIVE_MTIME
+    mtime = _current_mtime()
+    pack = load_pack(pack_path(name or current_name()))  # outside the lock: compile cost
+    with _LOCK:
+        previous = _ACTIVE
+        _ACTIVE = pack
+        _ACTIVE_MTIME = mtime
+    return {"version": pack.version, "name": pack.name,
+            "previous": previous.version if previous else None, "compile_ms": pack.compile_ms}
+
+
+def activate(name: str, pattern_dir: str = PATTERN_DIR) -> Dict:
+    """
+    Validate and compile pack `name`, make it this worker's active pack and
+    record it in CURRENT (atomic rename) for the other workers and restarts.
+    """
+    global _ACTIVE_MTIME
+    out = reload_pack(name)
+    tmp = os.path.join(pattern_dir, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+    os.replace(tmp, os.path.join(pattern_dir, CURRENT_FILE))
+    with _LOCK:
+        _ACTIVE_MTIME = _current_mtime(pattern_dir)
+    return out
+
+
+def pack_info() -> Dict:
+    pack = active_pack()
+    return {"active": pack.info(), "current": current_name(), "available": list_packs(),
+            "watch_secs": RISK_PATTERNS_WATCH_SECS}
@@ -0,0 +1,200 @@
+#core/risk_state.py
+
+"""
+Per-user rolling risk state, so risk can be judged across turns without
+re-reading conversation history.
+
+Each user has a small record: exponentially decayed sums of the per-message
+tier scores and signal counts (half-life RISK_STATE_HALF_LIFE seconds), the
+turn count, the last tier and when crisis language was last seen. observe()
+folds one classified turn into it in O(1): decay by the time since the last
+update, add the new turn, write it back. Records live in a SQLite table
+shared by all workers and each update is one BEGIN IMMEDIATE transaction
+(core.cache.SQLiteStore.update), so concurrent turns from the same user on
+different workers can't overwrite each other; there is deliberately no
+per-worker cache in front of it. With RISK_STATE_PATH empty the state is
+kept in a per-worker LRU instead.
+
+assess() turns the state into a tier floor for the current turn:
+- a crisis turn within RISK_STATE_CRISIS_WINDOW seconds keeps later turns at
+  tier 2 or above, even when they sound calm;
+- sustained heightened distress (decayed tier-2 score >= RISK_STATE_ESCALATION)
+  on a turn that is itself tier 2 escalates it to tier 3, so "overwhelmed"
+  -> "numb" -> "hopeless" over a few turns is treated as a crisis. One tier-2
+  message scores 0.33-0.7 in calculate_tier_scores (about 0.5 for a single
+  signal), so the default 1.2 takes roughly three tier-2 turns in a row.
+The state is always updated with the message's own tier, never the floor,
+so floors don't feed back into themselves.
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional
+
+from core.cache import LRUCache, SQLiteStore
+from core.startup import timed_resource
+
+# RISK_STATE=0 disables; HALF_LIFE in seconds; TTL: idle seconds before a
+# user's state is forgotten; CACHE_SIZE: users kept per worker when
+# RISK_STATE_PATH is empty (no shared store)
+RISK_STATE = os.getenv("RISK_STATE", "1") != "0"
+RISK_STATE_PATH = os.getenv("RISK_STATE_PATH", "storage/risk_state.sqlite")
+RISK_STATE_HALF_LIFE = float(os.getenv("RISK_STATE_HALF_LIFE", "1800"))
+RISK_STATE_TTL = float(os.getenv("RISK_STATE_TTL", str(7 * 24 * 3600)))
+RISK_STATE_CACHE_SIZE = int(os.getenv("RISK_STATE_CACHE_SIZE", "10000"))
+# floors: seconds a crisis turn keeps the user at tier >= 2; decayed tier-2
+# score at which a tier-2 turn is escalated to tier 3 (0 disables)
+RISK_STATE_CRISIS_WINDOW = float(os.getenv("RISK_STATE_CRISIS_WINDOW", "3600"))
+RISK_STATE_ESCALATION = float(os.getenv("RISK_STATE_ESCALATION", "1.2"))
+
+_TIERS = ("1", "2", "3")  # string keys: the record round-trips through JSON
+
+
+@dataclass
+class RiskState:
+    scores: Dict[str, float] = field(default_factory=lambda: {t: 0.0 for t in _TIERS})
+    signals: Dict[str, float] = field(default_factory=lambda: {t: 0.0 for t in _TIERS})
+    turns: int = 0
+    last_tier: Optional[int] = None
+    last_crisis_at: Optional[float] = None
+    updated_at: Optional[float] = None
+
+    def decayed(self, now: float, half_life: float = RISK_STATE_HALF_LIFE) -> "RiskState":
+        """Copy with scores and signal counts decayed to `now`."""
+        f = 1.0
+        if self.updated_at is not None and half_life > 0:
+            f = 0.5 ** (max(0.0, now - self.updated_at) / half_life)
+        return RiskState(
+            scores={t: v * f for t, v in self.scores.items()},
+            signals={t: v * f for t, v in self.signals.items()},
+            turns=self.turns, last_tier=self.last_tier,
+            last_crisis_at=self.last_crisis_at, updated_at=now,
+        )
+
+
+def update(state: RiskState, tier: int, tier_scores: Dict, signal_counts: Dict, now: float) -> RiskState:
+    """Fold one classified turn into the state (decay, then add)."""
+    s = state.decayed(now)
+    for t in _TIERS:
+        s.scores[t] += float(tier_scores.get(int(t), tier_scores.get(t, 0.0)) or 0.0)
+        s.signals[t] += float(signal_counts.get(int(t), signal_counts.get(t, 0)) or 0)
+    s.turns += 1
+    s.last_tier = tier
+    if tier == 3:
+        s.last_crisis_at = now
+    return s
+
+
+def assess(state: RiskState, tier: int, now: float) -> Dict[str, Any]:
+    """Tier floor for the current turn from the (already updated) state."""
+    floor, reasons = 1, []
+    if (state.last_crisis_at is not None and tier < 3
+            and now - state.last_crisis_at <= RISK_STATE_CRISIS_WINDOW):
+        floor = max(floor, 2)
+        reasons.append("recent_crisis")
+    if RISK_STATE_ESCALATION > 0 and tier == 2 and state.scores["2"] >= RISK_STATE_ESCALATION:
+        floor = 3
+        reasons.append("sustained_distress")
+    return {"floor": floor, "reasons": reasons}
+
+
+class RiskStateStore:
+    _LOCK_STRIPES = 64
+
+    def __init__(self, path: Optional[str] = RISK_STATE_PATH):
+        self.store = SQLiteStore(path, table="risk_state", ttl=RISK_STATE_TTL) if path else None
+        self.memory = LRUCache(RISK_STATE_CACHE_SIZE, ttl=RISK_STATE_TTL)
+        # one user's turns are serialised within a worker; SQLite's write
+        # lock serialises them across workers
+        self._locks = [threading.Lock() for _ in range(self._LOCK_STRIPES)]
+
+    def _lock(self, user_id: str) -> threading.Lock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+    @staticmethod
+    def _encode(state: RiskState) -> bytes:
+        return json.dumps(asdict(state)).encode("utf-8")
+
+    @staticmethod
+    def _decode(blob: Optional[bytes]) -> RiskState:
+        return RiskState(**json.loads(blob)) if blob else RiskState()
+
+    def get(self, user_id: str) -> RiskState:
+        if self.store is not None:
+            return self._decode(self.store.get(user_id))
+        return self.memory.get(user_id) or RiskState()
+
+    def _apply(self, user_id: str, fn) -> RiskState:
+        """Read-modify-write one user's state atomically; returns the new state."""
+        with self._lock(user_id):
+            if self.store is not None:
+                out = {}
+
+                def step(blob: Optional[bytes]) -> bytes:
+                    out["state"] = fn(self._decode(blob))
+                    return self._encode(out["state"])
+
+                if self.store.update(user_id, step) is not None:
+                    self.memory.set(user_id, out["state"])  # only read if SQLite fails
+                    return out["state"]
+                # SQLite unavailable: judge this turn on what this worker
+                # last saw rather than failing the request
+            state = fn(self.memory.get(user_id) or RiskState())
+            self.memory.set(user_id, state)
+            return state
+
+    def observe(self, user_id: str, tier: int, details: Dict, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Record one classified turn and return the summary stored in
+        risk_details["conversation"]: the tier floor, why, and the decayed state.
+        """
+        now = time.time() if now is None else now
+        state = self._apply(user_id, lambda s: update(
+            s, tier, details.get("tier_scores") or {}, details.get("tier_signal_counts") or {}, now))
+        out = assess(state, tier, now)
+        out.update({
+            "turns": state.turns,
+            "scores": {t: round(v, 3) for t, v in state.scores.items()},
+            "signals": {t: round(v, 2) for t, v in state.signals.items()},
+            "last_crisis_s": round(now - state.last_crisis_at) if state.last_crisis_at is not None else None,
+        })
+        return out
+
+    def reset(self, user_id: str):
+        self._apply(user_id, lambda s: RiskState())
+
+    def stats(self) -> Dict[str, Any]:
+        out = {"enabled": RISK_STATE, "memory": self.memory.stats()}
+        if self.store is not None:
+            out["persistent"] = self.store.stats()
+        return out
+
+
+_STORE: Optional[RiskStateStore] = None
+_store_lock = threading.Lock()
+
+
+def risk_state_store() -> RiskStateStore:
+    global _STORE
+    if _STORE is None:
+        with _store_lock:
+            if _STORE is None:
+                with timed_resource("risk_state.store"):
+                    _STORE = RiskStateStore()
+    return _STORE
+
+
+def observe(user_id: str, tier: int, details: Dict) -> Optional[Dict[str, Any]]:
+    """risk_state_store().observe(), or None when RISK_STATE=0."""
+    if not RISK_STATE:
+        return None
+    return risk_state_store().observe(user_id, tier, details)
+
+
+def risk_state_stats() -> Dict[str, Any]:
+    if not RISK_STATE:
+        return {"enabled": False}
+    return risk_state_store().stats()
@@ -25,9 +25,13 @@ class RiskDetails(BaseModel):
     sarcasm_detected: bool
     llm_flagged: bool
     llm_confidence: float
+    moderation: Optional[Dict] = None  # status: ok | timeout | error | disabled
     reasoning: str
     tier_scores: Optional[Dict[int, float]] = None
     alternative_tiers: Optional[Dict] = None
+    pattern_pack: Optional[str] = None  # version of the risk pattern pack used
+    tier_signal_counts: Optional[Dict[int, int]] = None  # signals per tier (not only the primary ones)
+    conversation: Optional[Dict] = None  # per-user rolling risk state (core/risk_state.py)
 
 class ToneAnalysis(BaseModel):
     """Tone and emotional cue analysis"""
@@ -57,6 +61,7 @@ class ReviewListItem(BaseModel):
     citations: Optional[str] = None
     reviewed: bool  
     label: Optional[str] = None
+    crisis: Optional[bool] = None  # reviewer's judgment of the user message (None = not judged)
     rating_empathy: Optional[int] = None
     rating_factual: Optional[int] = None
     human_notes: Optional[str] = None
@@ -65,7 +70,8 @@ class ReviewListItem(BaseModel):
 
 class ReviewUpdate(BaseModel):  
     reviewed: Optional[bool] = None
-    label: Optional[str] = None
+    label: Optional[str] = None  # grades the reply: safe | unsafe | low_empathy | hallucination
+    crisis: Optional[bool] = None  # is the user in crisis? (trains the local moderation model)
     rating_empathy: Optional[int] = None
     rating_factual: Optional[int] = None
     human_notes: Optional[str] = None
\ No newline at end of file
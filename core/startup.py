@@ -0,0 +1,78 @@
+#core/startup.py
+
+"""
+Startup-time bookkeeping.
+
+Core modules import nothing heavy at module level; indexes, API clients and
+LangChain objects are created lazily behind accessors that record their load
+time here via `timed_resource`. `warmup()` touches all of them up front (the
+FastAPI lifespan hook calls it) and `startup_report()` returns the timings,
+plus any resource that fell back to a degraded stand-in (`record_fallback`).
+"""
+
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+_LOCK = threading.Lock()
+_REPORT: Dict = {"imports": {}, "resources": {}, "fallbacks": {}, "warmup": {}}
+
+
+def time_imports(modules: Iterable[str]) -> Dict[str, float]:
+    """Import modules in order, recording seconds spent in each (first import only)."""
+    out = {}
+    for name in modules:
+        t0 = time.perf_counter()
+        importlib.import_module(name)
+        out[name] = time.perf_counter() - t0
+    with _LOCK:
+        _REPORT["imports"].update(out)
+    return out
+
+
+@contextmanager
+def timed_resource(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _LOCK:
+            _REPORT["resources"][name] = time.perf_counter() - t0
+
+
+def record_fallback(name: str, reason: str):
+    """Note that resource `name` loaded a degraded stand-in, and why."""
+    with _LOCK:
+        _REPORT["fallbacks"][name] = reason
+
+
+def warmup(components: Iterable[str] = ("retriever", "evidence", "composer", "risk")) -> Dict:
+    """
+    Eagerly create the lazy resources of core.<component> by calling its
+    warmup(). Failures are recorded rather than raised so a missing index
+    doesn't stop the API from serving the endpoints that don't need it.
+    """
+    results = {}
+    t_all = time.perf_counter()
+    for comp in components:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(f"core.{comp}").warmup()
+            results[comp] = {"ok": True, "seconds": time.perf_counter() - t0}
+        except Exception as e:
+            results[comp] = {"ok": False, "seconds": time.perf_counter() - t0, "error": repr(e)}
+    with _LOCK:
+        _REPORT["warmup"] = {"components": results, "total_seconds": time.perf_counter() - t_all}
+    return results
+
+
+def startup_report() -> Dict:
+    with _LOCK:
+        return {
+            "imports": dict(_REPORT["imports"]),
+            "resources": dict(_REPORT["resources"]),
+            "fallbacks": dict(_REPORT["fallbacks"]),
+            "warmup": dict(_REPORT["warmup"]),
+        }
@@ -1,13 +1,15 @@
 #core/tone.py
 
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from core.lexicon import GENERIC_STRESS, TONE_CUES, LexicalAnalysis, analyze
 
 
 def _lower(s: str) -> str:
     return (s or "").lower()
 
 
-def analyze_tone_and_cues(msg: str) -> Dict:
+def analyze_tone_and_cues(msg: str, lex: Optional[LexicalAnalysis] = None) -> Dict:
     """
     Analyze the user message for emotional cues and return:
       - empathy_level: 1 (low) to 3 (high)
@@ -15,83 +17,27 @@ def analyze_tone_and_cues(msg: str) -> Dict:
       - template: which response template to prefer
                   ("panic" | "sleep" | "self_talk" | "generic")
 
-    Rule-based, fully explainable.
+    Rule-based, fully explainable. The cue terms live in core/lexicon.py;
+    pass the message's lexicon.analyze() result as `lex` to reuse the scan
+    risk classification already did.
     """
-    m = _lower(msg)
+    found = (lex or analyze(msg)).exact
     cues: List[str] = []
     empathy = 1
 
-    # ---- Cue buckets ----
-
-    # Panic / overwhelm / acute stress
-    panic_terms = [
-        "panic", "panicking", "panic attack",
-        "overwhelmed", "overwhelming",
-        "shaking", "heart is racing",
-        "can't breathe", "cannot breathe",
-        "freaking out", "losing my mind", "lose my mind",
-        "breakdown", "meltdown",
-    ]
-    if any(t in m for t in panic_terms):
-        cues.append("panic/overwhelm")
-        empathy = max(empathy, 3)
-
-    # Sleep / exhaustion / insomnia
-    sleep_terms = [
-        "can't sleep", "cannot sleep", "insomnia",
-        "haven't slept", "no sleep",
-        "stayed up all night", "awake all night",
-        "exhausted", "drained",
-    ]
-    if any(t in m for t in sleep_terms):
-        cues.append("sleep/insomnia")
-        empathy = max(empathy, 2)
-
-    # Negative self-talk / low self-worth
-    self_talk_terms = [
-        "hopeless", "worthless", "numb",
-        "i'm a failure", "im a failure",
-        "i am a failure",
-        "i'm so dumb", "im so dumb",
-        "i'm stupid", "im stupid",
-        "i hate myself",
-    ]
-    if any(t in m for t in self_talk_terms):
-        cues.append("negative_self_talk")
-        empathy = max(empathy, 3)
-
-    # General exam anxiety (milder but relevant)
-    exam_terms = [
-        "exam", "finals", "midterm", "test",
-        "grade", "gpa",
-        "study stress", "too much to study",
-        "so much to study",
-        "failed before", "failed last time",
-    ]
-    if any(t in m for t in exam_terms):
-        cues.append("exam_stress")
-        empathy = max(empathy, 2)
+    for cue, level, terms in TONE_CUES:
+        if not found.isdisjoint(terms):
+            cues.append(cue)
+            empathy = max(empathy, level)
 
     # If no strong cues at all but message is clearly stressy
-    generic_stress_terms = [
-        "stressed", "anxious", "anxiety",
-        "nervous", "worried", "worrying",
-    ]
-    if not cues and any(t in m for t in generic_stress_terms):
-        cues.append("general_stress")
-        empathy = max(empathy, 2)
+    cue, level, terms = GENERIC_STRESS
+    if not cues and not found.isdisjoint(terms):
+        cues.append(cue)
+        empathy = max(empathy, level)
 
-    # ---- Choose template based on strongest cue family ----
     # Priority order: panic > sleep > negative self-talk > generic
-    template = "generic"
-    if any("panic" in c for c in cues):
-        template = "panic"
-    elif any("sleep" in c for c in cues):
-        template = "sleep"
-    elif any("negative_self_talk" in c for c in cues):
-        template = "self_talk"
-    else:
-        template = "generic"
+    template = choose_template(cues, empathy)
 
     # Clamp empathy within [1, 3]
     empathy = min(max(empathy, 1), 3)
@@ -116,8 +62,7 @@ def empathy_level(msg: str) -> int:
 
 def choose_template(cues: List[str], empathy_level: int) -> str:
     """
-    Small helper so we can override / tweak template choice if needed.
-    Currently just mirrors the logic in analyze_tone_and_cues.
+    Template for the strongest cue family (used by analyze_tone_and_cues).
     """
     if any("panic" in c for c in cues):
         return "panic"
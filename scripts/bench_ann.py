@@ -0,0 +1,111 @@
+#scripts/bench_ann.py
+
+"""
+Recall / latency / memory benchmark for the FAISS index types in core/ann.py.
+
+    python scripts/bench_ann.py                          # corpus vectors, EMBED_BACKEND
+    python scripts/bench_ann.py --synthetic 100000       # clustered random vectors
+    python scripts/bench_ann.py --types flat,ivf,hnsw --nprobe 1,4,16 --ef-search 16,64
+
+Ground truth is exact flat search. For each index type (and each nprobe /
+efSearch setting) it reports recall@k against flat, single-query QPS,
+batched QPS, build time and serialized index size.
+"""
+
+import argparse, json, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.ann import INDEX_TYPES, build_index, index_nbytes, search_parameters
+
+
+def synthetic_vectors(n: int, d: int, n_clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, d)).astype("float32")
+    X = centers[rng.integers(0, n_clusters, n)] + 0.35 * rng.standard_normal((n, d)).astype("float32")
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def corpus_vectors(path: str, backend_name: str | None) -> np.ndarray:
+    from core.embeddings import get_backend
+    with open(path, "r", encoding="utf-8") as f:
+        texts = [json.loads(line)["text"] for line in f if line.strip()]
+    return get_backend(backend_name).embed_many(texts)
+
+
+def recall_at_k(I: np.ndarray, gt: np.ndarray) -> float:
+    k = gt.shape[1]
+    found = sum(len(set(a[a >= 0]) & set(b[b >= 0])) for a, b in zip(I, gt))
+    return found / float(gt.size) if k else 0.0
+
+
+def bench_one(index, Q, k, params, gt, single_queries):
+    t0 = time.perf_counter()
+    _, I = index.search(Q, k, params=params)
+    batch_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for q in Q[:single_queries]:
+        index.search(q.reshape(1, -1), k, params=params)
+    single_s = time.perf_counter() - t0
+    n_single = min(single_queries, len(Q))
+    return {
+        f"recall@{k}": recall_at_k(I, gt),
+        "qps_single": n_single / single_s if single_s else 0.0,
+        "qps_batch": len(Q) / batch_s if batch_s else 0.0,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--types", default=",".join(INDEX_TYPES))
+    ap.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the corpus")
+    ap.add_argument("--dim", type=int, default=256, help="dimension for --synthetic")
+    ap.add_argument("--corpus", default="data/corpus.jsonl")
+    ap.add_argument("--backend", default=None, help="embedding backend for corpus vectors")
+    ap.add_argument("--queries", type=int, default=200, help="number of query vectors")
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--nprobe", default="1,4,16", help="comma-separated sweep for ivf/ivfpq")
+    ap.add_argument("--ef-search", default="16,64,128", help="comma-separated sweep for hnsw")
+    ap.add_argument("--single", type=int, default=200, help="queries timed one at a time")
+    args = ap.parse_args(argv)
+
+    if args.synthetic:
+        X = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        X = corpus_vectors(args.corpus, args.backend)
+    # queries: perturbed database vectors, so every query has real neighbours
+    rng = np.random.default_rng(1)
+    Q = X[rng.integers(0, len(X), args.queries)] + 0.05 * rng.standard_normal((args.queries, X.shape[1])).astype("float32")
+    Q = np.ascontiguousarray(Q / np.linalg.norm(Q, axis=1, keepdims=True), dtype="float32")
+    k = min(args.k, len(X))
+
+    flat, _ = build_index(X, "flat")
+    _, gt = flat.search(Q, k)
+
+    print(f"vectors={len(X)} dim={X.shape[1]} queries={len(Q)} k={k}")
+    header = f"{'type':<7}{'knob':<14}{'recall@'+str(k):>10}{'qps_1':>12}{'qps_batch':>12}{'build_s':>10}{'size_MB':>10}"
+    print(header)
+    print("-" * len(header))
+    for t in args.types.split(","):
+        t0 = time.perf_counter()
+        index, params = build_index(X, t)
+        build_s = time.perf_counter() - t0
+        size_mb = index_nbytes(index) / 1e6
+        if t in ("ivf", "ivfpq"):
+            sweep = [("nprobe", int(v)) for v in args.nprobe.split(",") if int(v) <= params["nlist"]] or [("nprobe", params["nlist"])]
+        elif t == "hnsw":
+            sweep = [("efSearch", int(v)) for v in args.ef_search.split(",")]
+        else:
+            sweep = [("-", None)]
+        for knob, val in sweep:
+            sp = search_parameters(t, nprobe=val if knob == "nprobe" else None,
+                                   ef_search=val if knob == "efSearch" else None)
+            r = bench_one(index, Q, k, sp, gt, args.single)
+            label = f"{knob}={val}" if val is not None else "-"
+            print(f"{t:<7}{label:<14}{r['recall@'+str(k)]:>10.3f}{r['qps_single']:>12.0f}"
+                  f"{r['qps_batch']:>12.0f}{build_s:>10.2f}{size_mb:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
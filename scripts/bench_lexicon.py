@@ -0,0 +1,69 @@
+#scripts/bench_lexicon.py
+
+"""
+Time the shared lexical pass (core/lexicon.py) against separate risk and
+tone scans.
+
+    python scripts/bench_lexicon.py [--repeat 200] [--seed 0]
+
+Microseconds per message for risk scan + tone analysis done separately
+(matcher.scan + the pre-lexicon tone analysis) vs one shared pass (analyze +
+scan_text + analyze_tone_and_cues), for typical chat turns, generated
+(vocabulary-dense) short messages and long ones. That the two give the same
+results is checked by scripts/check_lexicon.py.
+
+Measured gain is small: about 1.1-1.2x on typical chat turns and on long
+messages, and vocabulary-dense short messages are slightly slower (0.9x).
+That is well short of the hoped-for halving of text-analysis CPU; most of
+the time goes to the risk regexes and Python call overhead, not to the
+repeated lowercase/substring scans the shared pass removes.
+"""
+
+import argparse, os, random, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import risk
+from scripts.bench_risk import timed
+from scripts.check_risk_matcher import corpus_texts, make_cases
+from scripts.check_lexicon import baseline_tone, shared, tone_cases
+
+# typical turns, for the "chat" timing row
+CHAT_TURNS = [
+    "hello",
+    "I have my chemistry exam tomorrow and I'm so stressed I can't sleep",
+    "how should I plan my revision for finals?",
+    "I feel overwhelmed and numb, nothing helps",
+    "I'm panicking, my heart is racing and I can't breathe",
+    "what are some good breathing exercises",
+    "i failed last time and I'm worried it will happen again",
+    "I feel hopeless lol jk not really",
+    "Can you help me make a study schedule for the next two weeks? I have three midterms.",
+    "I don't think I can do this anymore, I'm a failure",
+]
+
+
+def separate(pack, msg):
+    return pack.matcher.scan(msg), baseline_tone(msg)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Microbenchmark for the shared lexical pass.")
+    ap.add_argument("--repeat", type=int, default=200, help="timing repetitions per message set")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    pack = risk.active_pack()
+    texts = corpus_texts()
+    short = make_cases(25, random.Random(args.seed + 1), []) + tone_cases(25, random.Random(args.seed + 2))
+    long = [" ".join(texts[i % len(texts)] for i in range(j, j + 12)) + " " + m
+            for j, m in enumerate(short[:20])] if texts else [m * 40 for m in short[:20]]
+    print(f"{'messages':<10}{'avg_chars':>10}{'separate_us':>13}{'shared_us':>11}{'speedup':>9}")
+    for name, msgs in (("chat", CHAT_TURNS), ("short", short), ("long", long)):
+        old = timed(lambda m: separate(pack, m), msgs, args.repeat)
+        new = timed(shared, msgs, args.repeat)
+        avg = sum(map(len, msgs)) / len(msgs)
+        print(f"{name:<10}{avg:>10.0f}{old:>13.1f}{new:>11.1f}{old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
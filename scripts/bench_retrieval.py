@@ -0,0 +1,102 @@
+#scripts/bench_retrieval.py
+
+"""
+Compare dense, lexical and hybrid retrieval on a small labelled query set.
+
+    python scripts/bench_retrieval.py [--k 4] [--repeat 20] [--queries my_queries.jsonl]
+
+Each query line is {"query": "...", "relevant": ["CHUNK_ID", ...]}.
+Reports hit@k, MRR and recall@k for relevance, and p50/p95 latency per mode.
+The first (cold) dense call per query pays the embedding round-trip; later
+repeats are served from the query-embedding cache, so both are reported.
+batch_ms_q is the per-query cost of running the whole set through
+retriever.search_many (one embedding request, one matrix search).
+"""
+
+import argparse, json, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_QUERIES = [
+    {"query": "can't sleep before finals", "relevant": ["APA_SLEEP_1", "APA_SLEEP_2", "APA_S_3"]},
+    {"query": "I keep panicking in the middle of the exam", "relevant": ["TEST_1", "CBT_3", "CBT_4"]},
+    {"query": "how do I plan my study schedule", "relevant": ["APA_TIPS_2", "APA_S_2", "TIME_1", "STUDY_1"]},
+    {"query": "breathing exercise to calm down", "relevant": ["WHO_2", "CBT_4", "MIND_1"]},
+    {"query": "grounding technique 5-4-3-2-1", "relevant": ["WHO_1", "CBT_3"]},
+    {"query": "what should I eat before an exam", "relevant": ["NUT_1"]},
+    {"query": "does exercise help anxiety", "relevant": ["EXER_1", "NIH_STRESS_2"]},
+    {"query": "I feel alone, who can I talk to", "relevant": ["SOCIAL_1", "CDC_LIVE_2"]},
+    {"query": "negative thoughts I'm going to fail", "relevant": ["CBT_1"]},
+    {"query": "when is anxiety a real problem", "relevant": ["APA_A_1", "WHO_AX_1", "CDC_LIVE_3"]},
+    {"query": "track my mood", "relevant": ["MOOD_1"]},
+    {"query": "crisis hotline number", "relevant": ["CDC_HELP_1", "CDC_HELP_2", "CRISIS_1"]},
+    {"query": "too much caffeine studying late", "relevant": ["APA_S_3"]},
+    {"query": "best way to memorize for a test", "relevant": ["STUDY_1"]},
+]
+
+
+def _pct(xs, p):
+    return float(np.percentile(xs, p)) if xs else 0.0
+
+
+def run(queries, k, repeat, modes):
+    from core import retriever
+
+    report = {}
+    for mode in modes:
+        hit, rr, rec = [], [], []
+        cold, warm = [], []
+        for q in queries:
+            relevant = set(q["relevant"])
+            for r in range(repeat):
+                t0 = time.perf_counter()
+                hits = retriever.search(q["query"], k=k, mode=mode)
+                dt = (time.perf_counter() - t0) * 1000.0
+                (cold if r == 0 else warm).append(dt)
+            ids = [h["id"] for h in hits]
+            found = [i for i, cid in enumerate(ids) if cid in relevant]
+            hit.append(1.0 if found else 0.0)
+            rr.append(1.0 / (found[0] + 1) if found else 0.0)
+            rec.append(len(found) / len(relevant))
+        # the same queries through search_many: one embed call + one matrix search
+        batch = []
+        for r in range(repeat):
+            t0 = time.perf_counter()
+            retriever.search_many([q["query"] for q in queries], k=k, mode=mode)
+            batch.append((time.perf_counter() - t0) * 1000.0 / max(1, len(queries)))
+        report[mode] = {
+            f"hit@{k}": float(np.mean(hit)),
+            "mrr": float(np.mean(rr)),
+            f"recall@{k}": float(np.mean(rec)),
+            "cold_p50_ms": _pct(cold, 50),
+            "warm_p50_ms": _pct(warm, 50),
+            "warm_p95_ms": _pct(warm, 95),
+            "batch_ms_q": _pct(batch[1:] or batch, 50),
+        }
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--queries", default=None, help="JSONL with query/relevant fields")
+    ap.add_argument("--modes", default="dense,lexical,hybrid")
+    args = ap.parse_args(argv)
+
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+
+    report = run(queries, args.k, max(1, args.repeat), args.modes.split(","))
+    cols = list(next(iter(report.values())).keys())
+    print(f"{'mode':<8}" + "".join(f"{c:>14}" for c in cols))
+    for mode, row in report.items():
+        print(f"{mode:<8}" + "".join(f"{row[c]:>14.3f}" for c in cols))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#scripts/bench_risk.py
+
+"""
+Time the compiled risk matcher against the per-pattern reference.
+
+    python scripts/bench_risk.py [--repeat 200] [--seed 0] [--pack data/risk_patterns/new.yaml]
+
+Microseconds per message for short chat turns and for long (journal-length)
+messages, reference vs matcher. That both return the same signals is
+checked by scripts/check_risk_matcher.py.
+"""
+
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import risk
+from core.risk_patterns import load_pack
+from scripts.check_risk_matcher import corpus_texts, make_cases, reference
+
+
+def timed(fn, msgs, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for m in msgs:
+            fn(m)
+    return (time.perf_counter() - t0) / (repeat * len(msgs)) * 1e6
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Microbenchmark for the risk matcher.")
+    ap.add_argument("--repeat", type=int, default=200, help="timing repetitions per message set")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--pack", default=None, help="pattern pack file to time instead of the active one")
+    args = ap.parse_args(argv)
+
+    pack = load_pack(args.pack) if args.pack else risk.active_pack()
+    print(f"pattern pack {pack.name} (version {pack.version}, compiled in {pack.compile_ms} ms)")
+
+    texts = corpus_texts()
+    short = make_cases(50, random.Random(args.seed + 1), [])
+    long = [" ".join(texts[i % len(texts)] for i in range(j, j + 12)) + " " + m
+            for j, m in enumerate(short[:20])] if texts else [m * 40 for m in short[:20]]
+    print(f"\n{'messages':<10}{'avg_chars':>10}{'reference_us':>14}{'matcher_us':>12}{'speedup':>9}")
+    for name, msgs in (("short", short), ("long", long)):
+        ref = timed(lambda m: reference(pack, m), msgs, args.repeat)
+        new = timed(pack.matcher.scan, msgs, args.repeat)
+        avg = sum(map(len, msgs)) / len(msgs)
+        print(f"{name:<10}{avg:>10.0f}{ref:>14.1f}{new:>12.1f}{ref / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
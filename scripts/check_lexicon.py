@@ -0,0 +1,142 @@
+#scripts/check_lexicon.py
+
+"""
+Check that the shared lexical pass (core/lexicon.py) gives the same risk
+signals and tone analysis as scanning the message separately.
+
+    python scripts/check_lexicon.py [--cases 20000] [--seed 0]
+
+Risk: the signals and sarcasm flag taken from the shared match table must
+equal the per-pattern reference (extract_signals / detect_sarcasm).
+
+Tone: analyze_tone_and_cues(msg, lex) must equal baseline_tone(), which is
+analyze_tone_and_cues() as it was before the cue terms moved into
+core/lexicon.py, with its own literal term lists. A term dropped or changed
+in lexicon.TONE_CUES therefore shows up as a mismatch; the generated
+messages are built from those baseline lists, and every baseline term is
+also checked on its own.
+
+Any mismatch is printed and the script exits non-zero. Timing lives in
+scripts/bench_lexicon.py.
+"""
+
+import argparse, os, random, sys
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import risk, tone
+from core.lexicon import analyze
+from scripts.check_risk_matcher import corpus_texts, make_cases, mutate, reference
+
+# ---- baseline tone analysis (core/tone.py before the shared lexicon) ----
+
+PANIC_TERMS = [
+    "panic", "panicking", "panic attack",
+    "overwhelmed", "overwhelming",
+    "shaking", "heart is racing",
+    "can't breathe", "cannot breathe",
+    "freaking out", "losing my mind", "lose my mind",
+    "breakdown", "meltdown",
+]
+SLEEP_TERMS = [
+    "can't sleep", "cannot sleep", "insomnia",
+    "haven't slept", "no sleep",
+    "stayed up all night", "awake all night",
+    "exhausted", "drained",
+]
+SELF_TALK_TERMS = [
+    "hopeless", "worthless", "numb",
+    "i'm a failure", "im a failure",
+    "i am a failure",
+    "i'm so dumb", "im so dumb",
+    "i'm stupid", "im stupid",
+    "i hate myself",
+]
+EXAM_TERMS = [
+    "exam", "finals", "midterm", "test",
+    "grade", "gpa",
+    "study stress", "too much to study",
+    "so much to study",
+    "failed before", "failed last time",
+]
+GENERIC_STRESS_TERMS = [
+    "stressed", "anxious", "anxiety",
+    "nervous", "worried", "worrying",
+]
+BASELINE_TERMS = PANIC_TERMS + SLEEP_TERMS + SELF_TALK_TERMS + EXAM_TERMS + GENERIC_STRESS_TERMS
+
+
+def baseline_tone(msg: str) -> Dict:
+    m = (msg or "").lower()
+    cues: List[str] = []
+    empathy = 1
+
+    if any(t in m for t in PANIC_TERMS):
+        cues.append("panic/overwhelm")
+        empathy = max(empathy, 3)
+    if any(t in m for t in SLEEP_TERMS):
+        cues.append("sleep/insomnia")
+        empathy = max(empathy, 2)
+    if any(t in m for t in SELF_TALK_TERMS):
+        cues.append("negative_self_talk")
+        empathy = max(empathy, 3)
+    if any(t in m for t in EXAM_TERMS):
+        cues.append("exam_stress")
+        empathy = max(empathy, 2)
+    if not cues and any(t in m for t in GENERIC_STRESS_TERMS):
+        cues.append("general_stress")
+        empathy = max(empathy, 2)
+
+    template = "generic"
+    if any("panic" in c for c in cues):
+        template = "panic"
+    elif any("sleep" in c for c in cues):
+        template = "sleep"
+    elif any("negative_self_talk" in c for c in cues):
+        template = "self_talk"
+
+    empathy = min(max(empathy, 1), 3)
+    return {"empathy_level": empathy, "cues": cues, "template": template}
+
+
+# ---- cases ----
+
+def tone_cases(n, rnd):
+    noise = ["I", "so", "my", "latest", "examples", "testing", "grades", "ı'm", "ſo", "...", "!"]
+    return [" ".join(mutate(rnd.choice(BASELINE_TERMS), rnd) if rnd.random() < 0.5 else rnd.choice(noise)
+                     for _ in range(rnd.randint(1, 12)))
+            for _ in range(n)]
+
+
+def separate(pack, msg):
+    return reference(pack, msg), baseline_tone(msg)
+
+
+def shared(msg):
+    lex = analyze(msg)
+    return lex.pack.matcher.scan_text(lex.text, lex.matches), tone.analyze_tone_and_cues(msg, lex)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Equivalence check for the shared lexical pass.")
+    ap.add_argument("--cases", type=int, default=20000, help="generated messages")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    pack = risk.active_pack()
+    rnd = random.Random(args.seed)
+    cases = ([f"I feel {t} today" for t in BASELINE_TERMS]
+             + make_cases(args.cases // 2, rnd, corpus_texts()) + tone_cases(args.cases // 2, rnd))
+    bad = 0
+    for msg in cases:
+        want, got = separate(pack, msg), shared(msg)
+        if got != want:
+            bad += 1
+            if bad <= 10:
+                print(f"MISMATCH {msg!r}\n  shared:   {got}\n  separate: {want}")
+    print(f"equivalence: {len(cases)} messages, {bad} mismatches (pattern pack {pack.version})")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
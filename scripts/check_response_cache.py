@@ -0,0 +1,69 @@
+#scripts/check_response_cache.py
+
+"""
+Check that a tier-1 /chat turn in lexical retrieval mode never embeds.
+
+    python scripts/check_response_cache.py
+
+RETRIEVAL_MODE=lexical is the no-API mode, so the response-cache lookup must
+reuse retrieval's query vector (there is none) instead of embedding the
+message itself. The embedding backend is replaced by one that fails the
+check when called; compose() returns a canned reply so no LLM is needed.
+Runs ChatContext the way app.chat does, twice, and exits non-zero if
+anything embedded, the turn didn't get a reply, or the cache was not
+bypassed as "no_query_vector".
+"""
+
+import json, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import index_store
+
+os.environ["RETRIEVAL_MODE"] = "lexical"
+os.environ.setdefault("MODERATION_BACKEND", "off")
+os.environ.setdefault("RISK_STATE", "0")
+os.environ.setdefault("WARMUP", "0")
+# load the index with the backend it was built with (its check still runs in lexical mode)
+with open(os.path.join(index_store.current_dir(), index_store.META_FILE), "r", encoding="utf-8") as f:
+    os.environ.setdefault("EMBED_BACKEND", json.load(f)["embedding"]["backend"])
+
+from core import pipeline, retriever
+from core.response_cache import RESPONSE_CACHE_STORE
+
+MESSAGE = "how should I plan my revision for finals?"
+CALLS = []
+
+
+def no_embedding(*args, **kwargs):
+    CALLS.append(args)
+    raise AssertionError("embeddings API called in lexical mode")
+
+
+def main():
+    if retriever.resources().bm25 is None:
+        print("No BM25 index; run scripts/ingest.py first")
+        return 1
+    be = retriever.backend()
+    be.embed_many = no_embedding
+    retriever.embed = no_embedding
+    pipeline.compose = lambda message, hits, *a, **kw: ("canned reply [WHO]", [("[WHO]", "")])
+
+    failures = 0
+    for turn in (1, 2):
+        ctx = pipeline.ChatContext(f"check-response-cache-{os.getpid()}", MESSAGE).start()
+        tier = ctx.risk[0]
+        hits = ctx.hits
+        text = ctx.reply[0] if tier == 1 and hits else None
+        print(f"turn {turn}: tier {tier}, {len(hits)} hits, retrieval {ctx.retrieval_status}, reply {text!r}")
+        if tier != 1 or not hits or text is None:
+            failures += 1
+    bypassed = RESPONSE_CACHE_STORE.stats()["bypassed"].get("no_query_vector", 0)
+    print(f"embedding calls: {len(CALLS)}; cache bypassed (no_query_vector): {bypassed}")
+    if CALLS or bypassed != 2:
+        failures += 1
+    print(f"\n{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
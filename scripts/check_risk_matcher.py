@@ -0,0 +1,104 @@
+#scripts/check_risk_matcher.py
+
+"""
+Differential check of the compiled risk matcher against the per-pattern reference.
+
+    python scripts/check_risk_matcher.py [--cases 20000] [--seed 0] [--pack data/risk_patterns/new.yaml]
+
+The active pattern pack's matcher (default: the pack in
+data/risk_patterns/CURRENT, or --pack, e.g. a new pack before activating it)
+must return exactly the signals (pattern, weight, matched text, tier,
+order) and sarcasm flag of extract_signals() / detect_sarcasm() for every
+generated message: phrases built from the pattern vocabulary, corpus text,
+case and Unicode edge cases (Kelvin sign, long s, dotless i) and near
+misses. Any mismatch is printed and the script exits non-zero, so a pack or
+matcher change can be gated on it. Timing lives in scripts/bench_risk.py.
+"""
+
+import argparse, json, os, random, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import risk
+from core.risk_patterns import load_pack
+
+CORPUS = "data/corpus.jsonl"
+
+VOCAB = [
+    "kill myself", "killing me", "suicide", "suicidal", "end my life", "take my own life", "overdose",
+    "end it all", "check out", "tap out", "stop living", "don't want to live", "no longer want to exist",
+    "can't go on anymore", "cannot go on any longer", "self-harm", "self harm", "selfharming", "cut myself",
+    "hurting me", "painless way", "lethal dose", "how can I end", "jump off", "wish I were dead",
+    "I dont care if I die", "do something stupid", "might harm myself", "panic", "panicking", "panic attack",
+    "can't breathe", "unable breathe", "overwhelmed", "shaking", "breathe", "losing my mind", "hopelessness",
+    "numb", "cant sleep", "terrified", "breakdown", "failing the exam", "fail my exam", "extremely anxious",
+    "completely stressed", "anxious", "stressed", "worried", "nervous", "exam", "exams", "test", "testing",
+    "study", "studying", "hello", "not really", "not seriously", "just kidding", "jk", "lol", "haha",
+    "just joking", "sarcasm", "killjoy", "suicidally", "endless", "numbness", "hellos", "skill myself",
+]
+NOISE = ["I", "am", "so", "really", "tomorrow", "and", "but", "my", "the", "about", "today", "friend",
+         "K", "ſ", "ı", "İ", "K", "S", "I'M", "can't", "...", "!", "?", "\n", "-", "'"]
+
+
+def corpus_texts():
+    if not os.path.exists(CORPUS):
+        return []
+    with open(CORPUS, "r", encoding="utf-8") as f:
+        return [json.loads(l)["text"] for l in f if l.strip()]
+
+
+def mutate(phrase, rnd):
+    r = rnd.random()
+    if r < 0.2:
+        return phrase.upper()
+    if r < 0.3:
+        return phrase.title()
+    if r < 0.4:
+        # Unicode characters that IGNORECASE folds onto ASCII letters
+        return phrase.replace("k", "K").replace("s", "ſ").replace("i", "ı")
+    if r < 0.5 and len(phrase) > 3:
+        i = rnd.randrange(1, len(phrase) - 1)
+        return phrase[:i] + rnd.choice(["", " ", "-", "x"]) + phrase[i + 1:]
+    return phrase
+
+
+def make_cases(n, rnd, texts):
+    cases = ["", " ", "I want to kill myself", "I just want to kill myself lol jk",
+             "I am panicking about my exam tomorrow", "KILL MYſELF", "ı'm ſtreſſed"]
+    for _ in range(n):
+        words = [mutate(rnd.choice(VOCAB), rnd) if rnd.random() < 0.4 else rnd.choice(NOISE)
+                 for _ in range(rnd.randint(1, 25))]
+        if texts and rnd.random() < 0.2:
+            words.insert(rnd.randrange(len(words) + 1), rnd.choice(texts))
+        cases.append(rnd.choice([" ", " ", "", ", "]).join(words))
+    return cases
+
+
+def reference(pack, msg):
+    signals = {t: risk.extract_signals(msg, patterns, tier=t) for t, patterns in pack.tiers.items()}
+    return signals, risk.detect_sarcasm(msg, pack.negations)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Differential check for the risk matcher.")
+    ap.add_argument("--cases", type=int, default=20000, help="generated messages")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--pack", default=None, help="pattern pack file to check instead of the active one")
+    args = ap.parse_args(argv)
+
+    pack = load_pack(args.pack) if args.pack else risk.active_pack()
+    print(f"pattern pack {pack.name} (version {pack.version}, compiled in {pack.compile_ms} ms)")
+
+    cases = make_cases(args.cases, random.Random(args.seed), corpus_texts())
+    bad = 0
+    for msg in cases:
+        got, want = pack.matcher.scan(msg), reference(pack, msg)
+        if got != want:
+            bad += 1
+            if bad <= 10:
+                print(f"MISMATCH {msg!r}\n  matcher:   {got}\n  reference: {want}")
+    print(f"differential: {len(cases)} messages, {bad} mismatches")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#scripts/check_risk_state.py
+
+"""
+Check the per-user rolling risk state (core/risk_state.py).
+
+    python scripts/check_risk_state.py
+
+Runs against throwaway SQLite files and exits non-zero on any failure:
+- escalation: "overwhelmed" -> "numb" -> "hopeless", classified by the real
+  risk classifier a minute apart, is raised to Tier 3 on the third turn
+  with the default RISK_STATE_ESCALATION;
+- cross-worker: two stores on one file stand in for two uvicorn workers; a
+  crisis recorded by one is seen by the other's next turn (floor 2), even
+  after that worker has already read the user's state;
+- atomic updates: concurrent turns for one user through both stores lose
+  no updates.
+"""
+
+import os, sys, tempfile, threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.risk import classify_tier_with_confidence
+from core.risk_state import RISK_STATE_ESCALATION, RiskStateStore
+
+SEQUENCE = [
+    "I feel so overwhelmed with all these exams",
+    "I just feel numb all the time",
+    "Everything feels hopeless",
+]
+
+FAILURES = []
+
+
+def check(ok, what):
+    print(f"{'ok  ' if ok else 'FAIL'} {what}")
+    if not ok:
+        FAILURES.append(what)
+
+
+def turn(store, user, msg, now):
+    tier, _, details = classify_tier_with_confidence(msg)
+    conversation = store.observe(user, tier, details, now=now)
+    return max(tier, conversation["floor"]), tier, conversation
+
+
+def check_escalation(path):
+    store = RiskStateStore(path)
+    now = 1_000_000.0
+    for i, msg in enumerate(SEQUENCE):
+        final, own, conv = turn(store, "seq", msg, now + 60 * i)
+        print(f"     turn {i + 1}: own tier {own}, tier-2 score {conv['scores']['2']}, floor {conv['floor']}")
+        check(own == 2, f"turn {i + 1} classifies as Tier 2 on its own")
+        if i < len(SEQUENCE) - 1:
+            check(final == 2, f"turn {i + 1} is not escalated yet")
+    check(final == 3 and "sustained_distress" in conv["reasons"],
+          f"third turn escalates to Tier 3 (RISK_STATE_ESCALATION={RISK_STATE_ESCALATION})")
+
+
+def check_cross_worker(path):
+    a, b = RiskStateStore(path), RiskStateStore(path)
+    now = 2_000_000.0
+    b.observe("cw", 1, {"tier_scores": {1: 0.3}}, now=now)  # worker B has seen this user
+    a.observe("cw", 3, {"tier_scores": {3: 0.9}}, now=now + 10)
+    conv = b.observe("cw", 1, {"tier_scores": {1: 0.3}}, now=now + 20)
+    check(conv["floor"] == 2 and "recent_crisis" in conv["reasons"],
+          "worker B's next turn keeps the crisis floor recorded by worker A")
+    check(conv["turns"] == 3 and b.get("cw").last_crisis_at == now + 10,
+          "worker B's write keeps worker A's turn and last_crisis_at")
+
+
+def check_concurrent(path, threads=8, turns=25):
+    stores = [RiskStateStore(path), RiskStateStore(path)]
+
+    def run(i):
+        for _ in range(turns):
+            stores[i % 2].observe("cc", 2, {"tier_scores": {2: 0.5}})
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    got = stores[0].get("cc").turns
+    check(got == threads * turns, f"{threads * turns} concurrent turns over two stores, {got} recorded")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as d:
+        check_escalation(os.path.join(d, "seq.sqlite"))
+        check_cross_worker(os.path.join(d, "cw.sqlite"))
+        check_concurrent(os.path.join(d, "cc.sqlite"))
+    print(f"\n{len(FAILURES)} failures")
+    return 1 if FAILURES else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
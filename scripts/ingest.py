@@ -1,36 +1,304 @@
 #scripts/ingest.py
 
-import json, faiss, numpy as np, tiktoken, os, yaml
-from openai import OpenAI
+"""
+Embed data/corpus.jsonl plus the documents referenced from data/sources.yaml
+into a new index version under storage/index/.
+
+    python scripts/ingest.py                  # full rebuild
+    python scripts/ingest.py --incremental    # only embed new / changed chunks
+
+Ingest is a stream: rows are read and chunked lazily (core/documents.py),
+embedded in batches by a bounded pool of workers with retries, and added to
+the index batch by batch, so chunk texts and embeddings are never all held
+in memory at once. Per-chunk state still is, so peak memory grows linearly
+with the number of chunks (not their length), on top of the index itself:
+the set of labels seen so far, one MinHash signature per kept chunk plus its
+LSH buckets (about 1 KB/chunk; --dedup off skips it), the full BM25 postings
+(built after the chunk store is written, from its memory-mapped texts) and,
+with --incremental, the live version's {label: (hash, ns, ...)} table.
+
+Every chunk gets a stable FAISS label (from its id) and a content hash (of its
+text). Vectors are persisted in EMBED_STORE_PATH keyed by (embedding backend,
+content hash), so a full rebuild only pays for texts it has never embedded.
+--incremental starts from the live version's index: removed and changed
+chunks are deleted by label, new and changed ones added (HNSW, which can't
+delete, is rebuilt from the store instead). Index params passed on the
+command line that differ from the live version's (--nlist, --nprobe, --M,
+--ef-search, --pq-m, ...) force a rebuild from the store and a new version.
+"""
+
+import json, faiss, numpy as np, os, sys, yaml, argparse, time, shutil
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from dotenv import load_dotenv
-load_dotenv()  
+load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.embeddings import get_backend, embed_with_store
+from core.cache import SQLiteStore
+from core.bm25 import BM25Index
+from core.ann import INDEX_TYPES, IndexBuilder, default_params, supports_remove, update_index, is_id_mapped
+from core.chunkstore import ChunkStore, ChunkStoreWriter, content_hash, chunk_label
+from core.documents import iter_rows, CHUNK_TOKENS, CHUNK_OVERLAP
+from core.dedup import NearDuplicateFilter
+from core import index_store
+from core.index_store import VEC_FILE, META_FILE, BM25_FILE
 
 CORPUS = "data/corpus.jsonl"
-VEC_PATH = "storage/vectordb.faiss"
-META_PATH = "storage/meta.npy"
 SRC_MAP = "data/sources.yaml"
 
-def embed(texts):
-    # text-embedding-3-small is cheap/good; switch to large if needed
-    resp = client.embeddings.create(model="text-embedding-3-small", input=texts)
-    return np.array([d.embedding for d in resp.data]).astype("float32")
-
-def main():
-    rows, texts = [], []
-    with open(CORPUS, "r", encoding="utf-8") as f:
-        for line in f:
-            r = json.loads(line); rows.append(r); texts.append(r["text"])
-    X = embed(texts)
-    index = faiss.IndexFlatIP(X.shape[1])
-    faiss.normalize_L2(X)
-    index.add(X)
-    os.makedirs("storage", exist_ok=True)
-    faiss.write_index(index, VEC_PATH)
-    np.save(META_PATH, np.array(rows, dtype=object))
-    # copy sources for runtime
-    with open(SRC_MAP,"r",encoding="utf-8") as f: yaml.safe_load(f)  # sanity check
-    print(f"Ingested {len(rows)} chunks.")
+DEDUP_FILE = "dedup.json"  # near-duplicate clusters, next to the index
+
+# EMBED_STORE_PATH: persistent chunk-embedding store ("" disables)
+EMBED_STORE_PATH = os.getenv("EMBED_STORE_PATH", "storage/embed_store.sqlite")
+
+
+def load_previous(backend):
+    """
+    ((dir, meta, {label: (hash, ns, source_id, row)}, ChunkStore), None) for
+    the live version, or (None, reason) when it can't be updated incrementally.
+    """
+    d = index_store.current_dir()
+    meta_path = os.path.join(d, META_FILE)
+    if not (os.path.exists(meta_path) and ChunkStore.exists(d)):
+        return None, "no previous index version"
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if not meta.get("index", {}).get("id_map"):
+        return None, "previous index is not ID-mapped"
+    if meta.get("embedding", {}).get("backend") and meta["embedding"] != backend.signature():
+        return None, "embedding backend changed"
+    chunks = ChunkStore(d)
+    recs = chunks.records
+    prev = {
+        int(lab): (h, ns.decode("utf-8"), src.decode("utf-8"), row)
+        for row, (lab, h, ns, src) in enumerate(zip(chunks.labels, chunks.hashes(), recs["ns"], recs["source_id"]))
+    }
+    return (d, meta, prev, chunks), None
+
+
+def embed_retrying(backend, texts, hashes, store, retries: int, batch_size: int):
+    """embed_with_store with exponential backoff on API errors (rate limits, timeouts)."""
+    for attempt in range(retries + 1):
+        try:
+            return embed_with_store(backend, texts, hashes, store, batch_size)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            wait = min(30.0, 2.0 ** attempt)
+            print(f"  embedding batch failed ({e.__class__.__name__}: {e}); retry {attempt + 1}/{retries} in {wait:.0f}s")
+            time.sleep(wait)
+
+
+def embedded_batches(batches, backend, store, workers: int, retries: int, batch_size: int):
+    """
+    Yield (batch, X) in input order, where X holds the vectors of the batch
+    items with need_vec set. At most 2 * workers batches are in flight, so
+    the reader never runs far ahead of the embedder.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed") as pool:
+        inflight = deque()
+        for batch in batches:
+            todo = [b for b in batch if b["need_vec"]]
+            inflight.append((batch, pool.submit(
+                embed_retrying, backend, [b["row"]["text"] for b in todo], [b["hash"] for b in todo],
+                store, retries, batch_size)))
+            if len(inflight) >= 2 * max(1, workers):
+                batch, fut = inflight.popleft()
+                yield batch, fut.result()
+        while inflight:
+            batch, fut = inflight.popleft()
+            yield batch, fut.result()
+
+
+def batched(it, n):
+    it = iter(it)
+    while True:
+        part = list(islice(it, n))
+        if not part:
+            return
+        yield part
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Embed the corpus and source documents into a FAISS index.")
+    ap.add_argument("--backend", default=None,
+                    help="embedding backend (openai|hashing); defaults to EMBED_BACKEND or openai")
+    ap.add_argument("--index-type", default=None, choices=INDEX_TYPES,
+                    help="FAISS index type (default: flat, or the previous type with --incremental)")
+    ap.add_argument("--nlist", type=int, default=None, help="ivf/ivfpq: number of inverted lists")
+    ap.add_argument("--nprobe", type=int, default=None, help="ivf/ivfpq: lists probed per query")
+    ap.add_argument("--M", type=int, default=None, help="hnsw: graph degree")
+    ap.add_argument("--ef-construction", type=int, default=None, help="hnsw: build-time beam width")
+    ap.add_argument("--ef-search", type=int, default=None, help="hnsw: query-time beam width")
+    ap.add_argument("--pq-m", type=int, default=None, help="pq/ivfpq: sub-quantizers (must divide dim)")
+    ap.add_argument("--pq-nbits", type=int, default=None, help="pq/ivfpq: bits per sub-quantizer")
+    ap.add_argument("--train-size", type=int, default=20000,
+                    help="ivf/pq/ivfpq: vectors buffered to train on before streaming the rest")
+    ap.add_argument("--keep", type=int, default=3,
+                    help="index versions to keep under storage/index/ (older ones are deleted)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="update the live version: embed only new/changed chunks, delete removed ones")
+    ap.add_argument("--batch-size", type=int, default=256, help="texts per embeddings request")
+    ap.add_argument("--workers", type=int, default=4, help="concurrent embeddings requests")
+    ap.add_argument("--retries", type=int, default=5, help="retries per failed embeddings request")
+    ap.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="max tokens per document chunk")
+    ap.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="tokens shared by neighbouring chunks")
+    ap.add_argument("--dedup", default="drop", choices=("drop", "report", "off"),
+                    help="near-duplicate chunks (MinHash/LSH): drop them, only report them, or skip detection")
+    ap.add_argument("--dedup-threshold", type=float, default=0.85,
+                    help="estimated Jaccard similarity of word 3-grams at which chunks count as duplicates")
+    args = ap.parse_args(argv)
+
+    backend = get_backend(args.backend)
+    store = SQLiteStore(EMBED_STORE_PATH, table="chunk_embeddings") if EMBED_STORE_PATH else None
+
+    prev, why_full = (None, "full rebuild requested")
+    if args.incremental:
+        prev, why_full = load_previous(backend)
+        if prev is not None and args.index_type and args.index_type != prev[1]["index"]["type"]:
+            prev, why_full = None, "index type changed"
+    index_type = args.index_type or (prev[1]["index"]["type"] if prev else "flat")
+    old = prev[2] if prev else {}
+
+    # index params from the command line; flags that don't apply to the type are reported
+    flags = {"nlist": "--nlist", "nprobe": "--nprobe", "M": "--M", "efConstruction": "--ef-construction",
+             "efSearch": "--ef-search", "m": "--pq-m", "nbits": "--pq-nbits"}
+    requested = {k: v for k, v in {
+        "nlist": args.nlist, "nprobe": args.nprobe, "M": args.M,
+        "efConstruction": args.ef_construction, "efSearch": args.ef_search,
+        "m": args.pq_m, "nbits": args.pq_nbits,
+    }.items() if v is not None}
+    applicable = set(default_params(index_type, 1000, 64))
+    ignored = sorted(flags[k] for k in requested if k not in applicable)
+    if ignored:
+        print(f"Ignoring {', '.join(ignored)}: not a parameter of {index_type} indexes")
+    requested = {k: v for k, v in requested.items() if k in applicable}
+    # params that differ from the live version's need a rebuild (and a new version)
+    params_changed = {k: (prev[1]["index"]["params"].get(k), v) for k, v in requested.items()
+                      if prev and prev[1]["index"]["params"].get(k) != v}
+    # in-place updates copy unchanged vectors from the live version's chunk store
+    in_place = (bool(prev) and not params_changed and supports_remove(index_type)
+                and prev[3].vectors is not None)
+    if params_changed:
+        why_full = "index params changed (" + ", ".join(
+            f"{k}: {a} -> {b}" for k, (a, b) in params_changed.items()) + ")"
+        print(f"Rebuilding instead of updating in place: {why_full}")
+
+    t0 = time.perf_counter()
+    if in_place:
+        index = faiss.read_index(os.path.join(prev[0], VEC_FILE))
+        if not is_id_mapped(index):
+            raise SystemExit("Previous index is not ID-mapped; run a full ingest first")
+        builder, params, mode = None, prev[1]["index"]["params"], "incremental"
+    else:
+        # full build; unchanged texts come out of the embedding store
+        base = prev[1]["index"]["params"] if prev else {}
+        builder = IndexBuilder(index_type, {**base, **requested}, train_size=args.train_size)
+        index, params, mode = None, None, "rebuild" if prev else "full"
+
+    # everything goes into a fresh version dir that is published atomically
+    version = index_store.new_version_name()
+    out = index_store.staging_dir(version)
+    try:
+        writer = ChunkStoreWriter(out)  # chunks.npy + chunks.bin, text streamed to disk
+        seen = set()
+        namespaces = Counter()
+        added = changed = relabelled = embedded = 0
+
+        def items(rows):
+            # label / hash / diff against the live version, one row at a time
+            nonlocal added, changed, relabelled
+            for r in rows:
+                label = chunk_label(r["id"])
+                if label in seen:
+                    raise SystemExit(f"Duplicate chunk id (or label collision): {r['id']!r}")
+                seen.add(label)
+                h = content_hash(r["text"])
+                before = old.get(label)
+                if before is None:
+                    added += 1
+                elif before[0] != h:
+                    changed += 1
+                elif before[1:3] != (r.get("ns", ""), r.get("source_id", "")):
+                    relabelled += 1
+                yield {"row": r, "label": label, "hash": h, "was": before,
+                       "need_vec": not in_place or before is None or before[0] != h}
+
+        rows = iter_rows(CORPUS, SRC_MAP, max_tokens=args.chunk_tokens, overlap=args.chunk_overlap)
+        dedup = NearDuplicateFilter(args.dedup_threshold, mode=args.dedup) if args.dedup != "off" else None
+        if dedup is not None:
+            rows = dedup(rows)  # first chunk of a near-duplicate cluster wins
+        for batch, (X, n_new) in embedded_batches(batched(items(rows), args.batch_size), backend, store,
+                                                  args.workers, args.retries, args.batch_size):
+            embedded += n_new
+            ids = np.array([b["label"] for b in batch if b["need_vec"]], dtype="int64")
+            if in_place:
+                stale = np.array([b["label"] for b in batch if b["need_vec"] and b["was"] is not None], dtype="int64")
+                update_index(index, stale, X, ids)
+            else:
+                builder.add(X, ids)
+            fresh = iter(X)
+            for b in batch:
+                # vectors.f32 for query-time MMR: fresh embedding or the live version's copy
+                vec = next(fresh) if b["need_vec"] else prev[3].vectors[b["was"][3]]
+                writer.add(b["row"], b["label"], vec)
+                namespaces[b["row"].get("ns", "")] += 1
+        count = writer.close()
+
+        removed = [l for l in old if l not in seen]
+        if prev and not (added or changed or removed or relabelled or params_changed):
+            shutil.rmtree(out, ignore_errors=True)
+            print(f"No changes since {prev[1].get('version')}; nothing to publish.")
+            return
+        if in_place:
+            update_index(index, np.array(removed, dtype="int64"), np.zeros((0, index.d), "float32"), [])
+        else:
+            index, params = builder.finish()
+        index_s = time.perf_counter() - t0
+
+        faiss.write_index(index, os.path.join(out, VEC_FILE))
+        chunks = ChunkStore(out)
+        bm25 = BM25Index.build(chunks.iter_texts())  # texts come back from the mmapped blob
+        chunks.close()
+        bm25.save(os.path.join(out, BM25_FILE))
+        if dedup is not None:
+            with open(os.path.join(out, DEDUP_FILE), "w", encoding="utf-8") as f:
+                json.dump(dedup.report(), f, indent=2)
+        changes = {"added": added, "changed": changed, "removed": len(removed),
+                   "relabelled": relabelled, "embedded": embedded}
+        with open(os.path.join(out, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": version,
+                "previous": prev[1].get("version") if prev else None,
+                "embedding": backend.signature(),
+                "count": count,
+                "namespaces": dict(sorted(namespaces.items())),
+                "index": {"type": index_type, "params": params, "id_map": True},
+                "lexical": {"type": "bm25", "k1": bm25.k1, "b": bm25.b, "terms": len(bm25.terms)},
+                "chunking": {"tokens": args.chunk_tokens, "overlap": args.chunk_overlap},
+                "ingest": {"mode": mode, **changes},
+                "dedup": {k: v for k, v in dedup.report().items() if k != "clusters"} if dedup else None,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }, f, indent=2)
+        # copy sources for runtime
+        with open(SRC_MAP,"r",encoding="utf-8") as f: yaml.safe_load(f)  # sanity check
+    except BaseException:
+        shutil.rmtree(out, ignore_errors=True)
+        raise
+    index_store.publish(version)
+    removed_versions = index_store.gc_versions(keep=args.keep)
+    print(f"Ingested {count} chunks with {backend.name} embeddings (dim={index.d}) "
+          f"into a {index_type} index {params} [{mode}{'' if (prev and not params_changed) or not args.incremental else ': ' + why_full}].")
+    print(f"  added={added} changed={changed} removed={len(removed)} relabelled={relabelled} "
+          f"embedded={embedded} reused={count - embedded} seconds={index_s:.2f}")
+    if dedup is not None and dedup.clusters:
+        print(f"  near-duplicates ({args.dedup}, jaccard>={args.dedup_threshold}): "
+              f"{sum(len(v) for v in dedup.clusters.values())} in {len(dedup.clusters)} clusters, see {DEDUP_FILE}")
+        for kept, dups in sorted(dedup.clusters.items(), key=lambda kv: -len(kv[1]))[:5]:
+            print(f"    {kept} <- " + ", ".join(f"{i} ({s:.2f})" for i, s in dups[:4]) + (" ..." if len(dups) > 4 else ""))
+    print(f"Published {version}" + (f"; removed {', '.join(removed_versions)}" if removed_versions else "")
+          + ". Running workers pick it up via POST /admin/reload-index or INDEX_WATCH_SECS.")
 
 if __name__ == "__main__": main()
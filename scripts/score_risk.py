@@ -0,0 +1,129 @@
+#scripts/score_risk.py
+
+"""
+Re-score messages with core.risk offline.
+
+    python scripts/score_risk.py --db storage/audit_log.sqlite --out rescored.jsonl
+    python scripts/score_risk.py --jsonl messages.jsonl --out scored.jsonl --workers 8
+    python scripts/score_risk.py --db --no-moderation --changed-only
+
+Input is the audit log (chats table) or a JSONL file whose lines carry the
+message in "message", "text" or "user_msg" (plus an optional "id"). Messages
+are streamed in chunks of --chunk-size to a process pool; each worker runs
+risk.classify_many() on its chunk (pattern engine, then batched moderation
+requests). Output lines are {"id", "message", "tier", "confidence",
+"details"} in input order, plus "previous_tier" for audit-log rows.
+--no-moderation scores with the patterns only (MODERATION_BACKEND=local
+also works without network).
+"""
+
+import argparse, json, os, sqlite3, sys, time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_PATH = "storage/audit_log.sqlite"
+MESSAGE_FIELDS = ("message", "text", "user_msg")
+
+
+def iter_db(path):
+    con = sqlite3.connect(path)
+    try:
+        for rid, msg, tier in con.execute("SELECT id, user_msg, tier FROM chats WHERE user_msg IS NOT NULL ORDER BY id"):
+            yield {"id": rid, "message": msg, "previous_tier": tier}
+    finally:
+        con.close()
+
+
+def iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            msg = next((d[k] for k in MESSAGE_FIELDS if d.get(k) is not None), None)
+            if msg is None:
+                raise SystemExit(f"{path}:{n + 1}: no {'/'.join(MESSAGE_FIELDS)} field")
+            row = {"id": d.get("id", n), "message": msg}
+            if "tier" in d:
+                row["previous_tier"] = d["tier"]
+            yield row
+
+
+def chunks(it, n):
+    it = iter(it)
+    while True:
+        part = list(islice(it, n))
+        if not part:
+            return
+        yield part
+
+
+def scored_chunks(pool, rows, chunk_size, workers):
+    """Yield scored chunks in input order with at most 2 * workers in flight."""
+    inflight = deque()
+    for part in chunks(rows, chunk_size):
+        inflight.append(pool.submit(score_chunk, part))
+        if len(inflight) >= 2 * workers:
+            yield inflight.popleft().result()
+    while inflight:
+        yield inflight.popleft().result()
+
+
+def _init_worker(moderation: bool):
+    from core import risk
+    risk.USE_LLM_MOD = moderation
+
+
+def score_chunk(rows):
+    from core.risk import classify_many
+    results = classify_many([r["message"] for r in rows])
+    return [{**r, "tier": tier, "confidence": conf, "details": details}
+            for r, (tier, conf, details) in zip(rows, results)]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Batch risk classification of a JSONL file or the audit log.")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--db", nargs="?", const=DB_PATH, help=f"audit log to re-score (chats.user_msg; default {DB_PATH})")
+    src.add_argument("--jsonl", help="JSONL with a message/text/user_msg field per line")
+    ap.add_argument("--out", default="-", help="output JSONL ('-' = stdout)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="scoring processes")
+    ap.add_argument("--chunk-size", type=int, default=256, help="messages per classify_many() call")
+    ap.add_argument("--no-moderation", action="store_true", help="pattern engine only")
+    ap.add_argument("--changed-only", action="store_true", help="only write rows whose tier differs from previous_tier")
+    args = ap.parse_args(argv)
+
+    rows = iter_db(args.db) if args.db else iter_jsonl(args.jsonl)
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    n = 0
+    tiers, moved, statuses = Counter(), Counter(), Counter()
+    t0 = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker,
+                                 initargs=(not args.no_moderation,)) as pool:
+            for scored in scored_chunks(pool, rows, args.chunk_size, max(1, args.workers)):
+                for r in scored:
+                    n += 1
+                    tiers[r["tier"]] += 1
+                    statuses[r["details"]["moderation"]["status"]] += 1
+                    prev = r.get("previous_tier")
+                    if prev is not None and prev != r["tier"]:
+                        moved[f"{prev}->{r['tier']}"] += 1
+                    elif args.changed_only:
+                        continue
+                    out.write(json.dumps(r, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    secs = time.perf_counter() - t0
+    print(f"Scored {n} messages in {secs:.2f}s ({n / secs if secs else 0:.0f}/s) with {args.workers} workers; "
+          f"tiers {dict(sorted(tiers.items()))}; moderation {dict(statuses)}", file=sys.stderr)
+    if moved:
+        print(f"  tier changes vs previous: {dict(moved.most_common())}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#scripts/train_moderation.py
+
+"""
+Train the local moderation model (core/moderation.py, MODERATION_BACKEND=local)
+from labelled chats in the audit log.
+
+    python scripts/train_moderation.py
+    python scripts/train_moderation.py --extra data/moderation_seed.jsonl --epochs 30
+
+Targets come from the reviewer's crisis judgment in the HITL review console
+(POST /reviews/{id} with "crisis": true|false, the chats.crisis column):
+1 is a crisis example, 0 is not, rows never judged are skipped. The review
+`label` (safe / unsafe / low_empathy / hallucination) grades the assistant's
+reply and the `tier` column is the classifier's own output, so neither is
+used as a target. --extra adds JSONL lines {"text": "...", "label": 0|1}.
+
+A stratified --holdout is scored before the final model is trained on
+everything; precision/recall at the threshold and per-message latency are
+printed. The model is written to LOCAL_MODERATION_MODEL.
+"""
+
+import argparse, json, os, sqlite3, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.moderation import LocalModeration, LOCAL_MODERATION_MODEL
+
+DB_PATH = "storage/audit_log.sqlite"
+
+
+def audit_examples(db_path):
+    con = sqlite3.connect(db_path)
+    cols = {r[1] for r in con.execute("PRAGMA table_info(chats);")}
+    if "crisis" not in cols:
+        con.close()
+        return []
+    rows = con.execute(
+        "SELECT user_msg, crisis FROM chats WHERE user_msg IS NOT NULL AND crisis IS NOT NULL"
+    ).fetchall()
+    con.close()
+    return [(msg, 1 if crisis else 0) for msg, crisis in rows]
+
+
+def jsonl_examples(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [(d["text"], int(d["label"])) for d in map(json.loads, filter(str.strip, f))]
+
+
+def evaluate(model, texts, labels):
+    pred = np.array([f for f, _ in model.moderate_many(texts)])
+    y = np.array(labels, dtype=bool)
+    tp, fp, fn = int((pred & y).sum()), int((pred & ~y).sum()), int((~pred & y).sum())
+    return {
+        "n": len(y),
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "accuracy": float((pred == y).mean()) if len(y) else 0.0,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Train the local moderation model from audit-log labels.")
+    ap.add_argument("--db", default=DB_PATH, help="audit log (chats table, crisis column)")
+    ap.add_argument("--no-db", action="store_true", help="train on --extra data only")
+    ap.add_argument("--extra", action="append", default=[], help="JSONL of {text, label} (repeatable)")
+    ap.add_argument("--out", default=LOCAL_MODERATION_MODEL, help="model path")
+    ap.add_argument("--dim", type=int, default=1 << 18, help="hashed feature space size")
+    ap.add_argument("--epochs", type=int, default=20)
+    ap.add_argument("--lr", type=float, default=0.5)
+    ap.add_argument("--l2", type=float, default=1e-5)
+    ap.add_argument("--threshold", type=float, default=0.5, help="score at or above which a message is flagged")
+    ap.add_argument("--holdout", type=float, default=0.2, help="fraction held out for the evaluation run")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    data = audit_examples(args.db) if not args.no_db and os.path.exists(args.db) else []
+    n_audit = len(data)
+    for path in args.extra:
+        data += jsonl_examples(path)
+    texts = [t for t, _ in data]
+    labels = [y for _, y in data]
+    n_pos = sum(labels)
+    print(f"{len(data)} examples ({n_audit} from {args.db}), {n_pos} positive / {len(data) - n_pos} negative")
+    if not n_pos or n_pos == len(data):
+        raise SystemExit("Need both positive and negative examples; mark chats crisis true/false "
+                         "in the review console or pass --extra")
+
+    kw = dict(dim=args.dim, epochs=args.epochs, lr=args.lr, l2=args.l2, threshold=args.threshold, seed=args.seed)
+    if args.holdout > 0:
+        rng = np.random.default_rng(args.seed)
+        test = set()
+        for cls in (0, 1):
+            idx = [i for i, y in enumerate(labels) if y == cls]
+            rng.shuffle(idx)
+            test.update(idx[:int(len(idx) * args.holdout)])
+        train = [i for i in range(len(data)) if i not in test]
+        if test and len({labels[i] for i in train}) == 2:
+            m = LocalModeration.train([texts[i] for i in train], [labels[i] for i in train], **kw)
+            ev = evaluate(m, [texts[i] for i in sorted(test)], [labels[i] for i in sorted(test)])
+            print(f"holdout: n={ev['n']} precision={ev['precision']:.3f} recall={ev['recall']:.3f} "
+                  f"accuracy={ev['accuracy']:.3f} (threshold {args.threshold})")
+
+    t0 = time.perf_counter()
+    model = LocalModeration.train(texts, labels, **kw)
+    train_s = time.perf_counter() - t0
+    model.meta = {
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "examples": len(data), "positive": n_pos,
+        "sources": (["audit:crisis"] if n_audit else []) + list(args.extra),
+        "epochs": args.epochs, "lr": args.lr, "l2": args.l2,
+    }
+    model.save(args.out)
+
+    sample = texts[:200]
+    t0 = time.perf_counter()
+    model.moderate_many(sample)
+    us = (time.perf_counter() - t0) / max(1, len(sample)) * 1e6
+    print(f"Trained in {train_s:.2f}s; {us:.0f} us/message; wrote {args.out}. "
+          "Use it with MODERATION_BACKEND=local (or as the API fallback).")
+
+
+if __name__ == "__main__":
+    main()